@@ -1,9 +1,9 @@
 from logging.config import fileConfig
 
 from alembic import context
-from sqlmodel import SQLModel
+from sqlmodel import SQLModel, create_engine
 import lingominer.models  # noqa
-from lingominer.database import engine
+from lingominer.database import database_url
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -54,6 +54,8 @@ def run_migrations_online() -> None:
 
     """
 
+    # migrations run synchronously, the api engine is async
+    engine = create_engine(database_url())
     with engine.connect() as connection:
         context.configure(connection=connection, target_metadata=target_metadata)
 
@@ -0,0 +1,38 @@
+"""card listing indexes
+
+Revision ID: 13e6c7ab1fe6
+Revises: be34c8685057
+Create Date: 2026-10-19 16:48:52.031577
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+import pgvector.sqlalchemy
+
+
+# revision identifiers, used by Alembic.
+revision: str = '13e6c7ab1fe6'
+down_revision: Union[str, None] = 'be34c8685057'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_card_user_id_created_at_id', 'card', ['user_id', 'created_at', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_card_user_id_template_id_created_at_id', 'card', ['user_id', 'template_id', 'created_at', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_card_user_id_status_created_at_id', 'card', ['user_id', 'status', 'created_at', 'id'], unique=False, postgresql_concurrently=True)
+    # covered by ix_card_user_id_created_at_id
+    op.drop_index('ix_card_user_id', table_name='card')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_card_user_id', 'card', ['user_id'], unique=False)
+    op.drop_index('ix_card_user_id_status_created_at_id', table_name='card')
+    op.drop_index('ix_card_user_id_template_id_created_at_id', table_name='card')
+    op.drop_index('ix_card_user_id_created_at_id', table_name='card')
@@ -0,0 +1,34 @@
+"""card embedding index
+
+Revision ID: 35daf7a896ed
+Revises: c313d18993ab
+Create Date: 2026-10-19 13:40:05.220871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+import pgvector.sqlalchemy
+
+
+# revision identifiers, used by Alembic.
+revision: str = '35daf7a896ed'
+down_revision: Union[str, None] = 'c313d18993ab'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # built concurrently, cards can still be written while it builds
+    with op.get_context().autocommit_block():
+        op.create_index('ix_card_user_id', 'card', ['user_id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_card_embedding_hnsw', 'card', ['embedding'], unique=False, postgresql_using='hnsw', postgresql_with={'m': 16, 'ef_construction': 64}, postgresql_ops={'embedding': 'vector_cosine_ops'}, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_card_embedding_hnsw', table_name='card', postgresql_using='hnsw', postgresql_with={'m': 16, 'ef_construction': 64}, postgresql_ops={'embedding': 'vector_cosine_ops'})
+    op.drop_index('ix_card_user_id', table_name='card')
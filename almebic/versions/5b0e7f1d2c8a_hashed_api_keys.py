@@ -0,0 +1,61 @@
+"""hashed api keys
+
+Revision ID: 5b0e7f1d2c8a
+Revises: 13e6c7ab1fe6
+Create Date: 2026-10-19 18:02:41.118034
+
+"""
+import hashlib
+import hmac
+import os
+from typing import Sequence, Union
+
+from alembic import op
+from sqlalchemy import text
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b0e7f1d2c8a'
+down_revision: Union[str, None] = '13e6c7ab1fe6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def api_key_hash(key: str) -> str:
+    # copy of lingominer.api.auth.security.api_key_hash at this revision
+    secret = os.environ['LINGOMINER_API_KEY_SECRET']
+    return hmac.new(secret.encode(), key.encode(), hashlib.sha256).hexdigest()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('apikey', sa.Column('key_prefix', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    op.add_column('apikey', sa.Column('key_hash', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+
+    # backfill existing keys, hashed with LINGOMINER_API_KEY_SECRET
+    connection = op.get_bind()
+    rows = connection.execute(text('SELECT id, key FROM apikey')).all()
+    if rows:
+        connection.execute(
+            text('UPDATE apikey SET key_prefix = :key_prefix, key_hash = :key_hash WHERE id = :id'),
+            [{'id': row.id, 'key_prefix': row.key[:7], 'key_hash': api_key_hash(row.key)} for row in rows],
+        )
+
+    op.alter_column('apikey', 'key_prefix', nullable=False)
+    op.alter_column('apikey', 'key_hash', nullable=False)
+    op.create_index(op.f('ix_apikey_key_hash'), 'apikey', ['key_hash'], unique=True)
+    op.drop_column('apikey', 'key')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # the plaintext keys are gone, existing keys stop working
+    op.add_column('apikey', sa.Column('key', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    op.execute('UPDATE apikey SET key = key_hash')
+    op.alter_column('apikey', 'key', nullable=False)
+    op.create_unique_constraint('apikey_key_key', 'apikey', ['key'])
+    op.drop_index(op.f('ix_apikey_key_hash'), table_name='apikey')
+    op.drop_column('apikey', 'key_hash')
+    op.drop_column('apikey', 'key_prefix')
@@ -0,0 +1,61 @@
+"""passage paragraph offsets
+
+Revision ID: a6f3b8d90e12
+Revises: 7d41c2e9a3f0
+Create Date: 2026-10-19 19:27:55.804311
+
+"""
+import json
+import re
+from typing import Sequence, Union
+
+from alembic import op
+from sqlalchemy import text
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6f3b8d90e12'
+down_revision: Union[str, None] = '7d41c2e9a3f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def paragraph_offsets(content: str) -> list[list[int]]:
+    # copy of lingominer.models.passage.paragraph_offsets at this revision
+    offsets = []
+    for match in re.finditer(r'(?:[^\n]*\S[^\n]*(?:\n|$))+', content):
+        paragraph = match.group()
+        start = match.start() + len(paragraph) - len(paragraph.lstrip())
+        offsets.append([start, match.start() + len(paragraph.rstrip())])
+    return offsets
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('passage', sa.Column('paragraph_offsets', sa.JSON(), nullable=True))
+
+    # backfill existing passages, the paragraphs are split in python
+    connection = op.get_bind()
+    last_id = ''
+    while True:
+        rows = connection.execute(
+            text('SELECT id, content FROM passage WHERE id > :last_id ORDER BY id LIMIT 500'),
+            {'last_id': last_id},
+        ).all()
+        if not rows:
+            break
+        connection.execute(
+            text('UPDATE passage SET paragraph_offsets = CAST(:offsets AS json) WHERE id = :id'),
+            [{'id': row.id, 'offsets': json.dumps(paragraph_offsets(row.content))} for row in rows],
+        )
+        last_id = rows[-1].id
+
+    op.alter_column('passage', 'paragraph_offsets', nullable=False)
+    op.create_index('ix_note_passage_id_paragraph_index', 'note', ['passage_id', 'paragraph_index'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_note_passage_id_paragraph_index', table_name='note')
+    op.drop_column('passage', 'paragraph_offsets')
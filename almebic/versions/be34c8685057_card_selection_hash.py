@@ -0,0 +1,60 @@
+"""card selection hash
+
+Revision ID: be34c8685057
+Revises: 35daf7a896ed
+Create Date: 2026-10-19 15:21:13.664230
+
+"""
+import hashlib
+import re
+import unicodedata
+from typing import Sequence, Union
+
+from alembic import op
+from sqlalchemy import text
+import sqlalchemy as sa
+import sqlmodel
+import pgvector.sqlalchemy
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'be34c8685057'
+down_revision: Union[str, None] = '35daf7a896ed'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def selection_hash(paragraph: str, pos_start: int, pos_end: int) -> str:
+    # copy of lingominer.models.card.selection_hash at this revision
+    selection = unicodedata.normalize('NFKC', paragraph[pos_start:pos_end])
+    selection = re.sub(r'\s+', ' ', selection).strip().casefold()
+    return hashlib.sha256(selection.encode()).hexdigest()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('card', sa.Column('selection_hash', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+
+    # backfill existing cards, the normalization is done in python
+    connection = op.get_bind()
+    last_id = ''
+    while True:
+        rows = connection.execute(
+            text('SELECT id, paragraph, pos_start, pos_end FROM card WHERE id > :last_id ORDER BY id LIMIT 1000'),
+            {'last_id': last_id},
+        ).all()
+        if not rows:
+            break
+        connection.execute(
+            text('UPDATE card SET selection_hash = :selection_hash WHERE id = :id'),
+            [{'id': row.id, 'selection_hash': selection_hash(row.paragraph, row.pos_start, row.pos_end)} for row in rows],
+        )
+        last_id = rows[-1].id
+
+    op.create_index('ix_card_user_id_template_id_selection_hash', 'card', ['user_id', 'template_id', 'selection_hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_card_user_id_template_id_selection_hash', table_name='card')
+    op.drop_column('card', 'selection_hash')
@@ -0,0 +1,32 @@
+"""card import id
+
+Revision ID: f2c9d4e7b1a3
+Revises: a6f3b8d90e12
+Create Date: 2026-10-19 21:12:40.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c9d4e7b1a3'
+down_revision: Union[str, None] = 'a6f3b8d90e12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('card', sa.Column('import_id', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_card_import_id'), 'card', ['import_id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_card_import_id'), table_name='card')
+    op.drop_column('card', 'import_id')
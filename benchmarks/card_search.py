@@ -0,0 +1,125 @@
+"""
+Benchmark of the card similarity search on a synthetic table.
+
+Fills `bench_card` (same shape as the indexed part of `card`) with random
+embeddings spread over many users, builds the same HNSW index as the
+`35daf7a896ed` migration, then compares exact search with the index for a
+few `hnsw.ef_search` values, reporting latency and recall@k.
+
+    python benchmarks/card_search.py --rows 1000000 --users 1000
+"""
+
+import argparse
+import statistics
+import time
+
+import psycopg
+
+from lingominer.config import config
+
+
+def connect() -> psycopg.Connection:
+    return psycopg.connect(
+        host=config.database_host,
+        port=config.database_port,
+        user=config.database_user,
+        password=config.database_password,
+        dbname=config.database_db,
+        autocommit=True,
+    )
+
+
+def setup(conn: psycopg.Connection, rows: int, users: int, dims: int):
+    conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    conn.execute("DROP TABLE IF EXISTS bench_card")
+    conn.execute(
+        f"CREATE TABLE bench_card (id bigint PRIMARY KEY, user_id int NOT NULL, embedding vector({dims}))"
+    )
+    started = time.perf_counter()
+    # generated server side, in chunks to keep transactions small
+    chunk = 50_000
+    for offset in range(0, rows, chunk):
+        conn.execute(
+            f"""
+            INSERT INTO bench_card
+            SELECT i, i % %(users)s,
+                   ARRAY(SELECT random() - 0.5 FROM generate_series(1, {dims}) WHERE i > 0)::vector
+            FROM generate_series(%(start)s, %(stop)s) AS i
+            """,
+            {"users": users, "start": offset + 1, "stop": min(offset + chunk, rows)},
+        )
+    print(f"inserted {rows} rows in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    conn.execute("CREATE INDEX ON bench_card (user_id)")
+    conn.execute("SET maintenance_work_mem = '2GB'")
+    conn.execute(
+        "CREATE INDEX ON bench_card USING hnsw (embedding vector_cosine_ops) "
+        "WITH (m = 16, ef_construction = 64)"
+    )
+    conn.execute("ANALYZE bench_card")
+    print(f"built indexes in {time.perf_counter() - started:.1f}s")
+
+
+def search(
+    conn: psycopg.Connection, query: str, user_id: int, k: int, exact: bool
+) -> tuple[list[int], float]:
+    with conn.transaction():
+        if exact:
+            conn.execute("SET LOCAL enable_indexscan = off")
+        started = time.perf_counter()
+        rows = conn.execute(
+            "SELECT id FROM bench_card WHERE user_id = %s "
+            "ORDER BY embedding <=> %s::vector LIMIT %s",
+            (user_id, query, k),
+        ).fetchall()
+        return [row[0] for row in rows], time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--dims", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[40, 100, 200])
+    parser.add_argument("--skip-setup", action="store_true")
+    args = parser.parse_args()
+
+    with connect() as conn:
+        if not args.skip_setup:
+            setup(conn, args.rows, args.users, args.dims)
+        queries = [
+            row[0]
+            for row in conn.execute(
+                "SELECT embedding::text FROM bench_card ORDER BY random() LIMIT %s",
+                (args.queries,),
+            )
+        ]
+        users = [i % args.users for i in range(args.queries)]
+
+        truth, exact_times = [], []
+        for query, user_id in zip(queries, users):
+            ids, elapsed = search(conn, query, user_id, args.k, exact=True)
+            truth.append(set(ids))
+            exact_times.append(elapsed)
+        print(f"exact        p50 {statistics.median(exact_times) * 1000:8.2f}ms")
+
+        conn.execute("SET hnsw.iterative_scan = relaxed_order")
+        for ef_search in args.ef_search:
+            conn.execute(f"SET hnsw.ef_search = {ef_search}")
+            times, recalls = [], []
+            for query, user_id, expected in zip(queries, users, truth):
+                ids, elapsed = search(conn, query, user_id, args.k, exact=False)
+                times.append(elapsed)
+                recalls.append(len(expected & set(ids)) / max(len(expected), 1))
+            print(
+                f"ef_search {ef_search:<4} p50 {statistics.median(times) * 1000:8.2f}ms"
+                f"  p95 {statistics.quantiles(times, n=20)[-1] * 1000:8.2f}ms"
+                f"  recall@{args.k} {statistics.mean(recalls):.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -16,7 +16,7 @@ class UserDetail(SQLModel):
 
 class ApiKeyDetail(SQLModel):
     id: str
-    key: str
+    key_prefix: str
 
     created_at: datetime
     modified_at: datetime
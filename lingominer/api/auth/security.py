@@ -1,25 +1,58 @@
+import hashlib
+import hmac
 from typing import Annotated
 
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from lingominer.cache import TTLCache
 from lingominer.database import get_db_session
-from sqlmodel import Session, select
-from lingominer.models.user import User
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from lingominer.models.user import ApiKey, User
 from lingominer.config import config
 from lingominer.ctx import user_id
 
 auth_scheme = HTTPBearer()
 
+# hash of an api key -> detached copy of its user
+_users: TTLCache[str, User] = TTLCache(config.auth_cache_ttl, config.auth_cache_size)
+
+
+def api_key_hash(key: str) -> str:
+    """Keyed hash stored in place of the api key, a leaked table is useless."""
+    return hmac.new(
+        config.api_key_secret.encode(), key.encode(), hashlib.sha256
+    ).hexdigest()
+
+
+def forget_api_key(key_hash: str):
+    _users.pop(key_hash)
+
+
+def forget_user(user_id: str):
+    """Drop the cached keys of a user, e.g. after the user changed."""
+    _users.pop_where(lambda user: user.id == user_id)
+
 
 async def get_current_user(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
 ) -> User:
-    user = db_session.exec(
-        select(User).where(User.api_keys.any(key=credentials.credentials))
-    ).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid credentials")
+    key_hash = api_key_hash(credentials.credentials)
+    user = _users.get(key_hash)
+    if user is None:
+        user = (
+            await db_session.exec(
+                select(User)
+                .join(ApiKey, ApiKey.user_id == User.id)
+                .where(ApiKey.key_hash == key_hash)
+            )
+        ).first()
+        if not user:
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+        # not bound to any session, so it can be shared between requests
+        user = User(**user.model_dump())
+        _users.set(key_hash, user)
     user_id.set(user.id)
     return user
 
@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends
-from sqlmodel import Session, select
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import Annotated
 
-from lingominer.api.auth.security import get_current_user
+from lingominer.api.auth.security import forget_user, get_current_user
 from lingominer.database import get_db_session
 from lingominer.models.user import User
 from lingominer.ctx import user_id
@@ -13,18 +15,32 @@ router = APIRouter(dependencies=[Depends(get_current_user)])
 
 @router.get("", response_model=UserDetail)
 async def get_me(
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     user: User = Depends(get_current_user),
 ):
-    return user
+    return (
+        await db_session.exec(
+            select(User)
+            .where(User.id == user.id)
+            .options(selectinload(User.api_keys))
+        )
+    ).one()
 
 
 @router.patch("/settings", response_model=UserDetail)
 async def update_settings(
     settings: SettingsUpdate,
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
 ):
-    user = db_session.exec(select(User).where(User.id == user_id.get())).first()
+    user = (
+        await db_session.exec(
+            select(User)
+            .where(User.id == user_id.get())
+            .options(selectinload(User.api_keys))
+        )
+    ).first()
     if settings.mochi_api_key:
         user.mochi_api_key = settings.mochi_api_key
-    db_session.commit()
+    await db_session.commit()
+    forget_user(user.id)
     return user
@@ -0,0 +1,191 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import String, cast, column, func, values
+from sqlmodel import select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from lingominer.api.cards.schema import CardCreate
+from lingominer.config import config
+from lingominer.database import new_session
+from lingominer.logger import logger
+from lingominer.models.card import Card
+from lingominer.services.embedding import embed_texts
+
+
+def card_embedding_text(card: Card | CardCreate) -> str:
+    """The selection first, then the paragraph it was mined from."""
+    return f"{card.paragraph[card.pos_start : card.pos_end]}\n{card.paragraph}"
+
+
+async def write_embeddings(
+    db_session: AsyncSession, card_ids: list[str], vectors: list[list[float]]
+):
+    """Store many embeddings with a single `UPDATE ... FROM (VALUES ...)`."""
+    if not card_ids:
+        return
+    rows = values(
+        column("id", String),
+        column("embedding", String),
+        name="embeddings",
+    ).data([(card_id, str(vector)) for card_id, vector in zip(card_ids, vectors)])
+    await db_session.exec(
+        update(Card)
+        .where(Card.id == rows.c.id)
+        .values(embedding=cast(rows.c.embedding, Vector(config.embedding_dimensions)))
+        .execution_options(synchronize_session=False)
+    )
+    await db_session.commit()
+
+
+async def embed_cards(db_session: AsyncSession, cards: list[tuple[str, str]]):
+    """Embed `(card id, text)` pairs with one request and one update."""
+    vectors = await embed_texts([text for _, text in cards])
+    await write_embeddings(db_session, [card_id for card_id, _ in cards], vectors)
+
+
+async def search_cards(
+    db_session: AsyncSession,
+    vector: list[float],
+    owner_id: str,
+    limit: int = 10,
+    ef_search: Optional[int] = None,
+    template_id: Optional[str] = None,
+    max_distance: Optional[float] = None,
+) -> list[tuple[Card, float]]:
+    """Cards of `owner_id` closest to `vector` by cosine distance."""
+    # transaction-local settings of the hnsw index scan
+    await db_session.exec(
+        select(
+            func.set_config(
+                "hnsw.ef_search", str(ef_search or config.card_search_ef_search), True
+            )
+        )
+    )
+    if config.card_search_iterative_scan:
+        await db_session.exec(
+            select(
+                func.set_config(
+                    "hnsw.iterative_scan", config.card_search_iterative_scan, True
+                )
+            )
+        )
+    distance = Card.embedding.cosine_distance(vector).label("distance")
+    stmt = (
+        select(Card, distance)
+        .where(Card.user_id == owner_id, Card.embedding.is_not(None))
+        .order_by(distance)
+        .limit(limit)
+    )
+    if template_id is not None:
+        stmt = stmt.where(Card.template_id == template_id)
+    if max_distance is not None:
+        stmt = stmt.where(distance <= max_distance)
+    return [(card, d) for card, d in (await db_session.exec(stmt)).all()]
+
+
+class EmbeddingBatcher:
+    """
+    Collects newly created cards and embeds them in batches of up to
+    `batch_size`, waiting at most `interval` seconds for a batch to fill.
+    """
+
+    def __init__(self, batch_size: int, interval: float):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue: asyncio.Queue[tuple[str, str]] = asyncio.Queue()
+
+    def submit(self, cards: list[Card]):
+        for card in cards:
+            self.queue.put_nowait((card.id, card_embedding_text(card)))
+
+    async def next_batch(self) -> list[tuple[str, str]]:
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        while True:
+            batch = await self.next_batch()
+            try:
+                async with new_session() as db_session:
+                    await embed_cards(db_session, batch)
+                logger.debug(f"Embedded {len(batch)} cards")
+            except Exception as e:
+                # left NULL, the backfill picks them up later
+                logger.error(f"Embedding {len(batch)} cards failed: {e}")
+
+
+# The batcher of this process. Its queue belongs to the event loop it was
+# started in, so it is created by the app lifespan (or the worker) and
+# stopped with it.
+_batcher: Optional[EmbeddingBatcher] = None
+_batcher_task: Optional[asyncio.Task] = None
+
+
+def start_batcher() -> asyncio.Task:
+    global _batcher, _batcher_task
+    _batcher = EmbeddingBatcher(
+        config.embedding_batch_size, config.embedding_flush_interval
+    )
+    _batcher_task = asyncio.create_task(_batcher.run())
+    return _batcher_task
+
+
+async def stop_batcher():
+    global _batcher, _batcher_task
+    if _batcher_task is not None:
+        _batcher_task.cancel()
+        await asyncio.gather(_batcher_task, return_exceptions=True)
+    _batcher = None
+    _batcher_task = None
+
+
+def submit_embeddings(cards: list[Card]):
+    """Embed `cards` in the background, if the batcher is running."""
+    if _batcher is None:
+        # left NULL, the backfill picks them up later
+        logger.debug(f"No embedding batcher, {len(cards)} cards left to backfill")
+        return
+    _batcher.submit(cards)
+
+
+async def backfill_embeddings(
+    db_session: AsyncSession,
+    owner_id: Optional[str] = None,
+    on_batch: Optional[Callable[[int], Awaitable[None]]] = None,
+) -> int:
+    """
+    Embed the cards without embedding, a batch at a time with a pause
+    between batches. `on_batch` is called with the number of cards done.
+    """
+    done = 0
+    last_id = ""
+    while True:
+        stmt = (
+            select(Card.id, Card.paragraph, Card.pos_start, Card.pos_end)
+            .where(Card.embedding.is_(None), Card.id > last_id)
+            .order_by(Card.id)
+            .limit(config.embedding_batch_size)
+        )
+        if owner_id is not None:
+            stmt = stmt.where(Card.user_id == owner_id)
+        rows = (await db_session.exec(stmt)).all()
+        if not rows:
+            return done
+        await embed_cards(db_session, [(row.id, card_embedding_text(row)) for row in rows])
+        done += len(rows)
+        last_id = rows[-1].id
+        if on_batch is not None:
+            await on_batch(done)
+        await asyncio.sleep(config.embedding_backfill_interval)
@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, Literal, Optional
+
+from sqlmodel import select
+
+from lingominer.database import new_session
+from lingominer.models.card import Card
+from lingominer.services.oss import get_client, signed_url
+
+EXPORTED_COLUMNS = [
+    "id",
+    "template_id",
+    "status",
+    "paragraph",
+    "pos_start",
+    "pos_end",
+    "url",
+    "created_at",
+    "modified_at",
+]
+FILE_TYPES = {"audio", "image"}
+
+
+async def iter_cards(
+    owner_id: str, template_id: Optional[str], batch_size: int
+) -> AsyncIterator[dict]:
+    """
+    Cards of the user as json-ready dicts, read through a server-side
+    cursor `batch_size` rows at a time, the embedding is left out.
+    """
+    stmt = (
+        select(*(getattr(Card, name) for name in EXPORTED_COLUMNS), Card.content)
+        .where(Card.user_id == owner_id)
+        .order_by(Card.created_at, Card.id)
+        .execution_options(yield_per=batch_size)
+    )
+    if template_id is not None:
+        stmt = stmt.where(Card.template_id == template_id)
+    async with new_session() as db_session:
+        async for row in await db_session.stream(stmt):
+            card = dict(row._mapping)
+            card["status"] = card["status"].value
+            card["created_at"] = card["created_at"].isoformat()
+            card["modified_at"] = card["modified_at"].isoformat()
+            yield card
+
+
+async def sign_files(
+    cards: AsyncIterator[dict], expires_in: int
+) -> AsyncIterator[dict]:
+    """Add a signed `url` to the audio and image fields of the cards."""
+    s3 = get_client()
+    async for card in cards:
+        for field in card["content"].values():
+            if field.get("type") in FILE_TYPES and field.get("value"):
+                field["url"] = signed_url(s3, "lingominer", field["value"], expires_in)
+        yield card
+
+
+async def to_ndjson(cards: AsyncIterator[dict]) -> AsyncIterator[str]:
+    async for card in cards:
+        yield json.dumps(card, ensure_ascii=False) + "\n"
+
+
+async def to_csv(
+    cards: AsyncIterator[dict], content_fields: Optional[list[str]]
+) -> AsyncIterator[str]:
+    """
+    One column per content field when they are known (export of a single
+    template), a `content` json column otherwise.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> str:
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(EXPORTED_COLUMNS + (content_fields or ["content"]))
+    yield flush()
+    async for card in cards:
+        row = [card[name] for name in EXPORTED_COLUMNS]
+        if content_fields is None:
+            row.append(json.dumps(card["content"], ensure_ascii=False))
+        else:
+            for name in content_fields:
+                field = card["content"].get(name) or {}
+                row.append(field.get("url") or field.get("value") or "")
+        writer.writerow(row)
+        yield flush()
+
+
+def export_cards(
+    owner_id: str,
+    format: Literal["ndjson", "csv"],
+    template_id: Optional[str] = None,
+    content_fields: Optional[list[str]] = None,
+    signed_urls: bool = False,
+    expires_in: int = 3600,
+    batch_size: int = 500,
+) -> AsyncIterator[str]:
+    cards = iter_cards(owner_id, template_id, batch_size)
+    if signed_urls:
+        cards = sign_files(cards, expires_in)
+    if format == "csv":
+        return to_csv(cards, content_fields)
+    return to_ndjson(cards)
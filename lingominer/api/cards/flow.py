@@ -1,9 +1,20 @@
 import asyncio
+import hashlib
 
+from lingominer.cache import LRUCache
+from lingominer.config import config
+from lingominer.logger import logger
 from lingominer.services.ai import openai_client
+from lingominer.services.langdetect import detect
 
+# sha256 of the paragraph -> language
+_languages: LRUCache[str, str] = LRUCache(config.lang_detect_cache_size)
 
-async def detect_language(text: str) -> str:
+# ISO 639-1 codes answered by the llm whose template language differs
+LLM_LANG_ALIASES = {"ja": "jp"}
+
+
+async def detect_language_llm(text: str) -> str:
     response = await openai_client.chat.completions.create(
         model="gpt-4o-mini",
         messages=[
@@ -13,7 +24,20 @@ async def detect_language(text: str) -> str:
             }
         ],
     )
-    return response.choices[0].message.content
+    lang = response.choices[0].message.content.strip().lower()
+    return LLM_LANG_ALIASES.get(lang, lang)
+
+
+async def detect_language(text: str) -> str:
+    key = hashlib.sha256(text.encode()).hexdigest()
+    if (lang := _languages.get(key)) is not None:
+        return lang
+    lang, confidence = detect(text)
+    if lang is None or confidence < config.lang_detect_min_confidence:
+        logger.debug(f"Language unsure ({lang}, {confidence:.2f}), asking llm")
+        lang = await detect_language_llm(text)
+    _languages.set(key, lang)
+    return lang
 
 
 if __name__ == "__main__":
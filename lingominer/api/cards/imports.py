@@ -0,0 +1,162 @@
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterator, Sequence
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from lingominer.api.cards.schema import CardImport
+from lingominer.flow.algo import FieldDefinition, Task
+from lingominer.models.card import Card, selection_hash
+
+COPIED_COLUMNS = [
+    "id",
+    "user_id",
+    "status",
+    "paragraph",
+    "pos_start",
+    "pos_end",
+    "selection_hash",
+    "url",
+    "content",
+    "template_id",
+    "import_id",
+    "created_at",
+    "modified_at",
+]
+MAX_REPORTED_ERRORS = 20
+
+
+async def iter_lines(
+    chunks: AsyncIterator[bytes],
+) -> AsyncIterator[tuple[int, bytes]]:
+    """Numbered non-empty lines of a streamed body, still encoded."""
+    buffer = b""
+    number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            if line.strip():
+                yield number, line
+    if buffer.strip():
+        yield number + 1, buffer
+
+
+def template_fields(tasks: Sequence[Task]) -> dict[str, tuple[FieldDefinition, dict]]:
+    """Field name -> definition and provenance of the template's fields."""
+    return {
+        output.name: (
+            output,
+            {"generation_id": task.id, "fingerprint": task.fingerprint()},
+        )
+        for task in tasks
+        for output in task.outputs
+    }
+
+
+def import_content(
+    item: CardImport, fields: dict[str, tuple[FieldDefinition, dict]]
+) -> dict:
+    """
+    Content of an imported card. Values are taken as generated by the
+    current template, so only the fields left out are outdated.
+    """
+    unknown = set(item.content) - set(fields)
+    if unknown:
+        raise ValueError(f"Unknown fields: {sorted(unknown)}")
+    content = {}
+    for name, value in item.content.items():
+        output, source = fields[name]
+        if isinstance(value, dict):
+            value = value.get("value")
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"Field {name} is not a string")
+        content[name] = {"value": value, "type": output.type, "source": source}
+    return content
+
+
+async def copy_rows(db_session: AsyncSession, rows: list[tuple]):
+    """Write rows into `card` with COPY, inside the session's transaction."""
+    if not rows:
+        return
+    connection = await db_session.connection()
+    raw_connection = await connection.get_raw_connection()
+    async with raw_connection.driver_connection.cursor() as cursor:
+        columns = ", ".join(COPIED_COLUMNS)
+        async with cursor.copy(f"COPY card ({columns}) FROM STDIN") as copy:
+            for row in rows:
+                await copy.write_row(row)
+
+
+async def import_cards(
+    db_session: AsyncSession,
+    owner_id: str,
+    template_id: str,
+    import_id: str,
+    tasks: Sequence[Task],
+    lines: AsyncIterator[tuple[int, bytes]],
+    chunk_size: int,
+) -> tuple[int, int]:
+    """
+    COPY the cards of an NDJSON stream in chunks of `chunk_size`, all in the
+    session's transaction which is committed only when every line is valid.
+    The cards are marked with `import_id`. Returns the number of cards and
+    how many of them have missing fields.
+    """
+    fields = template_fields(tasks)
+    errors = []
+    rows = []
+    imported = 0
+    incomplete = 0
+    async for number, line in lines:
+        try:
+            # invalid UTF-8 raises UnicodeDecodeError, a ValueError
+            item = CardImport.model_validate_json(line.decode())
+            if not item.pos_start <= item.pos_end <= len(item.paragraph):
+                raise ValueError("Selection out of the paragraph")
+            content = import_content(item, fields)
+        except (ValidationError, ValueError) as e:
+            errors.append({"line": number, "error": str(e)})
+            if len(errors) >= MAX_REPORTED_ERRORS:
+                break
+            continue
+        if errors:
+            # nothing will be written, keep validating only
+            continue
+
+        card_id = Card.model_fields["id"].default_factory()
+        now = datetime.now(timezone.utc)
+        rows.append(
+            (
+                card_id,
+                owner_id,
+                item.status.name,
+                item.paragraph,
+                item.pos_start,
+                item.pos_end,
+                selection_hash(item.paragraph, item.pos_start, item.pos_end),
+                item.url,
+                json.dumps(content, ensure_ascii=False),
+                template_id,
+                import_id,
+                now,
+                now,
+            )
+        )
+        if set(fields) - set(content):
+            incomplete += 1
+        if len(rows) >= chunk_size:
+            await copy_rows(db_session, rows)
+            imported += len(rows)
+            rows = []
+
+    if errors:
+        await db_session.rollback()
+        raise HTTPException(status_code=422, detail=errors)
+    await copy_rows(db_session, rows)
+    imported += len(rows)
+    await db_session.commit()
+    return imported, incomplete
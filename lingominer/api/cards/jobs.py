@@ -0,0 +1,203 @@
+import asyncio
+from datetime import timedelta
+from typing import Awaitable, Callable, Optional
+
+from sqlmodel import func, or_, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from lingominer.api.cards import service
+from lingominer.api.cards.embeddings import backfill_embeddings, submit_embeddings
+from lingominer.api.cards.schema import CardCreate
+from lingominer.api.templates.service import get_template
+from lingominer.config import config
+from lingominer.ctx import user_id
+from lingominer.database import new_session
+from lingominer.logger import logger
+from lingominer.models.card import Card
+from lingominer.models.job import CardJob, CardJobStatus
+
+# Jobs live in the `cardjob` table, so the api and any number of
+# `python -m lingominer.worker` processes can share the queue.
+# Workers claim jobs with `FOR UPDATE SKIP LOCKED`.
+
+
+async def enqueue_job(
+    db_session: AsyncSession, kind: str, payload: dict, owner_id: Optional[str] = None
+) -> CardJob:
+    job = CardJob(kind=kind, payload=payload, user_id=owner_id or user_id.get())
+    db_session.add(job)
+    await db_session.commit()
+    await db_session.refresh(job)
+    return job
+
+
+async def get_job(db_session: AsyncSession, job_id: str) -> Optional[CardJob]:
+    stmt = select(CardJob).where(
+        CardJob.id == job_id, CardJob.user_id == user_id.get()
+    )
+    return (await db_session.exec(stmt)).one_or_none()
+
+
+async def claim_job(db_session: AsyncSession) -> Optional[CardJob]:
+    stale = func.now() - timedelta(seconds=config.card_job_stale_after)
+    stmt = (
+        select(CardJob)
+        .where(
+            or_(
+                CardJob.status == CardJobStatus.PENDING,
+                (CardJob.status == CardJobStatus.RUNNING)
+                & (CardJob.updated_at < stale),
+            ),
+            CardJob.attempts < config.card_job_max_attempts,
+        )
+        .order_by(CardJob.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    job = (await db_session.exec(stmt)).first()
+    if job is None:
+        return None
+    job.status = CardJobStatus.RUNNING
+    job.attempts += 1
+    db_session.add(job)
+    await db_session.commit()
+    await db_session.refresh(job)
+    return job
+
+
+async def report_progress(db_session: AsyncSession, job: CardJob, progress: dict):
+    await db_session.exec(
+        update(CardJob).where(CardJob.id == job.id).values(progress=progress)
+    )
+    await db_session.commit()
+
+
+# Handlers
+
+
+async def run_create_job(db_session: AsyncSession, job: CardJob):
+    card_create = CardCreate.model_validate(job.payload)
+    template = await service.resolve_template(db_session, card_create)
+    if template is None:
+        raise ValueError("Template not found")
+    tasks = await service.template_tasks(db_session, template)
+    flow = service.build_flow(tasks, card_create)
+    progress = {"done": 0, "total": len(flow.context.dump())}
+    await report_progress(db_session, job, progress)
+    async for event, _ in flow.stream():
+        if event == "field":
+            progress["done"] += 1
+            await report_progress(db_session, job, progress)
+
+    card = service.new_card(
+        job.user_id, template.id, card_create, flow.context.dump()
+    )
+    db_session.add(card)
+    job.card_id = card.id
+    await db_session.commit()
+    submit_embeddings([card])
+
+
+async def run_regenerate_job(db_session: AsyncSession, job: CardJob):
+    template = await get_template(db_session, job.payload["template_id"])
+    if template is None:
+        raise ValueError("Template not found")
+    tasks = await service.template_tasks(db_session, template)
+    stmt = (
+        select(Card.id)
+        .where(Card.template_id == template.id, Card.user_id == job.user_id)
+        .order_by(Card.id)
+    )
+    if "import_id" in job.payload:
+        # only the cards of an import
+        stmt = stmt.where(Card.import_id == job.payload["import_id"])
+    card_ids = (await db_session.exec(stmt)).all()
+    progress = {"done": 0, "total": len(card_ids), "regenerated": 0}
+    await report_progress(db_session, job, progress)
+
+    # throttled: a few cards at a time, with a pause after each one
+    semaphore = asyncio.Semaphore(config.regenerate_concurrency)
+    # the session can't run statements concurrently
+    db_lock = asyncio.Lock()
+
+    async def regenerate(card_id: str):
+        async with semaphore:
+            async with db_lock:
+                card = await db_session.get(Card, card_id)
+            content = await service.regenerate_card(tasks, card)
+            async with db_lock:
+                if content is not None:
+                    await db_session.exec(
+                        update(Card).where(Card.id == card_id).values(content=content)
+                    )
+                    progress["regenerated"] += 1
+                progress["done"] += 1
+                await report_progress(db_session, job, progress)
+            await asyncio.sleep(config.regenerate_interval)
+
+    await asyncio.gather(*(regenerate(card_id) for card_id in card_ids))
+
+
+async def run_embed_job(db_session: AsyncSession, job: CardJob):
+    total = (
+        await db_session.exec(
+            select(func.count())
+            .select_from(Card)
+            .where(Card.user_id == job.user_id, Card.embedding.is_(None))
+        )
+    ).one()
+    await report_progress(db_session, job, {"done": 0, "total": total})
+    await backfill_embeddings(
+        db_session,
+        job.user_id,
+        lambda done: report_progress(
+            db_session, job, {"done": done, "total": max(total, done)}
+        ),
+    )
+
+
+JOB_HANDLERS: dict[str, Callable[[AsyncSession, CardJob], Awaitable[None]]] = {
+    "create": run_create_job,
+    "regenerate": run_regenerate_job,
+    "embed": run_embed_job,
+}
+
+
+async def run_job(db_session: AsyncSession, job: CardJob):
+    user_id.set(job.user_id)
+    try:
+        await JOB_HANDLERS[job.kind](db_session, job)
+        job.status = CardJobStatus.SUCCEEDED
+        job.error = None
+    except Exception as e:
+        logger.error(f"Card job {job.id} failed: {e}")
+        await db_session.rollback()
+        job.status = CardJobStatus.FAILED
+        job.error = str(e)
+    db_session.add(job)
+    await db_session.commit()
+
+
+# Workers
+
+
+async def work(poll_interval: float):
+    while True:
+        try:
+            async with new_session() as db_session:
+                job = await claim_job(db_session)
+                if job is not None:
+                    await run_job(db_session, job)
+                    continue
+        except Exception as e:
+            logger.error(f"Card job worker error: {e}")
+        await asyncio.sleep(poll_interval)
+
+
+def start_workers(count: int) -> list[asyncio.Task]:
+    if count > 0:
+        logger.info(f"Starting {count} card job workers")
+    return [
+        asyncio.create_task(work(config.card_job_poll_interval))
+        for _ in range(count)
+    ]
@@ -1,9 +1,10 @@
 from datetime import datetime
-from typing import Optional
+from typing import Any, Optional
 
 from pydantic import BaseModel, Field
 
 from lingominer.models.card import CardStatus
+from lingominer.models.job import CardJobStatus
 
 
 class CardCreate(BaseModel):
@@ -34,6 +35,10 @@ class CardCreate(BaseModel):
     }
 
 
+class CardBatchCreate(BaseModel):
+    items: list[CardCreate] = Field(min_length=1, max_length=100)
+
+
 class CardResponse(BaseModel):
     id: str
     paragraph: str
@@ -45,3 +50,54 @@ class CardResponse(BaseModel):
     template_id: str
     created_at: datetime
     modified_at: datetime
+
+
+class CardJobResponse(BaseModel):
+    id: str
+    kind: str
+    status: CardJobStatus
+    progress: dict
+    card_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+
+class CardSearchResult(CardResponse):
+    distance: float = Field(description="cosine distance to the query")
+
+
+class CardListItem(BaseModel):
+    """A card in a listing, holding only the fields asked for."""
+
+    id: str
+    user_id: Optional[str] = None
+    status: Optional[CardStatus] = None
+    paragraph: Optional[str] = None
+    pos_start: Optional[int] = None
+    pos_end: Optional[int] = None
+    url: Optional[str] = None
+    content: Optional[dict] = None
+    template_id: Optional[str] = None
+    created_at: Optional[datetime] = None
+    modified_at: Optional[datetime] = None
+
+
+class CardImport(BaseModel):
+    """A line of an import, `content` maps field names to values."""
+
+    paragraph: str
+    pos_start: int = Field(ge=0)
+    pos_end: int = Field(ge=0)
+    url: Optional[str] = None
+    status: CardStatus = CardStatus.NEW
+    content: dict[str, Any] = Field(
+        default_factory=dict,
+        description="field name to value, or to `{\"value\": ..., \"type\": ...}`",
+    )
+
+
+class CardImportResult(BaseModel):
+    imported: int
+    missing_fields: int = Field(description="cards with fields left to generate")
+    jobs: list[CardJobResponse]
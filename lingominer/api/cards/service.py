@@ -0,0 +1,318 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from lingominer.api.cards.flow import detect_language
+from lingominer.api.cards.embeddings import card_embedding_text, search_cards
+from lingominer.api.cards.schema import CardCreate
+from lingominer.api.templates.plan import get_plan
+from lingominer.api.templates.service import get_template, get_template_by_lang
+from lingominer.config import config
+from lingominer.flow.algo import (
+    CompletionPacker,
+    Context,
+    Flow,
+    Task,
+    TaskCache,
+    outdated_tasks,
+)
+from lingominer.models.card import Card, CardStatus, selection_hash
+from lingominer.models.template import Template
+from lingominer.services.embedding import embed_texts
+
+
+async def resolve_template(
+    db_session: AsyncSession, card_create: CardCreate
+) -> Optional[Template]:
+    if card_create.template_id:
+        return await get_template(db_session, card_create.template_id)
+    lang = await detect_language(card_create.paragraph)
+    return await get_template_by_lang(db_session, lang)
+
+
+async def resolve_templates(
+    db_session: AsyncSession, items: list[CardCreate]
+) -> list[Optional[Template]]:
+    """`resolve_template` for a batch, each template and language is looked up once."""
+    by_id: dict[str, Optional[Template]] = {}
+    by_paragraph: dict[str, Optional[Template]] = {}
+    templates = []
+    for item in items:
+        if item.template_id:
+            if item.template_id not in by_id:
+                by_id[item.template_id] = await get_template(
+                    db_session, item.template_id
+                )
+            templates.append(by_id[item.template_id])
+        else:
+            if item.paragraph not in by_paragraph:
+                lang = await detect_language(item.paragraph)
+                by_paragraph[item.paragraph] = await get_template_by_lang(
+                    db_session, lang
+                )
+            templates.append(by_paragraph[item.paragraph])
+    return templates
+
+
+def decorate_paragraph(card: CardCreate | Card) -> str:
+    return (
+        card.paragraph[: card.pos_start]
+        + "@@"
+        + card.paragraph[card.pos_start : card.pos_end]
+        + "@@"
+        + card.paragraph[card.pos_end :]
+    )
+
+
+def new_packer() -> CompletionPacker:
+    return CompletionPacker(
+        window=config.completion_pack_window,
+        max_items=config.completion_pack_max_items,
+        token_budget=config.completion_pack_token_budget,
+    )
+
+
+async def template_tasks(
+    db_session: AsyncSession, template: Template
+) -> tuple[Task, ...]:
+    return (await get_plan(db_session, template)).tasks
+
+
+def default_fields(card: CardCreate | Card) -> dict[str, str]:
+    return {
+        "paragraph": card.paragraph,
+        "decorated_paragraph": decorate_paragraph(card),
+    }
+
+
+def setup_context(card: CardCreate | Card, fields: Optional[dict] = None) -> Context:
+    return Context({**default_fields(card), **(fields or {})})
+
+
+def changed_fields(card: Card, card_create: CardCreate) -> set[str]:
+    """Default fields `card_create` gives another value than `card` had."""
+    old = default_fields(card)
+    return {
+        name for name, value in default_fields(card_create).items() if old[name] != value
+    }
+
+
+def build_flow(
+    tasks: Sequence[Task],
+    card_create: CardCreate,
+    cache: Optional[TaskCache] = None,
+    packer: Optional[CompletionPacker] = None,
+) -> Flow:
+    flow = Flow(setup_context(card_create), cache=cache, packer=packer)
+    for task in tasks:
+        flow.add_task(task)
+    return flow
+
+
+def build_regeneration_flow(
+    tasks: Sequence[Task],
+    card: CardCreate | Card,
+    content: Optional[dict] = None,
+    changed: set[str] = frozenset(),
+) -> Optional[Flow]:
+    """
+    Flow recomputing only the fields of `content` (by default the card's)
+    that are outdated against the template `tasks` or read one of the
+    `changed` default fields, or None if the content is up to date.
+    """
+    if content is None:
+        content = card.content
+    tasks = outdated_tasks(list(tasks), content, changed)
+    if not tasks:
+        return None
+    regenerated = {output.name for task in tasks for output in task.outputs}
+    # empty fields are kept too, the regenerated tasks may take them as input
+    kept = {
+        name: field.get("value")
+        for name, field in content.items()
+        if name not in regenerated
+    }
+    flow = Flow(setup_context(card, kept))
+    for task in tasks:
+        flow.add_task(task)
+    return flow
+
+
+async def regenerate_card(
+    tasks: Sequence[Task],
+    card: CardCreate | Card,
+    content: Optional[dict] = None,
+    changed: set[str] = frozenset(),
+) -> Optional[dict]:
+    """Updated content of `card`, or None if nothing had to be regenerated."""
+    if content is None:
+        content = card.content
+    flow = build_regeneration_flow(tasks, card, content, changed)
+    if flow is None:
+        return None
+    result = await flow.run()
+    return {**content, **result.dump()}
+
+
+def new_card(
+    owner_id: str, template_id: str, card_create: CardCreate, content: dict
+) -> Card:
+    return Card(
+        user_id=owner_id,
+        content=content,
+        template_id=template_id,
+        url=card_create.url,
+        paragraph=card_create.paragraph,
+        pos_start=card_create.pos_start,
+        pos_end=card_create.pos_end,
+        selection_hash=selection_hash(
+            card_create.paragraph, card_create.pos_start, card_create.pos_end
+        ),
+    )
+
+
+async def find_duplicate(
+    db_session: AsyncSession,
+    owner_id: str,
+    template_id: str,
+    card_create: CardCreate,
+    max_distance: Optional[float] = None,
+) -> Optional[Card]:
+    """
+    Existing card of the user mining the same selection with the same
+    template, preferring one from the same paragraph. Only the fields not
+    depending on the paragraph can be reused from another one, see
+    `changed_fields`. With `max_distance`,
+    falls back to the closest card by embedding within that distance.
+    """
+    stmt = (
+        select(Card)
+        .where(
+            Card.user_id == owner_id,
+            Card.template_id == template_id,
+            Card.selection_hash
+            == selection_hash(
+                card_create.paragraph, card_create.pos_start, card_create.pos_end
+            ),
+        )
+        .order_by(
+            (Card.paragraph == card_create.paragraph).desc(),
+            Card.created_at.desc(),
+        )
+        .limit(1)
+    )
+    card = (await db_session.exec(stmt)).first()
+    if card is not None or max_distance is None:
+        return card
+    [vector] = await embed_texts([card_embedding_text(card_create)])
+    results = await search_cards(
+        db_session,
+        vector,
+        owner_id,
+        limit=1,
+        template_id=template_id,
+        max_distance=max_distance,
+    )
+    return results[0][0] if results else None
+
+
+# Listing
+
+LISTED_COLUMNS = {
+    "id": Card.id,
+    "user_id": Card.user_id,
+    "status": Card.status,
+    "paragraph": Card.paragraph,
+    "pos_start": Card.pos_start,
+    "pos_end": Card.pos_end,
+    "url": Card.url,
+    "content": Card.content,
+    "template_id": Card.template_id,
+    "created_at": Card.created_at,
+    "modified_at": Card.modified_at,
+}
+
+
+def encode_cursor(created_at: datetime, card_id: str) -> str:
+    payload = json.dumps([created_at.isoformat(), card_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        created_at, card_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(created_at), card_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+
+
+async def list_cards(
+    db_session: AsyncSession,
+    owner_id: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    status: Optional[CardStatus] = None,
+    template_id: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    fields: Optional[list[str]] = None,
+) -> tuple[list[dict], Optional[str]]:
+    """
+    A page of the user's cards, newest first, and the cursor of the next
+    page. `fields` are column names or `content.<key>` for single content
+    keys; only those are read from the table, the embedding never is.
+    """
+    fields = fields or [name for name in LISTED_COLUMNS if name != "user_id"]
+    columns = {"id": Card.id, "created_at": Card.created_at}
+    content_keys = []
+    for name in fields:
+        if name.startswith("content."):
+            content_keys.append(name.removeprefix("content."))
+        elif name in LISTED_COLUMNS:
+            columns[name] = LISTED_COLUMNS[name]
+        else:
+            raise HTTPException(status_code=422, detail=f"Unknown field: {name}")
+    selected = [column.label(name) for name, column in columns.items()]
+    selected += [
+        Card.content[key].label(f"content.{key}")
+        for key in content_keys
+        if "content" not in columns
+    ]
+
+    stmt = (
+        select(*selected)
+        .where(Card.user_id == owner_id)
+        .order_by(Card.created_at.desc(), Card.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        stmt = stmt.where(tuple_(Card.created_at, Card.id) < decode_cursor(cursor))
+    if status is not None:
+        stmt = stmt.where(Card.status == status)
+    if template_id is not None:
+        stmt = stmt.where(Card.template_id == template_id)
+    if created_after is not None:
+        stmt = stmt.where(Card.created_at >= created_after)
+    if created_before is not None:
+        stmt = stmt.where(Card.created_at < created_before)
+    rows = (await db_session.exec(stmt)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    items = []
+    for row in rows:
+        values = row._mapping
+        item = {name: values[name] for name in columns if name == "id" or name in fields}
+        if content_keys and "content" not in columns:
+            item["content"] = {key: values[f"content.{key}"] for key in content_keys}
+        items.append(item)
+    return items, next_cursor
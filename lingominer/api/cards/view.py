@@ -1,109 +1,423 @@
-from typing import Annotated, Optional
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Annotated, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import insert, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from lingominer.api.auth.security import get_current_user
-from lingominer.api.cards.flow import detect_language
-from lingominer.api.cards.schema import CardCreate
-from lingominer.api.templates.service import get_template, get_template_by_lang
+from lingominer.api.cards import export, imports, jobs, service
+from lingominer.api.cards.embeddings import search_cards, submit_embeddings
+from lingominer.api.cards.schema import (
+    CardBatchCreate,
+    CardCreate,
+    CardImportResult,
+    CardJobResponse,
+    CardListItem,
+    CardSearchResult,
+)
+from lingominer.api.templates.service import get_template
+from lingominer.api.sse import sse_event
+from lingominer.config import config
 from lingominer.ctx import user_id
-from lingominer.database import get_db_session
-from lingominer.flow.algo import Context, FieldDefinition, Flow, Task
-from lingominer.models.card import Card
+from lingominer.database import get_db_session, new_session
+from lingominer.flow.algo import TaskCache
+from lingominer.logger import logger
+from lingominer.models.card import Card, CardStatus
+from lingominer.services.embedding import embed_texts
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
 
 
-@router.get("", response_model=list[Card])
+@router.get(
+    "", response_model=list[CardListItem], response_model_exclude_unset=True
+)
 async def get_cards(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
+    response: Response,
     template_id: Optional[str] = None,
+    status: Optional[CardStatus] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    fields: Annotated[
+        Optional[str],
+        Query(description="comma separated columns or `content.<key>`"),
+    ] = None,
 ):
-    if template_id:
-        stmt = select(Card).where(Card.template_id == template_id)
-    else:
-        stmt = select(Card)
-    cards = db_session.exec(stmt).all()
+    """
+    The user's cards, newest first. When there are more, the
+    `X-Next-Cursor` header holds the `cursor` of the next page.
+    """
+    cards, next_cursor = await service.list_cards(
+        db_session,
+        user_id.get(),
+        limit,
+        cursor=cursor,
+        status=status,
+        template_id=template_id,
+        created_after=created_after,
+        created_before=created_before,
+        fields=[f.strip() for f in fields.split(",") if f.strip()] if fields else None,
+    )
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
     return cards
 
 
+@router.get("/export", response_class=StreamingResponse)
+async def export_cards_view(
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
+    format: Literal["ndjson", "csv"] = "ndjson",
+    template_id: Optional[str] = None,
+    signed_urls: bool = False,
+    expires_in: Annotated[int, Query(ge=60, le=7 * 24 * 3600)] = 3600,
+):
+    """
+    Stream all cards of the user as NDJSON or CSV, in constant memory.
+    With `signed_urls`, audio and image fields get a temporary download url.
+    CSV exports of a single template have one column per template field.
+    """
+    content_fields = None
+    if template_id is not None:
+        template = await get_template(db_session, template_id)
+        if template is None:
+            raise HTTPException(status_code=404, detail="Template not found")
+        content_fields = [
+            output.name
+            for task in await service.template_tasks(db_session, template)
+            for output in task.outputs
+        ]
+    body = export.export_cards(
+        user_id.get(),
+        format,
+        template_id=template_id,
+        content_fields=content_fields,
+        signed_urls=signed_urls,
+        expires_in=expires_in,
+    )
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="cards.{format}"'},
+    )
+
+
+@router.get("/search", response_model=list[CardSearchResult])
+async def search_cards_view(
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
+    q: Annotated[str, Query(min_length=1)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 10,
+    ef_search: Annotated[Optional[int], Query(ge=1, le=1000)] = None,
+    template_id: Optional[str] = None,
+    max_distance: Annotated[Optional[float], Query(ge=0, le=2)] = None,
+):
+    """
+    Cards semantically closest to `q`, e.g. related words or near duplicates
+    (with a small `max_distance`). A larger `ef_search` trades speed for recall.
+    """
+    [vector] = await embed_texts([q])
+    results = await search_cards(
+        db_session,
+        vector,
+        user_id.get(),
+        limit=limit,
+        ef_search=ef_search,
+        template_id=template_id,
+        max_distance=max_distance,
+    )
+    return [
+        CardSearchResult(
+            **card.model_dump(exclude={"embedding"}), distance=distance
+        )
+        for card, distance in results
+    ]
+
+
+@router.get("/jobs/{job_id}", response_model=CardJobResponse)
+async def get_card_job(
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
+    job_id: str,
+):
+    job = await jobs.get_job(db_session, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 @router.get("/{card_id}", response_model=Card)
 async def get_card(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     card_id: str,
 ):
-    card = db_session.exec(select(Card).where(Card.id == card_id)).one_or_none()
+    card = (
+        await db_session.exec(select(Card).where(Card.id == card_id))
+    ).one_or_none()
     if card is None:
         raise HTTPException(status_code=404, detail="Card not found")
     return card
 
 
-@router.post("", response_model=Card)
+@router.post("", response_model=Card | CardJobResponse)
 async def create_card_view(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     card_create: CardCreate,
+    response: Response,
+    background: bool = False,
+    duplicate: Literal["create", "return", "reuse"] = "create",
+    duplicate_max_distance: Annotated[Optional[float], Query(ge=0, le=2)] = None,
 ):
-    if card_create.template_id:
-        template = get_template(db_session, card_create.template_id)
+    """
+    With `background=true` the card is generated by a job worker instead,
+    the job is returned right away and can be polled at `/cards/jobs/{id}`.
+
+    `duplicate` decides what happens when the user already has a card for
+    the same selection and template (or, with `duplicate_max_distance`, one
+    close enough by embedding): `create` generates anyway, `return` returns
+    the existing card, `reuse` creates the card with its field values,
+    only regenerating those that depend on the paragraph if it differs.
+    """
+    if background:
+        response.status_code = 202
+        return await jobs.enqueue_job(
+            db_session, "create", card_create.model_dump()
+        )
+
+    template = await service.resolve_template(db_session, card_create)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+
+    existing = None
+    if duplicate != "create":
+        existing = await service.find_duplicate(
+            db_session,
+            user_id.get(),
+            template.id,
+            card_create,
+            max_distance=duplicate_max_distance,
+        )
+    if existing is not None and duplicate == "return":
+        return existing
+    tasks = await service.template_tasks(db_session, template)
+    if existing is not None:
+        # fields reading another paragraph or selection are regenerated
+        content = await service.regenerate_card(
+            tasks,
+            card_create,
+            existing.content,
+            service.changed_fields(existing, card_create),
+        )
+        if content is None:
+            content = existing.content
     else:
-        lang = await detect_language(card_create.paragraph)
-        template = get_template_by_lang(db_session, lang)
-    setup_context = Context(
-        {
-            "paragraph": card_create.paragraph,
-            "decorated_paragraph": (
-                card_create.paragraph[: card_create.pos_start]
-                + "@@"
-                + card_create.paragraph[card_create.pos_start : card_create.pos_end]
-                + "@@"
-                + card_create.paragraph[card_create.pos_end :]
-            ),
-        }
+        flow = service.build_flow(tasks, card_create)
+        content = (await flow.run()).dump()
+
+    card_from_template = service.new_card(
+        user_id.get(), template.id, card_create, content
+    )
+    db_session.add(card_from_template)
+    await db_session.commit()
+    await db_session.refresh(card_from_template)
+    submit_embeddings([card_from_template])
+    return card_from_template
+
+
+@router.post("/batch", response_model=list[Card])
+async def create_cards_batch_view(
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
+    batch: CardBatchCreate,
+    pack: bool = True,
+):
+    """
+    Create many cards at once. Sub-tasks that render to the same prompt,
+    e.g. the translation of a paragraph shared by several selections,
+    run once for the whole batch, and all cards are inserted together.
+    With `pack`, completions of the same generation are sent together.
+    """
+    templates = await service.resolve_templates(db_session, batch.items)
+    if any(template is None for template in templates):
+        raise HTTPException(status_code=404, detail="Template not found")
+    cache = TaskCache()
+    packer = service.new_packer() if pack else None
+    flows = [
+        service.build_flow(
+            await service.template_tasks(db_session, template), item, cache, packer
+        )
+        for template, item in zip(templates, batch.items)
+    ]
+    results = await asyncio.gather(*(flow.run() for flow in flows))
+
+    owner_id = user_id.get()
+    cards = [
+        service.new_card(owner_id, template.id, item, result.dump())
+        for template, item, result in zip(templates, batch.items, results)
+    ]
+    await db_session.exec(insert(Card), params=[card.model_dump() for card in cards])
+    await db_session.commit()
+    submit_embeddings(cards)
+    return cards
+
+
+@router.post("/import", response_model=CardImportResult)
+async def import_cards_view(
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
+    request: Request,
+    template_id: str,
+    generate_missing: bool = False,
+):
+    """
+    Import pre-filled cards of a template from an NDJSON body, one
+    `CardImport` per line. Nothing is imported if any line is invalid.
+    Imported cards are embedded in the background, and with
+    `generate_missing` the template fields they lack are generated too.
+    """
+    template = await get_template(db_session, template_id)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+    import_id = "import_" + uuid.uuid4().hex
+    imported, incomplete = await imports.import_cards(
+        db_session,
+        user_id.get(),
+        template_id,
+        import_id,
+        await service.template_tasks(db_session, template),
+        imports.iter_lines(request.stream()),
+        config.card_import_chunk_size,
     )
-    flow = Flow(setup_context)
-    for generation in template.generations:
-        flow.add_task(
-            Task(
-                name=generation.name,
-                action=generation.method,
-                inputs=[f.name for f in generation.inputs],
-                outputs=[
-                    FieldDefinition(
-                        name=f.name,
-                        type=f.type,
-                        description=f.description,
-                    )
-                    for f in generation.outputs
-                ],
-                prompt=generation.prompt,
+
+    import_jobs = []
+    if imported:
+        import_jobs.append(await jobs.enqueue_job(db_session, "embed", {}))
+    if incomplete and generate_missing:
+        import_jobs.append(
+            await jobs.enqueue_job(
+                db_session,
+                "regenerate",
+                {"template_id": template_id, "import_id": import_id},
             )
         )
-    result = await flow.run()
-
-    card_from_template = Card(
-        user_id=user_id.get(),
-        content=result.dump(),
-        template_id=template.id,
-        url=card_create.url,
-        paragraph=card_create.paragraph,
-        pos_start=card_create.pos_start,
-        pos_end=card_create.pos_end,
+    return CardImportResult(
+        imported=imported,
+        missing_fields=incomplete,
+        jobs=[
+            CardJobResponse.model_validate(job, from_attributes=True)
+            for job in import_jobs
+        ],
     )
-    db_session.add(card_from_template)
-    db_session.commit()
-    db_session.refresh(card_from_template)
-    return card_from_template
+
+
+@router.post("/stream")
+async def stream_card_view(
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
+    card_create: CardCreate,
+):
+    """
+    Same as `POST /cards`, but answers with Server-Sent Events:
+    `delta` for completion tokens, `field` whenever a field is generated,
+    then `card` with the persisted card (or `error` if the flow failed).
+    """
+    template = await service.resolve_template(db_session, card_create)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+    tasks = await service.template_tasks(db_session, template)
+    flow = service.build_flow(tasks, card_create)
+    # the response body is produced after the request scope is gone,
+    # so capture what we need from it now
+    owner_id = user_id.get()
+    template_id = template.id
+
+    async def event_stream():
+        try:
+            async for event, data in flow.stream():
+                yield sse_event(event, data)
+        except Exception as e:
+            logger.error(f"Card generation failed: {e}")
+            yield sse_event("error", {"error": str(e)})
+            return
+        card = service.new_card(
+            owner_id, template_id, card_create, flow.context.dump()
+        )
+        async with new_session() as session:
+            session.add(card)
+            await session.commit()
+            await session.refresh(card)
+            submit_embeddings([card])
+            yield sse_event(
+                "card", card.model_dump(mode="json", exclude={"embedding"})
+            )
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@router.post("/regenerate", response_model=CardJobResponse, status_code=202)
+async def regenerate_template_cards_view(
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
+    template_id: str,
+):
+    """
+    Regenerate the outdated fields of every card of a template in the
+    background, the returned job can be polled at `/cards/jobs/{id}`.
+    """
+    if await get_template(db_session, template_id) is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+    return await jobs.enqueue_job(
+        db_session, "regenerate", {"template_id": template_id}
+    )
+
+
+@router.post(
+    "/embeddings/backfill", response_model=CardJobResponse, status_code=202
+)
+async def backfill_embeddings_view(
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
+):
+    """Embed, in the background, the cards of the user still without embedding."""
+    return await jobs.enqueue_job(db_session, "embed", {})
+
+
+@router.post("/{card_id}/regenerate", response_model=Card)
+async def regenerate_card_view(
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
+    card_id: str,
+):
+    """
+    Recompute only the fields whose generation changed since the card was
+    generated, along with the fields depending on them.
+    """
+    card = (
+        await db_session.exec(
+            select(Card).where(Card.id == card_id, Card.user_id == user_id.get())
+        )
+    ).one_or_none()
+    if card is None:
+        raise HTTPException(status_code=404, detail="Card not found")
+    template = await get_template(db_session, card.template_id)
+    tasks = await service.template_tasks(db_session, template)
+    content = await service.regenerate_card(tasks, card)
+    if content is not None:
+        card.content = content
+        db_session.add(card)
+        await db_session.commit()
+        await db_session.refresh(card)
+    return card
 
 
 @router.delete("/{card_id}", response_model=Card)
 async def delete_card_view(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     card_id: str,
 ):
-    card = db_session.exec(select(Card).where(Card.id == card_id)).one_or_none()
+    card = (
+        await db_session.exec(select(Card).where(Card.id == card_id))
+    ).one_or_none()
     if not card:
         raise HTTPException(status_code=404, detail="Card not found")
-    db_session.delete(card)
-    db_session.commit()
+    await db_session.delete(card)
+    await db_session.commit()
     return card
@@ -1,8 +1,8 @@
 from typing import Annotated, Optional, TypedDict, Union
 
-import requests
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from lingominer.api.auth.security import get_current_user
 from lingominer.api.mochi.schema import (
@@ -12,12 +12,13 @@ from lingominer.api.mochi.schema import (
     MochiMappingCreate,
 )
 from lingominer.database import get_db_session
+from lingominer.exception import MochiError
 from lingominer.models.card import Card
 from lingominer.models.mochi import MochiMapping
 from lingominer.models.user import User
+from lingominer.services import mochi
 
 router = APIRouter()
-base_url = "https://app.mochi.cards/api"
 
 
 class MochiField(TypedDict):
@@ -45,27 +46,31 @@ class MochiDeckList(TypedDict):
 
 @router.get("", response_model=list[MochiDeckMappingItem])
 async def get_mochi_deck_mappings(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     user: Annotated[User, Depends(get_current_user)],
     lm_template_id: Optional[str] = None,
 ):
     if not user.mochi_api_key:
         raise HTTPException(status_code=400, detail="User has no mochi api key")
 
-    mochi_decks: MochiDeckList = requests.get(
-        base_url + "/decks", auth=(user.mochi_api_key, "")
-    ).json()
+    try:
+        mochi_decks: MochiDeckList = await mochi.get_decks(user.mochi_api_key)
+    except MochiError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     if lm_template_id:
         mochi_mappings = (
-            db_session.query(MochiMapping)
-            .filter(MochiMapping.user_id == user.id)
-            .filter(MochiMapping.lingominer_template_id == lm_template_id)
-            .all()
-        )
+            await db_session.exec(
+                select(MochiMapping)
+                .where(MochiMapping.user_id == user.id)
+                .where(MochiMapping.lingominer_template_id == lm_template_id)
+            )
+        ).all()
     else:
         mochi_mappings = (
-            db_session.query(MochiMapping).filter(MochiMapping.user_id == user.id).all()
-        )
+            await db_session.exec(
+                select(MochiMapping).where(MochiMapping.user_id == user.id)
+            )
+        ).all()
 
     deck_items = [
         MochiDeckMappingItem(
@@ -91,19 +96,19 @@ async def get_mochi_deck_mappings(
 
 @router.get("/{mochi_deck_id}", response_model=MochiDeckMapping)
 async def get_mochi_deck_mapping(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     user: Annotated[User, Depends(get_current_user)],
     mochi_deck_id: str,
 ):
     if not user.mochi_api_key:
         raise HTTPException(status_code=400, detail="User has no mochi api key")
-    deck_info: MochiDeck = requests.get(
-        f"{base_url}/decks/{mochi_deck_id}", auth=(user.mochi_api_key, "")
-    ).json()
-    template_info: MochiTemplate = requests.get(
-        f"{base_url}/templates/{deck_info['template-id']}",
-        auth=(user.mochi_api_key, ""),
-    ).json()
+    try:
+        deck_info: MochiDeck = await mochi.get_deck(user.mochi_api_key, mochi_deck_id)
+        template_info: MochiTemplate = await mochi.get_template(
+            user.mochi_api_key, deck_info["template-id"]
+        )
+    except MochiError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     deck_mapping = MochiDeckMapping(
         id=deck_info["id"],
         name=deck_info["name"],
@@ -117,11 +122,12 @@ async def get_mochi_deck_mapping(
     )
 
     mapping_in_db = (
-        db_session.query(MochiMapping)
-        .filter(MochiMapping.mochi_deck_id == mochi_deck_id)
-        .filter(MochiMapping.user_id == user.id)
-        .first()
-    )
+        await db_session.exec(
+            select(MochiMapping)
+            .where(MochiMapping.mochi_deck_id == mochi_deck_id)
+            .where(MochiMapping.user_id == user.id)
+        )
+    ).first()
     if mapping_in_db:
         deck_mapping.lingominer_template_name = mapping_in_db.lingominer_template_name
         deck_mapping.lingominer_template_id = mapping_in_db.lingominer_template_id
@@ -135,20 +141,21 @@ async def get_mochi_deck_mapping(
 
 @router.post("")
 async def create_mochi_mapping(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     mapping_create: MochiMappingCreate,
     user: Annotated[User, Depends(get_current_user)],
 ):
     existing_mochi_mapping = (
-        db_session.query(MochiMapping)
-        .filter(MochiMapping.mochi_deck_id == mapping_create.mochi_deck_id)
-        .filter(MochiMapping.mochi_template_id == mapping_create.mochi_template_id)
-        .filter(MochiMapping.user_id == user.id)
-        .first()
-    )
+        await db_session.exec(
+            select(MochiMapping)
+            .where(MochiMapping.mochi_deck_id == mapping_create.mochi_deck_id)
+            .where(MochiMapping.mochi_template_id == mapping_create.mochi_template_id)
+            .where(MochiMapping.user_id == user.id)
+        )
+    ).first()
 
     if existing_mochi_mapping:
-        db_session.delete(existing_mochi_mapping)
+        await db_session.delete(existing_mochi_mapping)
 
     mapping_create = MochiMapping(
         mochi_deck_id=mapping_create.mochi_deck_id,
@@ -160,45 +167,46 @@ async def create_mochi_mapping(
     )
 
     db_session.add(mapping_create)
-    db_session.commit()
+    await db_session.commit()
 
 
 @router.delete("/{mochi_deck_id}")
 async def delete_mochi_mapping(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     mochi_deck_id: str,
     user: Annotated[User, Depends(get_current_user)],
 ):
     mochi_mapping = (
-        db_session.query(MochiMapping)
-        .filter(MochiMapping.mochi_deck_id == mochi_deck_id)
-        .filter(MochiMapping.user_id == user.id)
-        .first()
-    )
-    db_session.delete(mochi_mapping)
+        await db_session.exec(
+            select(MochiMapping)
+            .where(MochiMapping.mochi_deck_id == mochi_deck_id)
+            .where(MochiMapping.user_id == user.id)
+        )
+    ).first()
+    await db_session.delete(mochi_mapping)
 
 
 @router.post("/{mochi_deck_id}/cards", response_model=MochiMapping)
 async def create_mochi_cards(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     mochi_deck_id: str,
     lm_card_id: str,
     user: Annotated[User, Depends(get_current_user)],
 ):
     card = (
-        db_session.query(Card)
-        .filter(Card.id == lm_card_id)
-        .filter(Card.user_id == user.id)
-        .first()
-    )
+        await db_session.exec(
+            select(Card).where(Card.id == lm_card_id).where(Card.user_id == user.id)
+        )
+    ).first()
     if not card:
         raise HTTPException(status_code=404, detail="Card not found")
     mochi_mapping = (
-        db_session.query(MochiMapping)
-        .filter(MochiMapping.mochi_deck_id == mochi_deck_id)
-        .filter(MochiMapping.user_id == user.id)
-        .first()
-    )
+        await db_session.exec(
+            select(MochiMapping)
+            .where(MochiMapping.mochi_deck_id == mochi_deck_id)
+            .where(MochiMapping.user_id == user.id)
+        )
+    ).first()
     if not mochi_mapping:
         raise HTTPException(status_code=404, detail="Mochi mapping not found")
 
@@ -226,14 +234,12 @@ async def create_mochi_cards(
     }
 
     # Create card in Mochi
-    response = requests.post(
-        f"{base_url}/cards/", json=payload, auth=(user.mochi_api_key, "")
-    )
-
-    if response.status_code >= 400:
+    try:
+        await mochi.create_card(user.mochi_api_key, payload)
+    except MochiError as e:
         raise HTTPException(
-            status_code=response.status_code,
-            detail=f"Failed to create card in Mochi: {response.text}",
+            status_code=e.status_code,
+            detail=f"Failed to create card in Mochi: {e.detail}",
         )
 
     return mochi_mapping
@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import json
+from typing import Optional
+
+import httpx
+from openai import APIError
+
+from lingominer.cache import LRUCache
+from lingominer.config import config
+from lingominer.flow.algo import estimate_tokens
+from lingominer.logger import logger
+from lingominer.services.ai import openai_client
+
+# hash of (selected text, hash of the context, language) -> explanation
+_explanations: LRUCache[str, str] = LRUCache(config.note_cache_size)
+
+NOTE_PROMPT = """
+    in the context of the following text,
+    please explain the meaning of the selected text in a way that is easy to understand.
+    The explanation should be concise and to the point, and should be less then 3 sentences.
+    explain in {language}.
+    <text>
+    {context}
+    </text>
+    <selected_text>
+    {selected_text}
+    </selected_text>
+    """
+
+PACKED_NOTE_PROMPT = """
+    For each item below, explain the meaning of its selected text in the context it was selected from, in a way that is easy to understand.
+    Each explanation should be concise and to the point, and should be less then 3 sentences.
+    explain in {language}.
+    {contexts}
+    {items}
+    Return a JSON object whose keys are the item ids and whose values are the explanations.
+    """
+
+
+def explanation_key(selected_text: str, context: str, language: str) -> str:
+    context_hash = hashlib.sha256(context.encode()).hexdigest()
+    payload = json.dumps([selected_text, context_hash, language])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def explain_llm(selected_text: str, context: str, language: str) -> str:
+    prompt = NOTE_PROMPT.format(
+        context=context, selected_text=selected_text, language=language
+    )
+    response = await openai_client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[{"role": "user", "content": prompt}],
+    )
+    return response.choices[0].message.content
+
+
+async def explain(selected_text: str, context: str, language: str) -> str:
+    key = explanation_key(selected_text, context, language)
+    if (explanation := _explanations.get(key)) is not None:
+        return explanation
+    explanation = await explain_llm(selected_text, context, language)
+    _explanations.set(key, explanation)
+    return explanation
+
+
+def render_packed_note_prompt(items: list[tuple[str, str]], language: str) -> str:
+    """Prompt explaining `(selected text, context)` items, each context once."""
+    context_ids: dict[str, str] = {}
+    for _, context in items:
+        context_ids.setdefault(context, f"c{len(context_ids)}")
+    contexts = "\n".join(
+        f'<text id="{context_id}">\n{context}\n</text>'
+        for context, context_id in context_ids.items()
+    )
+    lines = "\n".join(
+        f'<selected_text id="n{i}" text="{context_ids[context]}">'
+        f"{selected_text}</selected_text>"
+        for i, (selected_text, context) in enumerate(items)
+    )
+    return PACKED_NOTE_PROMPT.format(
+        contexts=contexts, items=lines, language=language
+    )
+
+
+async def explain_packed(
+    items: list[tuple[str, str]], language: str
+) -> list[Optional[str]]:
+    """Explanations of many items with one completion, None where missing."""
+    try:
+        response = await openai_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "user", "content": render_packed_note_prompt(items, language)}
+            ],
+            response_format={"type": "json_object"},
+        )
+    except (APIError, httpx.TransportError) as e:
+        # includes timeouts, the items are then explained one by one
+        logger.warning(f"Packed notes request failed: {e!r}")
+        return [None] * len(items)
+    content = response.choices[0].message.content
+    logger.debug(f"Packed Note Result: {content}")
+    try:
+        result = json.loads(content)
+    except (TypeError, json.JSONDecodeError) as e:
+        logger.warning(f"Packed notes answer can't be parsed: {e}")
+        return [None] * len(items)
+    if not isinstance(result, dict):
+        logger.warning("Packed notes answer is not a JSON object")
+        return [None] * len(items)
+    explanations = []
+    for i in range(len(items)):
+        explanation = result.get(f"n{i}")
+        explanations.append(explanation if isinstance(explanation, str) else None)
+    return explanations
+
+
+def pack(items: list[tuple[str, str]], token_budget: int) -> list[list[int]]:
+    """Indexes of `items` grouped so each group's prompt fits `token_budget`."""
+    groups: list[list[int]] = []
+    tokens = 0
+    contexts: set[str] = set()
+    for i, (selected_text, context) in enumerate(items):
+        item_tokens = estimate_tokens(selected_text)
+        if context not in contexts:
+            item_tokens += estimate_tokens(context)
+        if not groups or tokens + item_tokens > token_budget:
+            groups.append([])
+            tokens = 0
+            contexts = set()
+            item_tokens = estimate_tokens(selected_text) + estimate_tokens(context)
+        groups[-1].append(i)
+        tokens += item_tokens
+        contexts.add(context)
+    return groups
+
+
+async def explain_many(items: list[tuple[str, str]], language: str) -> list[str]:
+    """
+    Explanations of `(selected text, context)` items. Cached ones are
+    reused, the others are explained together in as few packed
+    completions as fit `completion_pack_token_budget`, and the items a
+    packed answer left out are explained one by one.
+    """
+    keys = [explanation_key(text, context, language) for text, context in items]
+    explanations = {key: _explanations.get(key) for key in keys}
+    missing = {
+        key: item
+        for key, item in zip(keys, items)
+        if explanations[key] is None
+    }
+    missing_keys = list(missing)
+    missing_items = list(missing.values())
+    groups = pack(missing_items, config.completion_pack_token_budget)
+    results = await asyncio.gather(
+        *(
+            explain_packed([missing_items[i] for i in group], language)
+            for group in groups
+        )
+    )
+    fallback = []
+    for group, result in zip(groups, results):
+        for i, explanation in zip(group, result):
+            if explanation is None:
+                fallback.append(i)
+            else:
+                explanations[missing_keys[i]] = explanation
+    if fallback:
+        logger.warning(f"Packed notes missed {len(fallback)} items, explaining alone")
+        for i, explanation in zip(
+            fallback,
+            await asyncio.gather(
+                *(explain_llm(*missing_items[i], language) for i in fallback)
+            ),
+        ):
+            explanations[missing_keys[i]] = explanation
+    for key in missing_keys:
+        _explanations.set(key, explanations[key])
+    return [explanations[key] for key in keys]
@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Optional
 
 from sqlmodel import Field, SQLModel
 
@@ -16,6 +17,9 @@ class PassageList(SQLModel):
 
 class PassageDetail(PassageList):
     content: str = Field(description="content of the passage")
+    paragraph_offsets: list[list[int]] = Field(
+        description="[start, end] of each paragraph in the content"
+    )
     notes: list["NoteDetail"]
 
 
@@ -25,6 +29,13 @@ class NoteCreate(SQLModel):
     paragraph_index: int
     start_index: int
     end_index: int
+    language: Optional[str] = Field(
+        default=None, description="language of the explanation"
+    )
+
+
+class NoteBatchCreate(SQLModel):
+    items: list[NoteCreate] = Field(min_length=1, max_length=100)
 
 
 class NoteDetail(SQLModel):
@@ -39,3 +50,16 @@ class NoteDetail(SQLModel):
 
     created_at: datetime
     modified_at: datetime
+
+
+class PassageParagraph(SQLModel):
+    index: int = Field(description="index of the paragraph in the passage")
+    text: str
+    notes: list[NoteDetail]
+
+
+class PassageParagraphs(SQLModel):
+    passage_id: str
+    title: str
+    total: int = Field(description="number of paragraphs of the passage")
+    paragraphs: list[PassageParagraph]
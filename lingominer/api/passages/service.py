@@ -0,0 +1,425 @@
+import asyncio
+import hashlib
+import re
+from datetime import timedelta
+from typing import AsyncIterator, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from sqlalchemy import JSON, column, true
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import func, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from lingominer.config import config
+from lingominer.logger import logger
+from lingominer.api.passages.schemas import (
+    NoteDetail,
+    PassageParagraph,
+    PassageParagraphs,
+)
+from lingominer.models.passage import Note, Passage, PassageCache, paragraph_offsets
+from lingominer.services.ai import openai_client
+from lingominer.services.jina import ScrapedPage, scrape_page
+
+CLEAN_PROMPT = """
+    I will provide you with raw web content enclosed in <original_raw_text> tags.
+    Please transform this content into a well-formatted, reader-friendly text following these specifications:
+
+    Format:
+    - Use proper Markdown syntax
+    - Begin with a main title using "# Title" format
+    - Organize content into clear, coherent paragraphs
+    Paragraph Structure:
+    - Each paragraph should contain 2-5 sentences
+    - Maintain optimal paragraph length (roughly 50-100 words)
+    - Ensure smooth transitions between paragraphs
+    - Use appropriate line breaks between paragraphs
+    Text Cleaning:
+    - Remove all HTML tags and formatting
+    - Eliminate redundant spaces and line breaks
+    - Fix any typographical or formatting errors
+    - Preserve only meaningful content
+    Output Requirements:
+    - Produce clean, professional-grade text
+    - Maintain the original message and key information, wording.
+    - Format suitable for print publication (books, newspapers, etc.)
+    - Ensure logical flow and readability
+
+    Please process the content to meet these requirements while preserving the essential information and meaning of the original text.
+    """
+PART_PROMPT = """
+    The raw text is part {part} of {total} of the page, the parts are processed separately and joined afterwards.
+    """
+FIRST_PART_PROMPT = """
+    Begin with the main title of the whole page.
+    """
+NEXT_PART_PROMPT = """
+    It continues the previous part: do not add a title, output only the paragraphs of this part.
+    """
+
+TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ref", "ref_src"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Cache key of a page: lowercase scheme and host, no default port,
+    fragment or tracking parameters, sorted query, no trailing slash.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.startswith("utm_") and key not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def passage_title(content: str) -> str:
+    return content.split("\n")[0].removeprefix("# ")
+
+
+def new_passage(owner_id: str, url: str, title: str, content: str) -> Passage:
+    return Passage(
+        title=title,
+        url=url,
+        content=content,
+        paragraph_offsets=paragraph_offsets(content),
+        user_id=owner_id,
+    )
+
+
+def split_paragraph(paragraph: str, max_chars: int) -> list[str]:
+    """Pieces of a paragraph longer than `max_chars`, cut on lines if possible."""
+    if len(paragraph) <= max_chars:
+        return [paragraph]
+    pieces = []
+    current = ""
+    for line in paragraph.split("\n"):
+        while len(line) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if current and len(current) + 1 + len(line) > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_chunks(text: str, max_chars: int) -> list[str]:
+    """Raw text cut into chunks of whole paragraphs of up to `max_chars`."""
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    chunks = []
+    current = ""
+    for paragraph in paragraphs:
+        for piece in split_paragraph(paragraph, max_chars):
+            if current and len(current) + 2 + len(piece) > max_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks or [text]
+
+
+def chunk_prompt(index: int, total: int) -> str:
+    if total == 1:
+        return CLEAN_PROMPT
+    prompt = CLEAN_PROMPT + PART_PROMPT.format(part=index + 1, total=total)
+    return prompt + (FIRST_PART_PROMPT if index == 0 else NEXT_PART_PROMPT)
+
+
+def chunk_messages(chunk: str, index: int, total: int) -> list[dict]:
+    return [
+        {
+            "role": "system",
+            "content": chunk_prompt(index, total)
+            + "<original_raw_text>"
+            + chunk
+            + "</original_raw_text>",
+        },
+    ]
+
+
+def strip_title(content: str) -> str:
+    """Drop a main title the llm added to a part other than the first."""
+    if content.startswith("# "):
+        return content.partition("\n")[2].lstrip("\n")
+    return content
+
+
+async def clean_chunk(chunk: str, index: int, total: int) -> str:
+    response = await openai_client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=chunk_messages(chunk, index, total),
+    )
+    content = response.choices[0].message.content.strip()
+    return content if index == 0 else strip_title(content)
+
+
+async def clean_chunks(chunks: list[str]) -> AsyncIterator[tuple[int, str]]:
+    """
+    Clean the chunks concurrently, at most `passage_clean_concurrency` at
+    a time, yielding `(index, cleaned)` in the order they complete.
+    """
+    semaphore = asyncio.Semaphore(config.passage_clean_concurrency)
+
+    async def clean(index: int, chunk: str) -> tuple[int, str]:
+        async with semaphore:
+            return index, await clean_chunk(chunk, index, len(chunks))
+
+    tasks = [asyncio.create_task(clean(i, chunk)) for i, chunk in enumerate(chunks)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def visible_text(text: str, index: int, final: bool) -> str:
+    """
+    Part of a cleaned chunk being streamed that is safe to show: what
+    `clean_chunk` would keep, minus trailing whitespace and a possible
+    title that is not complete yet.
+    """
+    text = text.lstrip()
+    if index > 0:
+        if "\n" not in text and "# ".startswith(text[:2]) and not final:
+            return ""
+        text = strip_title(text)
+    return text.strip() if final else text.rstrip()
+
+
+async def stream_chunk(chunk: str, index: int, total: int, queue: asyncio.Queue):
+    try:
+        stream = await openai_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=chunk_messages(chunk, index, total),
+            stream=True,
+        )
+        async for event in stream:
+            if event.choices and event.choices[0].delta.content:
+                queue.put_nowait(event.choices[0].delta.content)
+    finally:
+        queue.put_nowait(None)
+
+
+async def clean_chunks_stream(
+    chunks: list[str],
+) -> AsyncIterator[tuple[str, dict]]:
+    """
+    Clean the chunks like `clean_chunks`, but yield `("title", {"title"})`
+    as soon as the first line is out and `("delta", {"delta"})` for the
+    tokens, in page order. Later chunks are generated concurrently and
+    buffered until the ones before them are streamed.
+    """
+    semaphore = asyncio.Semaphore(config.passage_clean_concurrency)
+    queues = [asyncio.Queue() for _ in chunks]
+
+    async def clean(index: int, chunk: str):
+        async with semaphore:
+            await stream_chunk(chunk, index, len(chunks), queues[index])
+
+    tasks = [asyncio.create_task(clean(i, chunk)) for i, chunk in enumerate(chunks)]
+    try:
+        title_sent = False
+        for index, queue in enumerate(queues):
+            text = ""
+            sent = ""
+            final = False
+            while not final:
+                token = await queue.get()
+                final = token is None
+                if final:
+                    # raises if the completion failed
+                    await tasks[index]
+                else:
+                    text += token
+                shown = visible_text(text, index, final)
+                if len(shown) > len(sent):
+                    delta = shown[len(sent) :]
+                    if index > 0 and not sent:
+                        delta = "\n\n" + delta
+                    sent = shown
+                    yield "delta", {"delta": delta}
+                if index == 0 and not title_sent and ("\n" in sent or final):
+                    title_sent = True
+                    yield "title", {"title": passage_title(sent)}
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def stitch(parts: dict[int, str]) -> str:
+    return "\n\n".join(parts[index] for index in sorted(parts))
+
+
+async def clean_content(raw_text: str) -> str:
+    chunks = split_chunks(raw_text, config.passage_chunk_chars)
+    return stitch({index: part async for index, part in clean_chunks(chunks)})
+
+
+async def revalidate(
+    db_session: AsyncSession, url: str
+) -> tuple[str, Optional[tuple[str, str]], Optional[ScrapedPage]]:
+    """
+    Cache key of `url`, with either the cached title and content when they
+    are still valid, or the freshly scraped page that needs cleaning.
+    A cached page is revalidated with its ETag / Last-Modified once older
+    than `passage_cache_max_age`, the scraped text changing invalidates it.
+    """
+    key = normalize_url(url)
+    fresh = PassageCache.checked_at > func.now() - timedelta(
+        seconds=config.passage_cache_max_age
+    )
+    row = (
+        await db_session.exec(
+            select(PassageCache, fresh.label("fresh")).where(PassageCache.url == key)
+        )
+    ).first()
+    cached, is_fresh = row if row is not None else (None, False)
+    if cached is not None and is_fresh:
+        return key, (cached.title, cached.content), None
+
+    page = await scrape_page(
+        url,
+        etag=cached.etag if cached else None,
+        last_modified=cached.last_modified if cached else None,
+    )
+    if page is None or (
+        cached is not None and cached.content_hash == content_hash(page.text)
+    ):
+        logger.debug(f"Passage cache revalidated {key}")
+        values = {"checked_at": func.now()}
+        if page is not None:
+            values.update(etag=page.etag, last_modified=page.last_modified)
+        await db_session.exec(
+            update(PassageCache).where(PassageCache.url == key).values(**values)
+        )
+        await db_session.commit()
+        return key, (cached.title, cached.content), None
+    return key, None, page
+
+
+async def store_cleaned(
+    db_session: AsyncSession, key: str, page: ScrapedPage, content: str
+) -> tuple[str, str]:
+    """Cache the cleaned `content` of `page`, returns its title and content."""
+    title = passage_title(content)
+    values = {
+        "content_hash": content_hash(page.text),
+        "title": title,
+        "content": content,
+        "etag": page.etag,
+        "last_modified": page.last_modified,
+        "checked_at": func.now(),
+    }
+    # concurrent ingestions of the same page: the last one wins
+    stmt = insert(PassageCache).values(
+        url=key, created_at=func.now(), modified_at=func.now(), **values
+    )
+    await db_session.exec(
+        stmt.on_conflict_do_update(
+            index_elements=[PassageCache.url],
+            set_={**values, "modified_at": func.now()},
+        )
+    )
+    await db_session.commit()
+    return title, content
+
+
+async def ingest_url(db_session: AsyncSession, url: str) -> tuple[str, str]:
+    """
+    Title and cleaned content of the page at `url`. Pages are cleaned once
+    and cached for every user, see `revalidate`.
+    """
+    key, cached, page = await revalidate(db_session, url)
+    if cached is not None:
+        return cached
+    content = await clean_content(page.text)
+    return await store_cleaned(db_session, key, page, content)
+
+
+async def get_paragraphs(
+    db_session: AsyncSession, owner_id: str, passage_id: str, start: int, end: int
+) -> Optional[PassageParagraphs]:
+    """
+    Paragraphs `start` to `end` (excluded) of a passage with their notes,
+    in a single query: only the text of those paragraphs is read, cut from
+    the content with the stored offsets, and the notes come from the
+    `(passage_id, paragraph_index)` index.
+    """
+    offsets = (
+        func.json_array_elements(Passage.paragraph_offsets)
+        .table_valued(column("value", JSON), with_ordinality="position")
+        .render_derived()
+    )
+    paragraph_start = offsets.c.value[0].as_integer()
+    paragraph_end = offsets.c.value[1].as_integer()
+    paragraphs = (
+        select(
+            (offsets.c.position - 1).label("index"),
+            func.substr(
+                Passage.content, paragraph_start + 1, paragraph_end - paragraph_start
+            ).label("text"),
+        )
+        .select_from(offsets)
+        .where(offsets.c.position > start, offsets.c.position <= end)
+        .lateral("paragraph")
+    )
+    stmt = (
+        select(
+            Passage.title,
+            func.json_array_length(Passage.paragraph_offsets).label("total"),
+            paragraphs.c.index,
+            paragraphs.c.text,
+            Note,
+        )
+        .select_from(Passage)
+        .outerjoin(paragraphs, true())
+        .outerjoin(
+            Note,
+            (Note.passage_id == Passage.id)
+            & (Note.paragraph_index == paragraphs.c.index),
+        )
+        .where(Passage.id == passage_id, Passage.user_id == owner_id)
+        .order_by(paragraphs.c.index, Note.start_index)
+    )
+    rows = (await db_session.exec(stmt)).all()
+    if not rows:
+        return None
+
+    by_index: dict[int, PassageParagraph] = {}
+    for row in rows:
+        if row.index is None:
+            # the passage has no paragraph in the range
+            continue
+        if row.index not in by_index:
+            by_index[row.index] = PassageParagraph(
+                index=row.index, text=row.text, notes=[]
+            )
+        if row.Note is not None:
+            by_index[row.index].notes.append(
+                NoteDetail.model_validate(row.Note, from_attributes=True)
+            )
+    return PassageParagraphs(
+        passage_id=passage_id,
+        title=rows[0].title,
+        total=rows[0].total,
+        paragraphs=list(by_index.values()),
+    )
@@ -1,124 +1,167 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
-from typing import Annotated
+import asyncio
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import selectinload
+from sqlmodel import delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Annotated, Optional
 from lingominer.api.auth.security import get_current_user
+from lingominer.api.passages import notes, service
 from lingominer.api.passages.schemas import (
+    NoteBatchCreate,
     NoteCreate,
     NoteDetail,
     PassageDetail,
     PassageList,
+    PassageParagraphs,
 )
+from lingominer.api.sse import sse_event
+from lingominer.config import config
 from lingominer.ctx import user_id
-from lingominer.database import get_db_session
+from lingominer.database import get_db_session, new_session
+from lingominer.exception import ScrapeError
+from lingominer.logger import logger
 from lingominer.models.passage import Note, Passage
-from lingominer.services.ai import openai_client
-from lingominer.services.jina import scrape_url
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
 
 
 @router.post("", response_model=PassageDetail)
-async def create_passage(url: str, session: Session = Depends(get_db_session)):
-    prompt = """
-    I will provide you with raw web content enclosed in <original_raw_text> tags. 
-    Please transform this content into a well-formatted, reader-friendly text following these specifications:
-
-    Format:
-    - Use proper Markdown syntax
-    - Begin with a main title using "# Title" format
-    - Organize content into clear, coherent paragraphs
-    Paragraph Structure:
-    - Each paragraph should contain 2-5 sentences
-    - Maintain optimal paragraph length (roughly 50-100 words)
-    - Ensure smooth transitions between paragraphs
-    - Use appropriate line breaks between paragraphs
-    Text Cleaning:
-    - Remove all HTML tags and formatting
-    - Eliminate redundant spaces and line breaks
-    - Fix any typographical or formatting errors
-    - Preserve only meaningful content
-    Output Requirements:
-    - Produce clean, professional-grade text
-    - Maintain the original message and key information, wording.
-    - Format suitable for print publication (books, newspapers, etc.)
-    - Ensure logical flow and readability
-
-    Please process the content to meet these requirements while preserving the essential information and meaning of the original text.
-    """
-
-    response = await openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": prompt
-                + "<original_raw_text>"
-                + scrape_url(url)
-                + "</original_raw_text>",
-            },
-        ],
-    )
-    content = response.choices[0].message.content
+async def create_passage(url: str, session: AsyncSession = Depends(get_db_session)):
+    try:
+        title, content = await service.ingest_url(session, url)
+    except ScrapeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    title = content.split("\n")[0].removeprefix("# ")
-
-    passage = Passage(
-        title=title,
-        url=url,
-        content=content,
-        user_id=user_id.get(),
-    )
+    passage = service.new_passage(user_id.get(), url, title, content)
     session.add(passage)
-    session.commit()
-    session.refresh(passage)
+    await session.commit()
+    await session.refresh(passage, ["notes"])
     return passage
 
 
+@router.post("/stream")
+async def stream_passage(url: str, session: AsyncSession = Depends(get_db_session)):
+    """
+    Same as `POST /passages`, but answers with Server-Sent Events: `title`
+    as soon as the title is generated, `delta` for the cleaned markdown as
+    it is generated, in order, then `passage` with the persisted passage,
+    or `error` if cleaning failed.
+    """
+    try:
+        key, cached, page = await service.revalidate(session, url)
+    except ScrapeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    chunks = []
+    if cached is None:
+        chunks = service.split_chunks(page.text, config.passage_chunk_chars)
+    # the response body is produced after the request scope is gone
+    owner_id = user_id.get()
+
+    async def event_stream():
+        try:
+            if cached:
+                title, content = cached
+                yield sse_event("title", {"title": title})
+                yield sse_event("delta", {"delta": content})
+            else:
+                content = ""
+                async for event, data in service.clean_chunks_stream(chunks):
+                    if event == "delta":
+                        content += data["delta"]
+                    yield sse_event(event, data)
+                async with new_session() as db_session:
+                    title, content = await service.store_cleaned(
+                        db_session, key, page, content
+                    )
+        except Exception as e:
+            logger.error(f"Passage cleaning failed: {e}")
+            yield sse_event("error", {"error": str(e)})
+            return
+        passage = service.new_passage(owner_id, url, title, content)
+        async with new_session() as db_session:
+            db_session.add(passage)
+            await db_session.commit()
+            await db_session.refresh(passage, ["notes"])
+            yield sse_event(
+                "passage",
+                PassageDetail.model_validate(
+                    passage, from_attributes=True
+                ).model_dump(mode="json"),
+            )
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @router.get("", response_model=list[PassageList])
-async def get_passages(db: Session = Depends(get_db_session)):
-    passages = db.exec(
-        select(Passage).where(Passage.user_id == user_id.get()).limit(5)
+async def get_passages(db: AsyncSession = Depends(get_db_session)):
+    passages = (
+        await db.exec(select(Passage).where(Passage.user_id == user_id.get()).limit(5))
     ).all()
     return passages
 
 
 @router.get("/{passage_id}", response_model=PassageDetail)
-async def get_passage(passage_id: str, session: Session = Depends(get_db_session)):
-    passage = session.exec(
-        select(Passage)
-        .where(Passage.id == passage_id)
-        .where(Passage.user_id == user_id.get())
+async def get_passage(
+    passage_id: str, session: AsyncSession = Depends(get_db_session)
+):
+    passage = (
+        await session.exec(
+            select(Passage)
+            .where(Passage.id == passage_id)
+            .where(Passage.user_id == user_id.get())
+            .options(selectinload(Passage.notes))
+        )
     ).one_or_none()
     if not passage:
         raise HTTPException(status_code=404, detail="Passage not found")
     return passage
 
 
-@router.post("/{passage_id}/notes", response_model=NoteDetail)
-async def create_note(
-    passage_id: str, note_create: NoteCreate, session: Session = Depends(get_db_session)
+@router.get("/{passage_id}/paragraphs", response_model=PassageParagraphs)
+async def get_passage_paragraphs(
+    passage_id: str,
+    session: AsyncSession = Depends(get_db_session),
+    start: Annotated[int, Query(ge=0)] = 0,
+    end: Annotated[Optional[int], Query(ge=1)] = None,
 ):
-    prompt = f"""
-    in the context of the following text, 
-    please explain the meaning of the selected text in a way that is easy to understand.
-    The explanation should be concise and to the point, and should be less then 3 sentences.
-    explain in Chinese.
-    <text>
-    {note_create.context}
-    </text>
-    <selected_text>
-    {note_create.selected_text}
-    </selected_text>
     """
-
-    response = await openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
+    Paragraphs `start` to `end` (excluded, at most 200 at a time) of a
+    passage with the notes on them, to read long passages page by page.
+    """
+    end = start + 50 if end is None else end
+    if not start < end <= start + 200:
+        raise HTTPException(
+            status_code=422, detail="end must be after start, by at most 200"
+        )
+    paragraphs = await service.get_paragraphs(
+        session, user_id.get(), passage_id, start, end
     )
-    note = Note(
+    if paragraphs is None:
+        raise HTTPException(status_code=404, detail="Passage not found")
+    return paragraphs
+
+
+async def check_passage(session: AsyncSession, passage_id: str):
+    """404 unless the passage exists and belongs to the user."""
+    passage = (
+        await session.exec(
+            select(Passage.id)
+            .where(Passage.id == passage_id)
+            .where(Passage.user_id == user_id.get())
+        )
+    ).first()
+    if not passage:
+        raise HTTPException(status_code=404, detail="Passage not found")
+
+
+def new_note(passage_id: str, note_create: NoteCreate, content: str) -> Note:
+    return Note(
         user_id=user_id.get(),
         passage_id=passage_id,
-        content=response.choices[0].message.content,
+        content=content,
         selected_text=note_create.selected_text,
         context=note_create.context,
         paragraph_index=note_create.paragraph_index,
@@ -126,34 +169,80 @@ async def create_note(
         end_index=note_create.end_index,
     )
 
+
+@router.post("/{passage_id}/notes", response_model=NoteDetail)
+async def create_note(
+    passage_id: str,
+    note_create: NoteCreate,
+    session: AsyncSession = Depends(get_db_session),
+):
+    await check_passage(session, passage_id)
+    content = await notes.explain(
+        note_create.selected_text,
+        note_create.context,
+        note_create.language or config.note_language,
+    )
+    note = new_note(passage_id, note_create, content)
+
     session.add(note)
-    session.commit()
-    session.refresh(note)
+    await session.commit()
+    await session.refresh(note)
     return note
 
 
+@router.post("/{passage_id}/notes/batch", response_model=list[NoteDetail])
+async def create_notes_batch(
+    passage_id: str,
+    batch: NoteBatchCreate,
+    session: AsyncSession = Depends(get_db_session),
+):
+    """
+    Create many notes at once. Selections already explained are taken
+    from the cache, the others are explained together in packed
+    completions instead of one completion each.
+    """
+    await check_passage(session, passage_id)
+    by_language: dict[str, list[int]] = {}
+    for i, item in enumerate(batch.items):
+        by_language.setdefault(item.language or config.note_language, []).append(i)
+    explanations = await asyncio.gather(
+        *(
+            notes.explain_many(
+                [
+                    (batch.items[i].selected_text, batch.items[i].context)
+                    for i in indexes
+                ],
+                language,
+            )
+            for language, indexes in by_language.items()
+        )
+    )
+    contents = {}
+    for indexes, results in zip(by_language.values(), explanations):
+        contents.update(zip(indexes, results))
+
+    created = [
+        new_note(passage_id, item, contents[i]) for i, item in enumerate(batch.items)
+    ]
+    session.add_all(created)
+    await session.commit()
+    return created
+
+
 @router.delete("/{passage_id}", status_code=200)
 async def delete_passage(
     passage_id: str,
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
 ):
-    # delete all notes for the passage
-    notes = db_session.exec(
-        select(Note)
-        .where(Note.passage_id == passage_id)
-        .where(Note.user_id == user_id.get())
-    ).all()
-    for note in notes:
-        db_session.delete(note)
-    db_session.commit()
-
-    passage = db_session.exec(
-        select(Passage)
-        .where(Passage.id == passage_id)
-        .where(Passage.user_id == user_id.get())
-    ).one_or_none()
-    if not passage:
-        raise HTTPException(status_code=404, detail="Passage not found")
-    db_session.delete(passage)
-    db_session.commit()
+    start = time.perf_counter()
+    await check_passage(db_session, passage_id)
+    notes_deleted = await db_session.exec(
+        delete(Note).where(Note.passage_id == passage_id)
+    )
+    await db_session.exec(delete(Passage).where(Passage.id == passage_id))
+    await db_session.commit()
+    logger.info(
+        f"Deleted passage {passage_id} with {notes_deleted.rowcount} notes "
+        f"in {(time.perf_counter() - start) * 1000:.1f}ms"
+    )
     return {"message": "Passage deleted successfully"}
@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from lingominer.flow.algo import FieldDefinition, Task
+from lingominer.models.template import Generation, Template
+
+
+@dataclass(frozen=True)
+class FlowPlan:
+    """The tasks of a template, ready to be added to a `Flow`."""
+
+    template_id: str
+    updated_at: datetime
+    tasks: tuple[Task, ...]
+
+
+# template id -> plan of the template at `plan.updated_at`.
+# Every change to a template, its generations or fields bumps
+# `Template.updated_at`, so plans compiled by other processes go stale too.
+_plans: dict[str, FlowPlan] = {}
+
+
+async def compile_plan(db_session: AsyncSession, template: Template) -> FlowPlan:
+    generations = (
+        await db_session.exec(
+            select(Generation)
+            .where(Generation.template_id == template.id)
+            .options(
+                selectinload(Generation.inputs), selectinload(Generation.outputs)
+            )
+            .order_by(Generation.created_at)
+        )
+    ).all()
+    tasks = tuple(
+        Task(
+            id=generation.id,
+            name=generation.name,
+            action=generation.method,
+            inputs=[f.name for f in generation.inputs],
+            outputs=[
+                FieldDefinition(
+                    name=f.name,
+                    type=f.type,
+                    description=f.description,
+                )
+                for f in generation.outputs
+            ],
+            prompt=generation.prompt,
+        )
+        for generation in generations
+    )
+    return FlowPlan(
+        template_id=template.id, updated_at=template.updated_at, tasks=tasks
+    )
+
+
+async def get_plan(db_session: AsyncSession, template: Template) -> FlowPlan:
+    plan = _plans.get(template.id)
+    if plan is None or plan.updated_at != template.updated_at:
+        plan = await compile_plan(db_session, template)
+        _plans[template.id] = plan
+    return plan
+
+
+def invalidate_plan(template_id: str):
+    _plans.pop(template_id, None)
@@ -1,8 +1,13 @@
+import time
+from datetime import datetime, timezone
 from typing import Optional
 
 from fastapi import HTTPException
-from sqlmodel import Session, select
+from sqlalchemy.orm import selectinload
+from sqlmodel import delete, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from lingominer.api.templates.plan import invalidate_plan
 from lingominer.api.templates.schema import (
     GenerationCreate,
     GenerationUpdate,
@@ -12,80 +17,139 @@ from lingominer.api.templates.schema import (
 )
 from lingominer.config import CARD_DEFAULT_FIELDS
 from lingominer.ctx import user_id
+from lingominer.exception import ResourceConflict
 from lingominer.logger import logger
-from lingominer.models.template import Generation, Template, TemplateField, TemplateLang
+from lingominer.models.card import Card
+from lingominer.models.template import (
+    Generation,
+    GenerationInputFieldLink,
+    Template,
+    TemplateField,
+    TemplateLang,
+)
 
 # Template
 
 
-def create_template(db_session: Session, template_create: TemplateCreate):
+async def create_template(
+    db_session: AsyncSession, template_create: TemplateCreate
+):
     template_model = Template(
         name=template_create.name, lang=template_create.lang, user_id=user_id.get()
     )
     db_session.add(template_model)
-    db_session.commit()
-    db_session.refresh(template_model)
+    await db_session.commit()
+    await db_session.refresh(template_model, ["fields", "generations"])
     return template_model
 
 
-def get_templates(db_session: Session):
+async def touch_template(db_session: AsyncSession, template_id: str):
+    """Bump `updated_at` so compiled flow plans of the template go stale."""
+    await db_session.exec(
+        update(Template)
+        .where(Template.id == template_id)
+        .values(updated_at=datetime.now(timezone.utc))
+    )
+    invalidate_plan(template_id)
+
+
+async def get_templates(db_session: AsyncSession):
     stmt = select(Template)
-    templates = db_session.exec(stmt).all()
+    templates = (await db_session.exec(stmt)).all()
     return templates
 
 
-def get_template(db_session: Session, template_id: str):
+async def get_template(
+    db_session: AsyncSession, template_id: str, detail: bool = False
+):
     stmt = select(Template).where(Template.id == template_id)
-    template = db_session.exec(stmt).first()
+    if detail:
+        stmt = stmt.options(
+            selectinload(Template.fields), selectinload(Template.generations)
+        )
+    template = (await db_session.exec(stmt)).first()
     return template
 
 
-def get_template_by_lang(db_session: Session, lang: TemplateLang):
+async def get_template_by_lang(db_session: AsyncSession, lang: TemplateLang):
     stmt = select(Template).where(Template.lang == lang)
-    template = db_session.exec(stmt).first()
+    template = (await db_session.exec(stmt)).first()
     return template
 
 
-def delete_template(db_session: Session, template_id: str):
-    # Check if template exists
-    stmt = select(Template).where(Template.id == template_id)
-    template = db_session.exec(stmt).first()
+async def delete_template_rows(db_session: AsyncSession, template_ids) -> dict:
+    """
+    Delete templates with their generations, fields and the links between
+    them, one `DELETE ... WHERE` per table. `template_ids` is a list of
+    ids or a select of them. Doesn't commit; returns the deleted counts.
+    """
+    generation_ids = select(Generation.id).where(
+        Generation.template_id.in_(template_ids)
+    )
+    field_ids = select(TemplateField.id).where(
+        TemplateField.template_id.in_(template_ids)
+    )
+    links = await db_session.exec(
+        delete(GenerationInputFieldLink).where(
+            GenerationInputFieldLink.generation_id.in_(generation_ids)
+            | GenerationInputFieldLink.field_id.in_(field_ids)
+        )
+    )
+    # fields reference the generation they are the output of
+    fields = await db_session.exec(
+        delete(TemplateField).where(TemplateField.template_id.in_(template_ids))
+    )
+    generations = await db_session.exec(
+        delete(Generation).where(Generation.template_id.in_(template_ids))
+    )
+    templates = await db_session.exec(
+        delete(Template).where(Template.id.in_(template_ids))
+    )
+    return {
+        "templates": templates.rowcount,
+        "generations": generations.rowcount,
+        "fields": fields.rowcount,
+        "links": links.rowcount,
+    }
+
+
+async def delete_template(db_session: AsyncSession, template_id: str):
+    start = time.perf_counter()
+    template = await get_template(db_session, template_id)
     if template is None:
         logger.warning(f"Template {template_id} not found")
         return
 
-    # Check if any cards are using this template
-
-    # Delete all GenerationInputFieldLink entries for this template's generations
-    for generation in template.generations:
-        generation.inputs.clear()
-
-    # Delete all TemplateFields
-    for field in template.fields:
-        db_session.delete(field)
-
-    # Delete all Generations
-    for generation in template.generations:
-        db_session.delete(generation)
-
-    # Finally delete the template
-    db_session.delete(template)
-
-    # Commit all changes
-    db_session.commit()
+    in_use = (
+        await db_session.exec(
+            select(Card.id).where(Card.template_id == template_id).limit(1)
+        )
+    ).first()
+    if in_use is not None:
+        raise ResourceConflict("Template is used by cards")
+
+    counts = await delete_template_rows(db_session, [template_id])
+    await db_session.commit()
+    invalidate_plan(template_id)
+    logger.info(
+        f"Deleted template {template_id} {counts} "
+        f"in {(time.perf_counter() - start) * 1000:.1f}ms"
+    )
 
 
 # Generation
 
 
-def add_generation(
-    db_session: Session, template_id: str, generation_input: GenerationCreate
+async def add_generation(
+    db_session: AsyncSession, template_id: str, generation_input: GenerationCreate
 ):
     # validate inputs
-    fields_available = db_session.exec(
-        select(TemplateField).where(
-            TemplateField.name.in_(generation_input.inputs)
-            & (TemplateField.template_id == template_id)
+    fields_available = (
+        await db_session.exec(
+            select(TemplateField).where(
+                TemplateField.name.in_(generation_input.inputs)
+                & (TemplateField.template_id == template_id)
+            )
         )
     ).all()
     keys_available = set([f.name for f in fields_available])
@@ -107,37 +171,42 @@ def add_generation(
         user_id=user_id.get(),
     )
     db_session.add(generation_model)
-    db_session.commit()
-    db_session.refresh(generation_model)
+    await touch_template(db_session, template_id)
+    await db_session.commit()
+    await db_session.refresh(generation_model, ["inputs", "outputs"])
     return generation_model
 
 
-def get_generation(
-    db_session: Session,
+async def get_generation(
+    db_session: AsyncSession,
     generation_id: str,
     template_id: str,
 ):
-    stmt = select(Generation).where(
-        Generation.id == generation_id, Generation.template_id == template_id
+    stmt = (
+        select(Generation)
+        .where(Generation.id == generation_id, Generation.template_id == template_id)
+        .options(selectinload(Generation.inputs), selectinload(Generation.outputs))
     )
-    generation = db_session.exec(stmt).one_or_none()
+    generation = (await db_session.exec(stmt)).one_or_none()
     return generation
 
 
-def update_generation(
-    db_session: Session,
+async def update_generation(
+    db_session: AsyncSession,
     generation_id: str,
     template_id: str,
     generation_update: GenerationUpdate,
 ) -> Optional[Generation]:
-    generation = get_generation(db_session, generation_id, template_id)
+    generation = await get_generation(db_session, generation_id, template_id)
     if not generation:
         return None
 
-    fields_available = db_session.exec(
-        select(TemplateField).where(
-            TemplateField.name.in_(generation_update.inputs)
-            & (TemplateField.template_id == template_id)
+    fields_available = (
+        await db_session.exec(
+            select(TemplateField).where(
+                TemplateField.name.in_(generation_update.inputs)
+                & (TemplateField.template_id == template_id)
+            )
         )
     ).all()
 
@@ -158,18 +227,24 @@ def update_generation(
         setattr(generation, key, value)
 
     db_session.add(generation)
-    db_session.commit()
-    db_session.refresh(generation)
+    await touch_template(db_session, template_id)
+    await db_session.commit()
+    await db_session.refresh(generation, ["inputs", "outputs"])
     return generation
 
 
-def delete_generation(
-    db_session: Session, template_id: str, generation_id: str
+async def delete_generation(
+    db_session: AsyncSession, template_id: str, generation_id: str
 ) -> None:
-    stmt = select(Generation).where(
-        Generation.id == generation_id, Generation.template_id == template_id
+    stmt = (
+        select(Generation)
+        .where(Generation.id == generation_id, Generation.template_id == template_id)
+        .options(
+            selectinload(Generation.inputs),
+            selectinload(Generation.outputs).selectinload(TemplateField.referenced),
+        )
     )
-    generation = db_session.exec(stmt).one_or_none()
+    generation = (await db_session.exec(stmt)).one_or_none()
     if generation is None:
         logger.warning(f"Generation {generation_id} not found")
         return
@@ -178,16 +253,17 @@ def delete_generation(
         if field.referenced:
             logger.error(f"field {field.name} is used by other generation")
             return
-        db_session.delete(field)
-    db_session.delete(generation)
-    db_session.commit()
+        await db_session.delete(field)
+    await db_session.delete(generation)
+    await touch_template(db_session, template_id)
+    await db_session.commit()
 
 
 # Template Field
 
 
-def create_template_field(
-    db_session: Session,
+async def create_template_field(
+    db_session: AsyncSession,
     template_id: str,
     field_create: TemplateFieldCreate,
 ) -> Optional[TemplateField]:
@@ -200,13 +276,14 @@ def create_template_field(
         source_id=field_create.generation_id,
     )
     db_session.add(field)
-    db_session.commit()
-    db_session.refresh(field)
+    await touch_template(db_session, template_id)
+    await db_session.commit()
+    await db_session.refresh(field)
     return field
 
 
-def get_template_field(
-    db_session: Session,
+async def get_template_field(
+    db_session: AsyncSession,
     template_id: str,
     field_id: str,
 ) -> Optional[TemplateField]:
@@ -214,16 +291,16 @@ def get_template_field(
         TemplateField.id == field_id,
         TemplateField.template_id == template_id,
     )
-    return db_session.exec(stmt).one_or_none()
+    return (await db_session.exec(stmt)).one_or_none()
 
 
-def update_template_field(
-    db_session: Session,
+async def update_template_field(
+    db_session: AsyncSession,
     template_id: str,
     field_id: str,
     field_update: TemplateFieldUpdate,
 ) -> Optional[TemplateField]:
-    field = get_template_field(db_session, template_id, field_id)
+    field = await get_template_field(db_session, template_id, field_id)
     if not field:
         return None
 
@@ -232,24 +309,27 @@ def update_template_field(
         setattr(field, key, value)
 
     db_session.add(field)
-    db_session.commit()
-    db_session.refresh(field)
+    await touch_template(db_session, template_id)
+    await db_session.commit()
+    await db_session.refresh(field)
     return field
 
 
-def delete_template_field(
-    db_session: Session,
+async def delete_template_field(
+    db_session: AsyncSession,
     template_id: str,
     field_id: str,
 ) -> bool:
-    field = get_template_field(db_session, template_id, field_id)
+    field = await get_template_field(db_session, template_id, field_id)
     if not field:
         return False
 
+    await db_session.refresh(field, ["referenced"])
     if field.referenced:
         logger.error(f"field {field.name} is used by other generation")
         return False
 
-    db_session.delete(field)
-    db_session.commit()
+    await db_session.delete(field)
+    await touch_template(db_session, template_id)
+    await db_session.commit()
     return True
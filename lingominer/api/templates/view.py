@@ -1,7 +1,7 @@
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from lingominer.api.auth.security import get_current_user
 from lingominer.api.templates import service as db
@@ -26,27 +26,27 @@ router = APIRouter(dependencies=[Depends(get_current_user)])
 
 @router.post("", response_model=TemplateDetailResponse)
 async def create_template_view(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     template_create: TemplateCreate,
 ):
-    template = db.create_template(db_session, template_create)
+    template = await db.create_template(db_session, template_create)
     return template
 
 
 @router.get("", response_model=list[TemplateResponse])
 async def get_templates(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
 ):
-    templates = db.get_templates(db_session)
+    templates = await db.get_templates(db_session)
     return templates
 
 
 @router.get("/{template_id}", response_model=TemplateDetailResponse)
 async def get_template_view(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     template_id: str,
 ):
-    template = db.get_template(db_session, template_id)
+    template = await db.get_template(db_session, template_id, detail=True)
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
     return template
@@ -54,11 +54,11 @@ async def get_template_view(
 
 @router.delete("/{template_id}")
 async def delete_template_view(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     template_id: str,
 ):
     try:
-        db.delete_template(db_session, template_id)
+        await db.delete_template(db_session, template_id)
     except ResourceConflict as e:
         raise HTTPException(status_code=409, detail=str(e))
 
@@ -68,11 +68,11 @@ async def delete_template_view(
 
 @router.post("/{template_id}/generations", response_model=GenerationDetailResponse)
 async def create_generation_view(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     template_id: str,
     generation_create: GenerationCreate,
 ):
-    generation = db.add_generation(db_session, template_id, generation_create)
+    generation = await db.add_generation(db_session, template_id, generation_create)
     return generation
 
 
@@ -81,11 +81,11 @@ async def create_generation_view(
     response_model=GenerationDetailResponse,
 )
 async def get_generation_view(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     template_id: str,
     generation_id: str,
 ):
-    generation = db.get_generation(db_session, generation_id, template_id)
+    generation = await db.get_generation(db_session, generation_id, template_id)
     if not generation:
         raise HTTPException(status_code=404, detail="Generation not found")
     return generation
@@ -96,12 +96,12 @@ async def get_generation_view(
     response_model=GenerationDetailResponse,
 )
 async def patch_generation_view(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     template_id: str,
     generation_id: str,
     generation_update: GenerationUpdate,
 ):
-    generation = db.update_generation(
+    generation = await db.update_generation(
         db_session, generation_id, template_id, generation_update
     )
     if not generation:
@@ -111,11 +111,11 @@ async def patch_generation_view(
 
 @router.delete("/{template_id}/generations/{generation_id}")
 async def delete_generation_view(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     template_id: str,
     generation_id: str,
 ):
-    db.delete_generation(db_session, template_id, generation_id)
+    await db.delete_generation(db_session, template_id, generation_id)
 
 
 # Template Fields
@@ -123,11 +123,11 @@ async def delete_generation_view(
 
 @router.post("/{template_id}/fields", response_model=TemplateFieldResponse)
 async def create_template_field_view(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     template_id: str,
     field_create: TemplateFieldCreate,
 ):
-    field = db.create_template_field(db_session, template_id, field_create)
+    field = await db.create_template_field(db_session, template_id, field_create)
     if not field:
         raise HTTPException(status_code=404, detail="Template not found")
     return field
@@ -135,12 +135,14 @@ async def create_template_field_view(
 
 @router.patch("/{template_id}/fields/{field_id}", response_model=TemplateFieldResponse)
 async def update_template_field_view(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     template_id: str,
     field_id: str,
     field_update: TemplateFieldUpdate,
 ):
-    field = db.update_template_field(db_session, template_id, field_id, field_update)
+    field = await db.update_template_field(
+        db_session, template_id, field_id, field_update
+    )
     if not field:
         raise HTTPException(status_code=404, detail="Field not found")
     return field
@@ -148,10 +150,10 @@ async def update_template_field_view(
 
 @router.delete("/{template_id}/fields/{field_id}")
 async def delete_template_field_view(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     template_id: str,
     field_id: str,
 ):
-    success = db.delete_template_field(db_session, template_id, field_id)
+    success = await db.delete_template_field(db_session, template_id, field_id)
     if not success:
         raise HTTPException(status_code=404, detail="Field not found or in use")
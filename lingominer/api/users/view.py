@@ -1,11 +1,26 @@
+import time
 import uuid
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
-
-from lingominer.api.auth.security import get_admin
+from sqlmodel import delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from lingominer.api.auth.security import (
+    api_key_hash,
+    forget_api_key,
+    forget_user,
+    get_admin,
+)
+from lingominer.api.templates.plan import invalidate_plan
+from lingominer.api.templates.service import delete_template_rows
 from lingominer.database import get_db_session
+from lingominer.logger import logger
+from lingominer.models.card import Card
+from lingominer.models.job import CardJob
+from lingominer.models.mochi import MochiMapping
+from lingominer.models.passage import Note, Passage
+from lingominer.models.template import Template
 from lingominer.models.user import ApiKey, User
 
 router = APIRouter(dependencies=[Depends(get_admin)])
@@ -13,73 +28,112 @@ router = APIRouter(dependencies=[Depends(get_admin)])
 
 @router.get("")
 async def get_users(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
 ):
-    return db_session.exec(select(User)).all()
+    return (await db_session.exec(select(User))).all()
 
 
 @router.post("")
 async def create_user(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     name: str,
 ):
     user = User(name=name)
     db_session.add(user)
-    db_session.commit()
+    await db_session.commit()
     return user
 
 
 @router.get("/{user_id}")
 async def get_user(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     user_id: str,
 ):
-    return db_session.exec(select(User).where(User.id == user_id)).first()
+    return (await db_session.exec(select(User).where(User.id == user_id))).first()
 
 
 @router.delete("/{user_id}")
 async def delete_user(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     user_id: str,
 ):
-    user = db_session.exec(select(User).where(User.id == user_id)).first()
+    start = time.perf_counter()
+    user = (await db_session.exec(select(User.id).where(User.id == user_id))).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    db_session.delete(user)
-    db_session.commit()
+    template_ids = (
+        await db_session.exec(select(Template.id).where(Template.user_id == user_id))
+    ).all()
+    shared = (
+        await db_session.exec(
+            select(Card.id)
+            .where(Card.template_id.in_(template_ids), Card.user_id != user_id)
+            .limit(1)
+        )
+    ).first()
+    if shared is not None:
+        raise HTTPException(
+            status_code=409, detail="Templates of the user are used by other users"
+        )
+
+    counts = {}
+    for model in (CardJob, Card, Note, Passage, MochiMapping):
+        result = await db_session.exec(delete(model).where(model.user_id == user_id))
+        counts[model.__tablename__] = result.rowcount
+    counts.update(await delete_template_rows(db_session, template_ids))
+    result = await db_session.exec(delete(ApiKey).where(ApiKey.user_id == user_id))
+    counts["apikeys"] = result.rowcount
+    await db_session.exec(delete(User).where(User.id == user_id))
+    await db_session.commit()
+
+    forget_user(user_id)
+    for template_id in template_ids:
+        invalidate_plan(template_id)
+    logger.info(
+        f"Deleted user {user_id} {counts} "
+        f"in {(time.perf_counter() - start) * 1000:.1f}ms"
+    )
     return {"message": "User deleted"}
 
 
 @router.get("/{user_id}/api-keys")
 async def get_api_keys(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     user_id: str,
 ):
-    return db_session.exec(select(ApiKey).where(ApiKey.user_id == user_id)).all()
+    return (
+        await db_session.exec(select(ApiKey).where(ApiKey.user_id == user_id))
+    ).all()
 
 
 @router.post("/{user_id}/api-keys")
 async def create_api_key(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     user_id: str,
 ):
-    api_key = ApiKey(key=f"sk-{uuid.uuid4().hex}{uuid.uuid4().hex}", user_id=user_id)
+    # only the hash is stored, the key is shown this once
+    key = f"sk-{uuid.uuid4().hex}{uuid.uuid4().hex}"
+    api_key = ApiKey(key_prefix=key[:7], key_hash=api_key_hash(key), user_id=user_id)
     db_session.add(api_key)
-    db_session.commit()
-    return {"key": api_key.key}
+    await db_session.commit()
+    forget_user(user_id)
+    return {"key": key}
 
 
-@router.delete("/users/{user_id}/api-keys/{api_key_id}")
+@router.delete("/{user_id}/api-keys/{api_key_id}")
 async def delete_api_key(
-    db_session: Annotated[Session, Depends(get_db_session)],
+    db_session: Annotated[AsyncSession, Depends(get_db_session)],
     user_id: str,
     api_key_id: str,
 ):
-    api_key = db_session.exec(
-        select(ApiKey).where(ApiKey.id == api_key_id, ApiKey.user_id == user_id)
+    api_key = (
+        await db_session.exec(
+            select(ApiKey).where(ApiKey.id == api_key_id, ApiKey.user_id == user_id)
+        )
     ).first()
     if not api_key:
         raise HTTPException(status_code=404, detail="API key not found")
-    db_session.delete(api_key)
-    db_session.commit()
+    await db_session.delete(api_key)
+    await db_session.commit()
+    forget_api_key(api_key.key_hash)
     return {"message": "API key deleted"}
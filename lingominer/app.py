@@ -1,18 +1,44 @@
-from fastapi import FastAPI, Request
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 
+from lingominer.api.cards.embeddings import start_batcher, stop_batcher
+from lingominer.api.cards.jobs import start_workers
 from lingominer.api.cards.view import router as cards_router
 from lingominer.api.passages.view import router as passages_router
 from lingominer.api.templates.view import router as templates_router
 from lingominer.api.users.view import router as users_router
+from lingominer.api.auth.security import get_admin
 from lingominer.api.auth.views import router as auth_router
 from lingominer.api.mochi.view import router as mochi_router
-from lingominer.database import get_db_session
+from lingominer import metrics
+from lingominer.config import config
+from lingominer.database import engine, get_db_session
 from lingominer.logger import logger
+from lingominer.services.jina import close_client as close_scrape_client
+from lingominer.services.mochi import close_client as close_mochi_client
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_batcher()
+    workers = start_workers(config.card_job_workers)
+    yield
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    await stop_batcher()
+    await close_scrape_client()
+    await close_mochi_client()
+    await engine.dispose()
+
 
 app = FastAPI(
     title="api",
+    lifespan=lifespan,
 )
 
 app.include_router(templates_router, prefix="/templates", tags=["templates"])
@@ -22,6 +48,16 @@ app.include_router(passages_router, prefix="/passages", tags=["passages"])
 app.include_router(auth_router, prefix="/me", tags=["me"])
 app.include_router(mochi_router, prefix="/mochi", tags=["mochi"])
 
+
+@app.get(
+    "/metrics", response_class=PlainTextResponse, dependencies=[Depends(get_admin)]
+)
+async def get_metrics():
+    """Process metrics in the Prometheus text format."""
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4"
+    )
+
 origins = ["*"]
 
 app.add_middleware(
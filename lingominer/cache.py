@@ -0,0 +1,67 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """In-process cache keeping the `maxsize` most recently used entries."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.entries: OrderedDict[K, V] = OrderedDict()
+
+    def get(self, key: K) -> Optional[V]:
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def set(self, key: K, value: V):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def pop(self, key: K):
+        self.entries.pop(key, None)
+
+    def pop_where(self, predicate: Callable[[V], bool]):
+        """Drop the entries whose value matches `predicate`."""
+        for key, value in list(self.entries.items()):
+            if predicate(value):
+                self.entries.pop(key)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class TTLCache(LRUCache[K, V]):
+    """`LRUCache` whose entries also expire `ttl` seconds after being set."""
+
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key: K) -> Optional[V]:
+        entry = super().get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self.pop(key)
+            return None
+        return value
+
+    def set(self, key: K, value: V):
+        super().set(key, (time.monotonic() + self.ttl, value))
+
+    def pop_where(self, predicate: Callable[[V], bool]):
+        for key, (_, value) in list(self.entries.items()):
+            if predicate(value):
+                self.pop(key)
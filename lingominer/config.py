@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Optional
+from typing import Literal, Optional
 
 from dotenv import load_dotenv
 from pydantic import Field
@@ -12,6 +12,10 @@ class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_prefix="LINGOMINER_")
 
     auth_key: str = Field(description="access key to lingominer api")
+    api_key_secret: str = Field(
+        description="secret the api keys are hashed with, changing it "
+        "invalidates every api key"
+    )
 
     llm_base_url: str = "https://api.openai.com/v1"
     llm_api_key: str
@@ -19,12 +23,146 @@ class Settings(BaseSettings):
 
     jina_api_key: str
 
+    scrape_backend: Literal["jina", "local"] = Field(
+        default="jina", description="`local` fetches and extracts pages itself"
+    )
+    scrape_timeout: float = 30.0
+    scrape_connect_timeout: float = 5.0
+    scrape_max_connections: int = 20
+    scrape_max_keepalive_connections: int = 10
+    scrape_http2: bool = Field(
+        default=False, description="needs the `h2` package (httpx[http2])"
+    )
+    scrape_user_agent: str = "Mozilla/5.0 (compatible; lingominer)"
+    scrape_max_bytes: int = Field(
+        default=5_000_000, description="largest page body read, in bytes"
+    )
+    scrape_max_redirects: int = 5
+    passage_cache_max_age: int = Field(
+        default=3600, description="seconds a cached page is used without revalidation"
+    )
+    note_language: str = Field(
+        default="Chinese", description="language notes are explained in"
+    )
+    note_cache_size: int = 4096
+
+    passage_chunk_chars: int = Field(
+        default=8000, description="raw text cleaned per completion"
+    )
+    passage_clean_concurrency: int = Field(
+        default=4, description="chunks of a passage cleaned at once"
+    )
+
+    mochi_base_url: str = "https://app.mochi.cards/api"
+    mochi_timeout: float = 15.0
+    mochi_connect_timeout: float = 5.0
+    mochi_max_connections: int = 10
+    mochi_max_keepalive_connections: int = 5
+    mochi_rate: float = Field(
+        default=1.0, description="requests per second sent for one mochi api key"
+    )
+    mochi_burst: int = Field(
+        default=5, description="requests one mochi api key may send at once"
+    )
+    mochi_max_retries: int = Field(
+        default=3, description="retries of a request mochi answered 429 or 5xx"
+    )
+    mochi_retry_backoff: float = Field(
+        default=0.5, description="seconds before the first retry, doubled after"
+    )
+    mochi_retry_max_wait: float = Field(
+        default=30.0, description="longest wait between retries, even if asked more"
+    )
+
     database_host: Optional[str] = None
     database_port: Optional[int] = 3306
     database_user: Optional[str] = None
     database_password: Optional[str] = None
     database_db: Optional[str] = "lingominer"
-
+    database_pool_size: int = Field(
+        default=10, description="connections kept open per process"
+    )
+    database_max_overflow: int = Field(
+        default=20, description="extra connections opened under load"
+    )
+    database_pool_timeout: float = Field(
+        default=30.0, description="seconds to wait for a free connection"
+    )
+    database_pool_recycle: int = Field(
+        default=1800, description="seconds before a connection is replaced"
+    )
+    database_pool_pre_ping: bool = Field(
+        default=True, description="check connections before handing them out"
+    )
+    database_statement_timeout: Optional[int] = Field(
+        default=30000, description="server side statement timeout in ms"
+    )
+    database_prepare_threshold: Optional[int] = Field(
+        default=5,
+        description="executions before psycopg prepares a statement, "
+        "None disables prepared statements (e.g. behind pgbouncer)",
+    )
+
+    auth_cache_ttl: float = Field(
+        default=60.0,
+        description="seconds an api key stays cached, bounds how long other "
+        "processes accept a deleted key",
+    )
+    auth_cache_size: int = 4096
+
+    lang_detect_min_confidence: float = Field(
+        default=0.3, description="below it, the llm detects the language instead"
+    )
+    lang_detect_cache_size: int = 4096
+
+    embedding_backend: Literal["openai", "local"] = Field(
+        default="openai", description="`local` hashes features, for tests"
+    )
+    embedding_model: str = "text-embedding-3-small"
+    embedding_dimensions: int = 1024
+    embedding_batch_size: int = 64
+    embedding_flush_interval: float = Field(
+        default=1.0, description="seconds to wait for more cards to embed together"
+    )
+    embedding_backfill_interval: float = Field(
+        default=1.0, description="pause in seconds between backfilled batches"
+    )
+
+    card_search_ef_search: int = Field(
+        default=40, description="hnsw candidate list size, recall vs speed"
+    )
+    card_search_iterative_scan: Optional[str] = Field(
+        default=None,
+        description="hnsw.iterative_scan so user filtering still returns enough "
+        "rows, e.g. `relaxed_order`; needs pgvector>=0.8, older versions reject "
+        "the setting",
+    )
+
+    card_import_chunk_size: int = Field(
+        default=5000, description="rows written per COPY of an import"
+    )
+
+    card_job_workers: int = Field(
+        default=2, description="card generation workers started with the api"
+    )
+    card_job_poll_interval: float = 1.0
+    card_job_stale_after: int = Field(
+        default=300, description="seconds before a running job is retried"
+    )
+    card_job_max_attempts: int = 3
+
+    regenerate_concurrency: int = Field(
+        default=2, description="cards regenerated at once by a template job"
+    )
+    regenerate_interval: float = Field(
+        default=0.5, description="pause in seconds after each regenerated card"
+    )
+
+    completion_pack_window: float = Field(
+        default=0.05, description="seconds to wait for completions to pack together"
+    )
+    completion_pack_max_items: int = 8
+    completion_pack_token_budget: int = 6000
 
 
 config = Settings()
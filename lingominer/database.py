@@ -1,13 +1,48 @@
-from sqlmodel import Session, create_engine
+import time
+
+from sqlalchemy import URL, event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 import lingominer.models as models  # noqa
+from lingominer import metrics
 from lingominer.config import config
 
+held_seconds = metrics.histogram(
+    "lingominer_db_pool_held_seconds",
+    "Time a database connection stays checked out of the pool.",
+    [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30],
+)
+
+
+def database_url() -> URL:
+    return URL.create(
+        "postgresql+psycopg",
+        username=config.database_user,
+        password=config.database_password,
+        host=config.database_host,
+        port=config.database_port,
+        database=config.database_db,
+    )
+
+
+def connect_args() -> dict:
+    args = {"prepare_threshold": config.database_prepare_threshold}
+    if config.database_statement_timeout is not None:
+        args["options"] = f"-c statement_timeout={config.database_statement_timeout}"
+    return args
+
 
 def init_database_engine():
-    engine = create_engine(
-        f"postgresql+psycopg://{config.database_user}:{config.database_password}@{config.database_host}:{config.database_port}/{config.database_db}",
+    engine = create_async_engine(
+        database_url(),
         echo=False,
+        pool_size=config.database_pool_size,
+        max_overflow=config.database_max_overflow,
+        pool_timeout=config.database_pool_timeout,
+        pool_recycle=config.database_pool_recycle,
+        pool_pre_ping=config.database_pool_pre_ping,
+        connect_args=connect_args(),
     )
 
     return engine
@@ -16,6 +51,47 @@ def init_database_engine():
 engine = init_database_engine()
 
 
+# The pool has no event before a checkout, so the wait itself isn't timed:
+# checkouts queue once `lingominer_db_pool_in_use` reaches the pool size
+# plus overflow, for as long as the held connections stay checked out.
+@event.listens_for(engine.sync_engine, "checkout")
+def on_checkout(dbapi_connection, connection_record, connection_proxy):
+    connection_record.info["checked_out_at"] = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "checkin")
+def on_checkin(dbapi_connection, connection_record):
+    checked_out_at = connection_record.info.pop("checked_out_at", None)
+    if checked_out_at is not None:
+        held_seconds.observe(time.perf_counter() - checked_out_at)
+
+metrics.gauge(
+    "lingominer_db_pool_size",
+    "Connections the pool keeps open.",
+    lambda: engine.sync_engine.pool.size(),
+)
+metrics.gauge(
+    "lingominer_db_pool_in_use",
+    "Connections currently checked out of the pool.",
+    lambda: engine.sync_engine.pool.checkedout(),
+)
+metrics.gauge(
+    "lingominer_db_pool_idle",
+    "Open connections waiting in the pool.",
+    lambda: engine.sync_engine.pool.checkedin(),
+)
+metrics.gauge(
+    "lingominer_db_pool_overflow",
+    "Connections opened beyond the pool size.",
+    lambda: max(engine.sync_engine.pool.overflow(), 0),
+)
+
+
+def new_session() -> AsyncSession:
+    # objects stay usable after commit, reloading them would need an await
+    return AsyncSession(engine, autoflush=False, expire_on_commit=False)
+
+
 async def get_db_session():
-    with Session(engine, autoflush=False) as session:
+    async with new_session() as session:
         yield session
@@ -13,3 +13,14 @@ class ResourceNotFound(ResourceException):
 
 class ResourceConflict(ResourceException):
     pass
+
+
+class ScrapeError(LingominerException):
+    pass
+
+
+class MochiError(LingominerException):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
@@ -1,14 +1,23 @@
 import asyncio
+import hashlib
 import json
 import os
 import tempfile
 import uuid
-from typing import Callable, Literal, Optional, TypedDict
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Literal,
+    NotRequired,
+    Optional,
+    TypedDict,
+)
 import base64
 
-from jinja2 import Template
+from jinja2 import Environment, Template, meta
 from openai import AsyncClient
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 from lingominer.config import config
 from lingominer.logger import logger
@@ -22,12 +31,16 @@ openai_client = AsyncClient(
 
 
 class FieldDefinition(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     name: str
     type: Literal["text", "audio", "image"]
     description: str
 
 
 class Task(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     name: str
     action: str
     inputs: list[str]
@@ -36,27 +49,47 @@ class Task(BaseModel):
     # Completion Task
     prompt: Optional[str] = None
 
+    # Generation the task is built from
+    id: Optional[str] = None
+
+    def fingerprint(self) -> str:
+        """Hash of everything that decides what the task generates."""
+        payload = self.model_dump_json(include={"action", "inputs", "outputs", "prompt"})
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class GenerationSource(TypedDict):
+    generation_id: str | None
+    fingerprint: str
+
 
 class GenerationOutput(TypedDict):
     type: Literal["text", "audio", "image"]
     value: str | None
+    source: NotRequired[GenerationSource]
 
 
 class State:
     def __init__(
-        self, value: str | None = None, type: Literal["text", "audio", "image"] = "text"
+        self,
+        value: str | None = None,
+        type: Literal["text", "audio", "image"] = "text",
+        ready: bool = False,
     ):
+        # `ready` states are known even without a value, e.g. an empty field
         self.semaphore = asyncio.Semaphore(0)
-        if value is not None:
+        if value is not None or ready:
             self.value = value
             self.type = type
             self.semaphore.release()
         else:
             self.value = None
             self.type = type
+        self.source: GenerationSource | None = None
 
-    def set(self, value: str):
+    def set(self, value: str, source: GenerationSource | None = None):
         self.value = value
+        self.source = source
         self.semaphore.release()
 
     async def get(self) -> GenerationOutput:
@@ -64,12 +97,23 @@ class State:
             return {"value": self.value, "type": self.type}
 
 
+Listener = Callable[[str, dict], None]
+
+
 class Context:
     def __init__(self, context: dict = {}):
         self.context: dict[str, State] = {}
         self.init_keys = set(context.keys())
+        self.listeners: list[Listener] = []
         for key, value in context.items():
-            self.context[key] = State(value)
+            self.context[key] = State(value, ready=True)
+
+    def listen(self, listener: Listener):
+        self.listeners.append(listener)
+
+    def notify(self, event: str, data: dict):
+        for listener in self.listeners:
+            listener(event, data)
 
     def add(
         self,
@@ -85,33 +129,81 @@ class Context:
         value = await self.context[key].get()
         return value
 
-    def set(self, key: str, value: str):
+    def set(self, key: str, value: str, source: GenerationSource | None = None):
         if key not in self.context:
             raise ValueError(f"Key {key} not found in context")
-        self.context[key].set(value)
+        self.context[key].set(value, source)
+        self.notify(
+            "field", {"name": key, "value": value, "type": self.context[key].type}
+        )
 
     def keys(self):
         return self.context.keys()
 
     def dump(self, exclude_init: bool = True) -> dict[str, GenerationOutput]:
-        states = {
-            key: {"value": state.value, "type": state.type}
-            for key, state in self.context.items()
-            if not exclude_init or key not in self.init_keys
-        }
+        states = {}
+        for key, state in self.context.items():
+            if exclude_init and key in self.init_keys:
+                continue
+            states[key] = {"value": state.value, "type": state.type}
+            if state.source is not None:
+                states[key]["source"] = state.source
         return states
 
     def __str__(self):
         return str({key: state.value for key, state in self.context.items()})
 
 
+class TaskCache:
+    """
+    Shares action results between flows, e.g. all cards of a batch mined from
+    the same paragraph. Tasks running the same action with the same prompt,
+    outputs and values of the variables the prompt references run only once,
+    concurrent callers await the same execution.
+    """
+
+    def __init__(self):
+        self.executions: dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def key(task: Task, variables: dict[str, str | None]) -> str:
+        payload = json.dumps(
+            {
+                "action": task.action,
+                "prompt": task.prompt,
+                "outputs": [o.model_dump() for o in task.outputs],
+                "variables": variables,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    async def run(self, key: str, execute: Callable[[], Awaitable[dict]]) -> dict:
+        if key not in self.executions:
+            self.executions[key] = asyncio.ensure_future(execute())
+        return await asyncio.shield(self.executions[key])
+
+
+def referenced_variables(prompt: str | None) -> set[str]:
+    if not prompt:
+        return set()
+    return meta.find_undeclared_variables(Environment().parse(prompt))
+
+
 class Flow:
-    def __init__(self, context: Context = Context()):
+    def __init__(
+        self,
+        context: Context = Context(),
+        cache: TaskCache | None = None,
+        packer: "CompletionPacker | None" = None,
+    ):
         self.context = context
+        self.cache = cache
         self.actions: dict[str, Callable] = {}
         self.tasks: list[Task] = []
         # default actions
-        self.add_action("completion", completion)
+        self.add_action("completion", packer.completion if packer else completion)
         self.add_action("toSpeech", toSpeech)
         self.add_action("toImage", toImage)
 
@@ -128,9 +220,22 @@ class Flow:
         inputs: dict[str, GenerationOutput] = {}
         for input in task.inputs:
             inputs[input] = await self.context.get(input)
-        outputs = await self.actions[task.action](self.context, task, inputs)
+        action = self.actions[task.action]
+        if self.cache is None:
+            outputs = await action(self.context, task, inputs)
+        else:
+            # only what the prompt actually renders can change the result
+            variables = {}
+            for name in sorted(referenced_variables(task.prompt)):
+                if name in self.context.keys():
+                    variables[name] = (await self.context.get(name))["value"]
+            outputs = await self.cache.run(
+                TaskCache.key(task, variables),
+                lambda: action(self.context, task, inputs),
+            )
+        source = {"generation_id": task.id, "fingerprint": task.fingerprint()}
         for output in task.outputs:
-            self.context.set(output.name, outputs[output.name]["value"])
+            self.context.set(output.name, outputs[output.name]["value"], source)
 
     async def run(self, timeout: int | None = None):
         async with asyncio.timeout(timeout):
@@ -139,22 +244,75 @@ class Flow:
                     tg.create_task(self._execute_task(task))
         return self.context
 
-
-def render_prompt(prompt: str, inputs: dict, outputs: list[FieldDefinition]) -> str:
-    # Instruction
-    template = Template(prompt)
-    prompt_rendered = template.render(**inputs)
-    # Output Format
+    async def stream(
+        self, timeout: int | None = None
+    ) -> AsyncIterator[tuple[str, dict]]:
+        """Run the flow, yielding `field` events as each state is set and
+        `delta` events for completion tokens as they arrive."""
+        queue: asyncio.Queue[tuple[str, dict] | None] = asyncio.Queue()
+        self.context.listen(lambda event, data: queue.put_nowait((event, data)))
+        runner = asyncio.create_task(self.run(timeout))
+        runner.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (item := await queue.get()) is not None:
+                yield item
+            await runner
+        finally:
+            if not runner.done():
+                runner.cancel()
+
+
+def outdated_tasks(
+    tasks: list[Task],
+    content: dict[str, GenerationOutput],
+    changed: set[str] = frozenset(),
+) -> list[Task]:
+    """
+    Tasks whose outputs in `content` are missing or were generated by a
+    different version of the task, tasks reading one of the `changed`
+    variables (e.g. the paragraph), plus every task downstream of them.
+    """
+    producers = {output.name: task.name for task in tasks for output in task.outputs}
+    outdated = set()
+    for task in tasks:
+        if changed & (set(task.inputs) | referenced_variables(task.prompt)):
+            outdated.add(task.name)
+        fingerprint = task.fingerprint()
+        for output in task.outputs:
+            source = content.get(output.name, {}).get("source") or {}
+            if source.get("fingerprint") != fingerprint:
+                outdated.add(task.name)
+    grew = True
+    while grew:
+        grew = False
+        for task in tasks:
+            if task.name not in outdated and any(
+                producers.get(name) in outdated for name in task.inputs
+            ):
+                outdated.add(task.name)
+                grew = True
+    return [task for task in tasks if task.name in outdated]
+
+
+def render_output_format(outputs: list[FieldDefinition]) -> str:
     fields_description = "\n".join(
         [f"- `{field.name}`: {field.description}" for field in outputs]
     )
-    output_format = (
+    return (
         "Your task is to generate a JSON object that adheres "
         "to the following schema:\n\n"
         "The schema is defined as follows:\n"
         f"{fields_description}\n\n"
         "Please ensure the output JSON strictly follows this schema. Do not include extra fields."
     )
+
+
+def render_prompt(prompt: str, inputs: dict, outputs: list[FieldDefinition]) -> str:
+    # Instruction
+    template = Template(prompt)
+    prompt_rendered = template.render(**inputs)
+    # Output Format
+    output_format = render_output_format(outputs)
     # Final Prompt
     final_prompt = (
         "# Instruction\n"
@@ -172,22 +330,39 @@ async def completion(
 ) -> dict[str, GenerationOutput]:
     for init_key in context.init_keys:
         inputs[init_key] = await context.get(init_key)
-    response = await openai_client.chat.completions.create(
-        model=config.llm_base_model,
-        messages=[
-            {
-                "role": "system",
-                "content": render_prompt(
-                    task.prompt,
-                    {k: v["value"] for k, v in inputs.items()},
-                    task.outputs,
-                ),
-            },
-        ],
-        response_format={"type": "json_object"},
-    )
-    dict_result = json.loads(response.choices[0].message.content)
-    logger.debug(f"Completion Result: {response.choices[0].message.content}")
+    messages = [
+        {
+            "role": "system",
+            "content": render_prompt(
+                task.prompt,
+                {k: v["value"] for k, v in inputs.items()},
+                task.outputs,
+            ),
+        },
+    ]
+    if context.listeners:
+        # someone is watching the flow, forward the raw JSON tokens as they come
+        stream = await openai_client.chat.completions.create(
+            model=config.llm_base_model,
+            messages=messages,
+            response_format={"type": "json_object"},
+            stream=True,
+        )
+        chunks = []
+        async for chunk in stream:
+            if chunk.choices and (delta := chunk.choices[0].delta.content):
+                chunks.append(delta)
+                context.notify("delta", {"task": task.name, "delta": delta})
+        content = "".join(chunks)
+    else:
+        response = await openai_client.chat.completions.create(
+            model=config.llm_base_model,
+            messages=messages,
+            response_format={"type": "json_object"},
+        )
+        content = response.choices[0].message.content
+    dict_result = json.loads(content)
+    logger.debug(f"Completion Result: {content}")
     return {
         f.name: {
             "value": dict_result.get(f.name, None),
@@ -197,6 +372,159 @@ async def completion(
     }
 
 
+class PackedItem:
+    def __init__(
+        self,
+        id: str,
+        instruction: str,
+        context: Context,
+        task: Task,
+        inputs: dict[str, GenerationOutput],
+    ):
+        self.id = id
+        self.instruction = instruction
+        self.context = context
+        self.task = task
+        self.inputs = inputs
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def render_packed_prompt(items: list[PackedItem], outputs: list[FieldDefinition]):
+    instructions = "\n\n".join(
+        f"## Item `{item.id}`\n{item.instruction}" for item in items
+    )
+    output_format = (
+        "Generate a JSON object whose keys are the item ids above, "
+        "the value of each key is the result of that item.\n\n"
+        f"{render_output_format(outputs)}"
+    )
+    final_prompt = (
+        "# Instruction\n"
+        "You are given several independent items, each with its own instruction. "
+        "Handle every item separately.\n\n"
+        f"{instructions}\n\n"
+        "# Output Format\n"
+        f"{output_format}\n\n"
+        "# Output"
+    )
+    logger.debug(f"Final Packed Prompt: {final_prompt}")
+    return final_prompt
+
+
+class CompletionPacker:
+    """
+    Packing mode of the `completion` action for batch workloads.
+
+    Completions of the same generation (action, prompt and outputs) arriving
+    within `window` seconds are sent as one JSON-mode request, whose result is
+    split by item id. A pack is sent early once it holds `max_items` items or
+    its instructions reach `token_budget`. Items missing from the packed
+    result, or a result that can't be parsed, fall back to a per-card call.
+    """
+
+    def __init__(
+        self, window: float = 0.05, max_items: int = 8, token_budget: int = 6000
+    ):
+        self.window = window
+        self.max_items = max_items
+        self.token_budget = token_budget
+        self.pending: dict[str, list[PackedItem]] = {}
+        self.timers: dict[str, asyncio.TimerHandle] = {}
+        self.flushing: set[asyncio.Task] = set()
+        self.counter = 0
+
+    async def completion(
+        self, context: Context, task: Task, inputs: dict[str, GenerationOutput]
+    ) -> dict[str, GenerationOutput]:
+        for init_key in context.init_keys:
+            inputs[init_key] = await context.get(init_key)
+        instruction = Template(task.prompt).render(
+            **{k: v["value"] for k, v in inputs.items()}
+        )
+        self.counter += 1
+        item = PackedItem(f"item_{self.counter}", instruction, context, task, inputs)
+
+        key = TaskCache.key(task, {})
+        group = self.pending.get(key, [])
+        group_tokens = sum(estimate_tokens(i.instruction) for i in group)
+        if group and group_tokens + estimate_tokens(instruction) > self.token_budget:
+            self._flush(key)
+        group = self.pending.setdefault(key, [])
+        group.append(item)
+        if len(group) >= self.max_items:
+            self._flush(key)
+        elif len(group) == 1:
+            self.timers[key] = asyncio.get_running_loop().call_later(
+                self.window, self._flush, key
+            )
+        return await item.future
+
+    def _flush(self, key: str):
+        if timer := self.timers.pop(key, None):
+            timer.cancel()
+        items = self.pending.pop(key, [])
+        if items:
+            task = asyncio.create_task(self._send(items))
+            self.flushing.add(task)
+            task.add_done_callback(self.flushing.discard)
+
+    async def _send(self, items: list[PackedItem]):
+        fallback = items
+        if len(items) > 1:
+            outputs = items[0].task.outputs
+            try:
+                response = await openai_client.chat.completions.create(
+                    model=config.llm_base_model,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": render_packed_prompt(items, outputs),
+                        },
+                    ],
+                    response_format={"type": "json_object"},
+                )
+                content = response.choices[0].message.content
+                logger.debug(f"Packed Completion Result: {content}")
+                dict_result = json.loads(content)
+                fallback = []
+                for item in items:
+                    item_result = dict_result.get(item.id)
+                    if item.future.done():
+                        continue
+                    if isinstance(item_result, dict):
+                        item.future.set_result(
+                            {
+                                f.name: {
+                                    "value": item_result.get(f.name, None),
+                                    "type": f.type,
+                                }
+                                for f in outputs
+                            }
+                        )
+                    else:
+                        fallback.append(item)
+            except Exception as e:
+                logger.warning(f"Packed completion failed, unpacking: {e}")
+                fallback = [item for item in items if not item.future.done()]
+        if fallback:
+            logger.debug(f"Running {len(fallback)} completions one by one")
+        await asyncio.gather(*(self._send_single(item) for item in fallback))
+
+    async def _send_single(self, item: PackedItem):
+        try:
+            result = await completion(item.context, item.task, item.inputs)
+        except Exception as e:
+            if not item.future.done():
+                item.future.set_exception(e)
+        else:
+            if not item.future.done():
+                item.future.set_result(result)
+
+
 async def toImage(
     context: Context, task: Task, inputs: dict[str, GenerationOutput]
 ) -> dict[str, GenerationOutput]:
@@ -0,0 +1,71 @@
+import bisect
+import math
+import threading
+from typing import Callable, Sequence
+
+# A few process-wide metrics, rendered in the Prometheus text format by
+# `GET /metrics`. Gauges are read through callbacks at scrape time.
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, buckets: Sequence[float]):
+        self.name = name
+        self.description = description
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            cumulative = 0
+            for bound, count in zip([*self.buckets, math.inf], self.counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                lines.append(f'{self.name}_bucket{{le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum {self.sum}")
+            lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, description: str, read: Callable[[], float]):
+        self.name = name
+        self.description = description
+        self.read = read
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {self.read()}",
+        ]
+
+
+_metrics: dict[str, Histogram | Gauge] = {}
+
+
+def histogram(name: str, description: str, buckets: Sequence[float]) -> Histogram:
+    metric = _metrics.setdefault(name, Histogram(name, description, buckets))
+    assert isinstance(metric, Histogram)
+    return metric
+
+
+def gauge(name: str, description: str, read: Callable[[], float]) -> Gauge:
+    metric = _metrics[name] = Gauge(name, description, read)
+    return metric
+
+
+def render() -> str:
+    return "".join(
+        line + "\n" for metric in _metrics.values() for line in metric.render()
+    )
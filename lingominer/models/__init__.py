@@ -1,6 +1,7 @@
 from .card import Card, CardStatus
+from .job import CardJob, CardJobStatus
 from .mochi import MochiMapping
-from .passage import Note, Passage
+from .passage import Note, Passage, PassageCache
 from .template import Generation, Template, TemplateField
 from .user import ApiKey, User
 
@@ -14,5 +15,8 @@ __all__ = [
     "ApiKey",
     "Passage",
     "Note",
+    "PassageCache",
     "MochiMapping",
+    "CardJob",
+    "CardJobStatus",
 ]
@@ -1,10 +1,13 @@
+import hashlib
+import re
+import unicodedata
 import uuid
 from datetime import datetime, timezone
 from enum import Enum
 from typing import Any, Optional
 
 from pgvector.sqlalchemy import Vector
-from sqlmodel import JSON, Field, SQLModel
+from sqlmodel import JSON, Field, Index, SQLModel
 
 
 class CardStatus(str, Enum):
@@ -13,7 +16,44 @@ class CardStatus(str, Enum):
     DELETED = "deleted"
 
 
+def selection_hash(paragraph: str, pos_start: int, pos_end: int) -> str:
+    """Hash of the selection, insensitive to case, width and spacing."""
+    selection = unicodedata.normalize("NFKC", paragraph[pos_start:pos_end])
+    selection = re.sub(r"\s+", " ", selection).strip().casefold()
+    return hashlib.sha256(selection.encode()).hexdigest()
+
+
 class Card(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_card_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index(
+            "ix_card_user_id_template_id_created_at_id",
+            "user_id",
+            "template_id",
+            "created_at",
+            "id",
+        ),
+        Index(
+            "ix_card_user_id_status_created_at_id",
+            "user_id",
+            "status",
+            "created_at",
+            "id",
+        ),
+        Index(
+            "ix_card_user_id_template_id_selection_hash",
+            "user_id",
+            "template_id",
+            "selection_hash",
+        ),
+        Index(
+            "ix_card_embedding_hnsw",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+    )
     id: str = Field(
         primary_key=True,
         default_factory=lambda: "card_" + uuid.uuid4().hex,
@@ -24,15 +64,21 @@ class Card(SQLModel, table=True):
     paragraph: str = Field(description="the paragraph where the sentence is in")
     pos_start: int = Field(description="start position of the selection in the text")
     pos_end: int = Field(description="end position of the selection in the text")
+    selection_hash: Optional[str] = Field(
+        default=None, description="hash of the normalized selection"
+    )
     url: Optional[str] = Field(description="url of the page")
     content: dict = Field(description="derived content of the card", sa_type=JSON)
-    embedding: Any = Field(sa_type=Vector(1024))
+    embedding: Optional[Any] = Field(default=None, sa_type=Vector(1024))
 
     template_id: str = Field(
         description="id of the template", foreign_key="template.id"
     )
+    import_id: Optional[str] = Field(
+        default=None, index=True, description="id of the import that wrote the card"
+    )
 
-    created_at: datetime = Field(default=datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     modified_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc),
         sa_column_kwargs={"onupdate": lambda: datetime.now(timezone.utc)},
@@ -0,0 +1,40 @@
+import uuid
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Optional
+
+from sqlmodel import JSON, Field, Index, SQLModel
+
+
+class CardJobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class CardJob(SQLModel, table=True):
+    __table_args__ = (Index("ix_cardjob_status_created_at", "status", "created_at"),)
+    id: str = Field(
+        primary_key=True,
+        default_factory=lambda: "cardjob_" + uuid.uuid4().hex,
+    )
+    user_id: str = Field(description="user id", foreign_key="user.id")
+
+    kind: str = Field(default="create", description="what the job does")
+    status: CardJobStatus = Field(default=CardJobStatus.PENDING)
+    payload: dict = Field(description="arguments of the job", sa_type=JSON)
+    progress: dict = Field(
+        default_factory=dict,
+        description="fields done / total reported by the worker",
+        sa_type=JSON,
+    )
+    attempts: int = Field(default=0)
+    card_id: Optional[str] = Field(default=None, description="id of the card")
+    error: Optional[str] = Field(default=None)
+
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column_kwargs={"onupdate": lambda: datetime.now(timezone.utc)},
+    )
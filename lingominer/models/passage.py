@@ -1,6 +1,22 @@
-from sqlmodel import Field, Relationship, SQLModel
+import re
 import uuid
 from datetime import datetime, timezone
+from typing import Optional
+
+from sqlmodel import JSON, Field, Index, Relationship, SQLModel
+
+
+def paragraph_offsets(content: str) -> list[list[int]]:
+    """
+    `[start, end]` of each paragraph of a markdown passage, paragraphs
+    being runs of non-blank lines. `Note.paragraph_index` indexes them.
+    """
+    offsets = []
+    for match in re.finditer(r"(?:[^\n]*\S[^\n]*(?:\n|$))+", content):
+        text = match.group()
+        start = match.start() + len(text) - len(text.lstrip())
+        offsets.append([start, match.start() + len(text.rstrip())])
+    return offsets
 
 
 class Passage(SQLModel, table=True):
@@ -13,6 +29,11 @@ class Passage(SQLModel, table=True):
     title: str = Field(description="title of the passage")
     url: str = Field(description="url of the passage")
     content: str = Field(description="content of the passage")
+    paragraph_offsets: list[list[int]] = Field(
+        default_factory=list,
+        description="[start, end] of each paragraph in the content",
+        sa_type=JSON,
+    )
 
     notes: list["Note"] = Relationship(back_populates="passage")
 
@@ -24,6 +45,12 @@ class Passage(SQLModel, table=True):
 
 
 class Note(SQLModel, table=True):
+    __table_args__ = (
+        Index(
+            "ix_note_passage_id_paragraph_index", "passage_id", "paragraph_index"
+        ),
+    )
+
     id: str = Field(
         primary_key=True,
         default_factory=lambda: "note_" + uuid.uuid4().hex,
@@ -45,3 +72,28 @@ class Note(SQLModel, table=True):
         default_factory=lambda: datetime.now(timezone.utc),
         sa_column_kwargs={"onupdate": lambda: datetime.now(timezone.utc)},
     )
+
+
+class PassageCache(SQLModel, table=True):
+    """Cleaned content of a scraped page, shared by every user."""
+
+    url: str = Field(primary_key=True, description="normalized url of the page")
+    content_hash: str = Field(description="sha256 of the scraped text")
+
+    title: str = Field(description="title of the cleaned content")
+    content: str = Field(description="cleaned markdown content")
+
+    etag: Optional[str] = Field(default=None, description="ETag of the page")
+    last_modified: Optional[str] = Field(
+        default=None, description="Last-Modified of the page"
+    )
+    checked_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        description="last time the page was scraped or revalidated",
+    )
+
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    modified_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column_kwargs={"onupdate": lambda: datetime.now(timezone.utc)},
+    )
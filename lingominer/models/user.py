@@ -26,7 +26,10 @@ class ApiKey(SQLModel, table=True):
         primary_key=True,
         default_factory=lambda: "api_key_" + uuid.uuid4().hex,
     )
-    key: str = Field(description="api key", unique=True)
+    key_prefix: str = Field(description="first characters of the api key")
+    key_hash: str = Field(
+        description="hmac-sha256 of the api key", unique=True, index=True
+    )
 
     user_id: str = Field(description="user id", foreign_key="user.id")
     user: User = Relationship(back_populates="api_keys")
@@ -0,0 +1,38 @@
+import hashlib
+import math
+import re
+
+from lingominer.config import config
+from lingominer.services.ai import openai_client
+
+WORD = re.compile(r"\w+")
+
+
+def local_embedding(text: str, dimensions: int) -> list[float]:
+    """
+    Deterministic embedding hashing the words and character trigrams of
+    `text`, texts sharing words end up close. No network, meant for tests.
+    """
+    vector = [0.0] * dimensions
+    for word in WORD.findall(text.lower()):
+        padded = f" {word} "
+        features = [word] + [padded[i : i + 3] for i in range(len(padded) - 2)]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+            h = int.from_bytes(digest, "little")
+            vector[h % dimensions] += 1.0 if h >> 63 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+async def embed_texts(texts: list[str]) -> list[list[float]]:
+    if not texts:
+        return []
+    if config.embedding_backend == "local":
+        return [local_embedding(text, config.embedding_dimensions) for text in texts]
+    response = await openai_client.embeddings.create(
+        model=config.embedding_model,
+        input=texts,
+        dimensions=config.embedding_dimensions,
+    )
+    return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
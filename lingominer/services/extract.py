@@ -0,0 +1,100 @@
+import re
+from html.parser import HTMLParser
+
+SKIPPED_TAGS = {
+    "script",
+    "style",
+    "noscript",
+    "template",
+    "svg",
+    "canvas",
+    "iframe",
+    "form",
+    "nav",
+    "header",
+    "footer",
+    "aside",
+}
+BLOCK_TAGS = {
+    "p",
+    "div",
+    "section",
+    "article",
+    "main",
+    "blockquote",
+    "pre",
+    "li",
+    "ul",
+    "ol",
+    "table",
+    "tr",
+    "br",
+    "hr",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+}
+
+
+class TextExtractor(HTMLParser):
+    """Readable text of an html page, one block element per paragraph."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.blocks: list[str] = []
+        self.current: list[str] = []
+        self.skipped = 0
+        self.in_title = False
+
+    def flush(self):
+        text = re.sub(r"\s+", " ", "".join(self.current)).strip()
+        if text:
+            self.blocks.append(text)
+        self.current = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skipped += 1
+        elif tag == "title":
+            self.in_title = True
+        elif tag in BLOCK_TAGS:
+            self.flush()
+            if tag in {"h1", "h2", "h3", "h4", "h5", "h6"} and not self.skipped:
+                self.current.append("#" * int(tag[1]) + " ")
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skipped = max(self.skipped - 1, 0)
+        elif tag == "title":
+            self.in_title = False
+        elif tag in BLOCK_TAGS:
+            self.flush()
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self.flush()
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title += data
+        elif not self.skipped:
+            self.current.append(data)
+
+
+def extract_text(html: str) -> str:
+    """
+    Title and paragraphs of an html page as plain text, in the same shape
+    as r.jina.ai answers: a `Title:` line, then the content.
+    """
+    extractor = TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    extractor.flush()
+    # headings alone and leftovers like "#" are noise
+    blocks = [block for block in extractor.blocks if block.strip("# ")]
+    title = re.sub(r"\s+", " ", extractor.title).strip()
+    return f"Title: {title}\n\n" + "\n\n".join(blocks)
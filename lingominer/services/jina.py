@@ -1,11 +1,146 @@
-import requests
+import asyncio
+import ipaddress
+import socket
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
 
 from lingominer.config import config
+from lingominer.exception import ScrapeError
+from lingominer.services.extract import extract_text
+
+# One pooled client for every scrape, connections to r.jina.ai (or the
+# scraped sites) are kept alive between requests.
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=config.scrape_http2,
+            timeout=httpx.Timeout(
+                config.scrape_timeout, connect=config.scrape_connect_timeout
+            ),
+            limits=httpx.Limits(
+                max_connections=config.scrape_max_connections,
+                max_keepalive_connections=config.scrape_max_keepalive_connections,
+            ),
+            # redirects are followed by `fetch`, checking each target
+            follow_redirects=False,
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+@dataclass(frozen=True)
+class ScrapedPage:
+    text: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+async def check_public(url: httpx.URL):
+    """
+    Refuse to fetch `url` ourselves unless it is http(s) and its host only
+    resolves to public addresses, so users can't reach internal services.
+    """
+    if url.scheme not in ("http", "https") or not url.host:
+        raise ScrapeError(f"Unsupported url: {url}")
+    port = url.port or (443 if url.scheme == "https" else 80)
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            url.host, port, type=socket.SOCK_STREAM
+        )
+    except socket.gaierror as e:
+        raise ScrapeError(f"Can't resolve {url.host}: {e}")
+    for *_, sockaddr in infos:
+        address = ipaddress.ip_address(sockaddr[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global:
+            raise ScrapeError(f"{url.host} is not a public address")
+
+
+async def read_body(response: httpx.Response) -> str:
+    body = bytearray()
+    async for chunk in response.aiter_bytes():
+        body += chunk
+        if len(body) > config.scrape_max_bytes:
+            raise ScrapeError(f"Page is larger than {config.scrape_max_bytes} bytes")
+    try:
+        return body.decode(response.charset_encoding or "utf-8", errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+async def fetch(url: str, headers: dict) -> tuple[httpx.Response, str]:
+    """
+    Response and body text of `url`, following at most
+    `scrape_max_redirects` redirects and reading at most `scrape_max_bytes`.
+    """
+    local = config.scrape_backend == "local"
+    if local:
+        # fetch the page ourselves, without r.jina.ai
+        url_fetched = httpx.URL(url)
+        headers = {"User-Agent": config.scrape_user_agent, **headers}
+    else:
+        url_fetched = httpx.URL(f"https://r.jina.ai/{url}")
+        headers = {"Authorization": f"Bearer {config.jina_api_key}", **headers}
+    client = get_client()
+    try:
+        for _ in range(config.scrape_max_redirects + 1):
+            if local:
+                await check_public(url_fetched)
+            request = client.build_request("GET", url_fetched, headers=headers)
+            response = await client.send(request, stream=True)
+            try:
+                if response.is_redirect:
+                    location = url_fetched.join(response.headers["Location"])
+                    if location.host != url_fetched.host:
+                        headers.pop("Authorization", None)
+                    url_fetched = location
+                    continue
+                if response.status_code != 304:
+                    response.raise_for_status()
+                return response, await read_body(response)
+            finally:
+                await response.aclose()
+    except (httpx.HTTPStatusError, httpx.TransportError) as e:
+        raise ScrapeError(f"Fetching {url} failed: {e}")
+    raise ScrapeError(f"Too many redirects fetching {url}")
+
 
+async def scrape_page(
+    url: str, etag: Optional[str] = None, last_modified: Optional[str] = None
+) -> Optional[ScrapedPage]:
+    """
+    Text of the page at `url`. With the validators of a previous scrape,
+    the request is conditional and None means the page did not change.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    response, text = await fetch(url, headers)
+    if response.status_code == 304:
+        return None
+    if config.scrape_backend == "local":
+        text = extract_text(text)
+    return ScrapedPage(
+        text=text,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+    )
 
-def scrape_url(url: str):
-    url = f"https://r.jina.ai/{url}"
-    headers = {"Authorization": f"Bearer {config.jina_api_key}"}
 
-    response = requests.get(url, headers=headers)
-    return response.text
+async def scrape_url(url: str) -> str:
+    return (await scrape_page(url)).text
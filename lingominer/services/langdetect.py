@@ -0,0 +1,77 @@
+import re
+from collections import Counter
+from typing import Optional
+
+from lingominer.models.template import TemplateLang
+
+# Detection restricted to the languages templates exist for.
+# Japanese is told apart by its script, English and German by a small
+# model of frequent words and character trigrams.
+
+KANA = re.compile(r"[\u3040-\u30ff]")
+HAN = re.compile(r"[\u4e00-\u9fff]")
+LATIN = re.compile(r"[a-zA-ZäöüÄÖÜß]")
+WORD = re.compile(r"[a-zäöüß']+")
+
+STOPWORDS = {
+    TemplateLang.en: {
+        "the", "and", "of", "to", "in", "is", "that", "it", "was", "for",
+        "on", "are", "with", "as", "his", "they", "be", "at", "one", "have",
+        "this", "from", "or", "had", "by", "but", "what", "some", "we", "can",
+        "were", "which", "their", "if", "would", "there", "been", "has", "its",
+        "who", "will", "more", "not", "an", "when", "you", "she", "he", "about",
+    },
+    TemplateLang.de: {
+        "der", "die", "und", "in", "den", "von", "zu", "das", "mit", "sich",
+        "des", "auf", "für", "ist", "im", "dem", "nicht", "ein", "eine", "als",
+        "auch", "es", "an", "werden", "aus", "er", "hat", "dass", "sie", "nach",
+        "wird", "bei", "einer", "um", "am", "sind", "noch", "wie", "einem", "über",
+        "so", "zum", "war", "haben", "nur", "oder", "aber", "vor", "zur", "bis",
+    },
+}
+
+TRIGRAMS = {
+    TemplateLang.en: {
+        " th", "the", "he ", "ing", "ng ", " an", "and", "nd ", " of", "of ",
+        "ion", "tio", " to", "ed ", "er ", "ent", " wh", "ly ", "ous", "ght",
+    },
+    TemplateLang.de: {
+        "en ", "er ", "ch ", "sch", "ich", "ein", "ie ", "che", "der", " de",
+        "die", "und", "nd ", " un", "gen", "ung", "cht", "ei ", "te ", "ße ",
+    },
+}
+
+GERMAN_LETTERS = re.compile(r"[äöüß]")
+
+
+def detect(text: str) -> tuple[Optional[TemplateLang], float]:
+    """Most likely language of `text` and a confidence between 0 and 1."""
+    kana = len(KANA.findall(text))
+    han = len(HAN.findall(text))
+    latin = len(LATIN.findall(text))
+    if kana + han + latin == 0:
+        return None, 0.0
+    if kana + han > latin:
+        # kanji alone could as well be Chinese, leave it to the llm
+        if kana == 0:
+            return TemplateLang.jp, 0.0
+        return TemplateLang.jp, min(1.0, 0.6 + kana / (kana + han))
+
+    lowered = text.lower()
+    words = Counter(WORD.findall(lowered))
+    padded = " " + " ".join(WORD.findall(lowered)) + " "
+    trigrams = Counter(padded[i : i + 3] for i in range(len(padded) - 2))
+    scores = {}
+    for lang in (TemplateLang.en, TemplateLang.de):
+        scores[lang] = 2 * sum(words[w] for w in STOPWORDS[lang]) + sum(
+            trigrams[t] for t in TRIGRAMS[lang]
+        )
+    scores[TemplateLang.de] += 3 * len(GERMAN_LETTERS.findall(lowered))
+
+    best, second = sorted(scores, key=scores.get, reverse=True)
+    total = scores[best] + scores[second]
+    if total == 0:
+        return None, 0.0
+    # a few words don't tell much, however lopsided the scores are
+    evidence = min(1.0, sum(words.values()) / 8)
+    return best, (scores[best] - scores[second]) / total * evidence
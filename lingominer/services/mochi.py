@@ -0,0 +1,151 @@
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import httpx
+
+from lingominer.cache import LRUCache
+from lingominer.config import config
+from lingominer.exception import MochiError
+from lingominer.logger import logger
+
+# One pooled client for every call to the Mochi api, connections are kept
+# alive between requests.
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=config.mochi_base_url,
+            timeout=httpx.Timeout(
+                config.mochi_timeout, connect=config.mochi_connect_timeout
+            ),
+            limits=httpx.Limits(
+                max_connections=config.mochi_max_connections,
+                max_keepalive_connections=config.mochi_max_keepalive_connections,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class TokenBucket:
+    """Lets `rate` requests per second through, bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self.lock:
+            self.refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.refill()
+            self.tokens -= 1
+
+
+# mochi api key -> its bucket, Mochi rate limits each account
+_buckets: LRUCache[str, TokenBucket] = LRUCache()
+
+
+def bucket(api_key: str) -> TokenBucket:
+    if (token_bucket := _buckets.get(api_key)) is None:
+        token_bucket = TokenBucket(config.mochi_rate, config.mochi_burst)
+        _buckets.set(api_key, token_bucket)
+    return token_bucket
+
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds the `Retry-After` header asks to wait, None without one."""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=timezone.utc)
+        seconds = (date - datetime.now(timezone.utc)).total_seconds()
+    return min(max(seconds, 0.0), config.mochi_retry_max_wait)
+
+
+def backoff(attempt: int) -> float:
+    delay = min(config.mochi_retry_backoff * 2**attempt, config.mochi_retry_max_wait)
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def request(api_key: str, method: str, path: str, **kwargs) -> httpx.Response:
+    """
+    Mochi api request, rate limited per api key. 429 answers are retried
+    after their `Retry-After`; 5xx answers and connection errors only for
+    GET, so a card is never created twice.
+    """
+    idempotent = method == "GET"
+    for attempt in range(config.mochi_max_retries + 1):
+        last = attempt == config.mochi_max_retries
+        await bucket(api_key).acquire()
+        try:
+            response = await get_client().request(
+                method, path, auth=(api_key, ""), **kwargs
+            )
+        except httpx.TransportError as e:
+            if not idempotent or last:
+                raise MochiError(502, f"Mochi is unreachable: {e!r}")
+            wait = backoff(attempt)
+            logger.warning(f"Mochi {method} {path} failed: {e!r}, retry in {wait:.1f}s")
+        else:
+            if response.status_code < 400:
+                return response
+            retryable = response.status_code == 429 or (
+                response.status_code >= 500 and idempotent
+            )
+            if not retryable or last:
+                raise MochiError(response.status_code, response.text)
+            wait = retry_after(response)
+            if wait is None:
+                wait = backoff(attempt)
+            logger.warning(
+                f"Mochi {method} {path} answered {response.status_code}, "
+                f"retry in {wait:.1f}s"
+            )
+        await asyncio.sleep(wait)
+
+
+async def get_decks(api_key: str) -> dict:
+    return (await request(api_key, "GET", "/decks")).json()
+
+
+async def get_deck(api_key: str, deck_id: str) -> dict:
+    return (await request(api_key, "GET", f"/decks/{deck_id}")).json()
+
+
+async def get_template(api_key: str, template_id: str) -> dict:
+    return (await request(api_key, "GET", f"/templates/{template_id}")).json()
+
+
+async def create_card(api_key: str, payload: dict) -> dict:
+    return (await request(api_key, "POST", "/cards/", json=payload)).json()
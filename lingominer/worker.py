@@ -0,0 +1,17 @@
+import asyncio
+import logging.config
+
+from lingominer.api.cards.embeddings import start_batcher
+from lingominer.api.cards.jobs import start_workers
+from lingominer.config import config
+from lingominer.logger import LOGGING_CONFIG, logger
+
+
+async def serve(count: int):
+    await asyncio.gather(*start_workers(count), start_batcher())
+
+
+if __name__ == "__main__":
+    logging.config.dictConfig(LOGGING_CONFIG)
+    logger.info("Starting card job worker")
+    asyncio.run(serve(max(config.card_job_workers, 1)))
@@ -1,10 +1,12 @@
 from collections.abc import Generator
 
+import fake_mochi
 import pytest
 from fastapi.testclient import TestClient
 
 from lingominer.app import app
 from lingominer.models.user import User
+from lingominer.services import mochi
 
 
 @pytest.fixture(scope="module")
@@ -18,3 +20,10 @@ def example_user():
     user = User(id="test", name="test")
     yield user
 
+
+@pytest.fixture(autouse=True)
+def fake_mochi_client(monkeypatch):
+    """Send the Mochi api calls of every test to the fake Mochi app."""
+    fake_mochi.reset()
+    monkeypatch.setattr(mochi, "_client", fake_mochi.client())
+    yield fake_mochi
@@ -0,0 +1,78 @@
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# In-process stand-in for the Mochi api, served through httpx.ASGITransport
+# so tests never reach app.mochi.cards.
+
+app = FastAPI()
+
+decks = {
+    "deck_1": {"id": "deck_1", "name": "Test Deck", "template-id": "template_1"},
+}
+templates = {
+    "template_1": {
+        "id": "template_1",
+        "name": "Test Template",
+        "content": "<< Front >>\n---\n<< Back >>",
+        "fields": {
+            "front": {"id": "front", "name": "Front"},
+            "back": {"id": "back", "name": "Back"},
+        },
+    },
+}
+cards: list[dict] = []
+# (status, headers) answered instead of the next requests
+failures: list[tuple[int, dict]] = []
+calls: list[str] = []
+
+
+def reset():
+    cards.clear()
+    failures.clear()
+    calls.clear()
+
+
+def client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://mochi.test"
+    )
+
+
+@app.middleware("http")
+async def fake_failures(request: Request, call_next):
+    calls.append(f"{request.method} {request.url.path}")
+    if not request.headers.get("Authorization", "").startswith("Basic "):
+        return JSONResponse({"errors": ["unauthorized"]}, status_code=401)
+    if failures:
+        status_code, headers = failures.pop(0)
+        return JSONResponse(
+            {"errors": ["fake failure"]}, status_code=status_code, headers=headers
+        )
+    return await call_next(request)
+
+
+@app.get("/decks")
+async def get_decks():
+    return {"bookmark": "", "docs": list(decks.values())}
+
+
+@app.get("/decks/{deck_id}")
+async def get_deck(deck_id: str):
+    if deck_id not in decks:
+        return JSONResponse({"errors": ["deck not found"]}, status_code=404)
+    return decks[deck_id]
+
+
+@app.get("/templates/{template_id}")
+async def get_template(template_id: str):
+    if template_id not in templates:
+        return JSONResponse({"errors": ["template not found"]}, status_code=404)
+    return templates[template_id]
+
+
+@app.post("/cards/")
+async def create_card(request: Request):
+    card = {"id": f"card_{len(cards)}", **await request.json()}
+    cards.append(card)
+    return card
@@ -1,5 +1,7 @@
 from fastapi.testclient import TestClient
 from lingominer.api.auth.schemas import UserDetail
+from lingominer.api.auth.security import api_key_hash
+from lingominer.config import config
 
 
 def test_get_me(client: TestClient, example_user: UserDetail):
@@ -16,3 +18,35 @@ def test_update_settings(client: TestClient):
     assert response.status_code == 200
     data = response.json()
     assert data["mochi_api_key"] == settings_data["mochi_api_key"]
+
+
+def test_api_key_lifecycle(client: TestClient):
+    admin = {"Authorization": f"Bearer {config.auth_key}"}
+    user = client.post("/users", params={"name": "key owner"}, headers=admin).json()
+    response = client.post(f"/users/{user['id']}/api-keys", headers=admin)
+    assert response.status_code == 200
+    key = response.json()["key"]
+    bearer = {"Authorization": f"Bearer {key}"}
+
+    # the key is found by its hash, and cached after the first lookup
+    for _ in range(2):
+        response = client.get("/me", headers=bearer)
+        assert response.status_code == 200
+        assert response.json()["id"] == user["id"]
+    response = client.get("/me", headers={"Authorization": f"Bearer {key}x"})
+    assert response.status_code == 401
+
+    # only the prefix and the hash are stored
+    [api_key] = client.get(f"/users/{user['id']}/api-keys", headers=admin).json()
+    assert api_key["key_prefix"] == key[:7]
+    assert api_key["key_hash"] == api_key_hash(key)
+    assert "key" not in api_key
+
+    # a deleted key stops working right away, even though it was cached
+    response = client.delete(
+        f"/users/{user['id']}/api-keys/{api_key['id']}", headers=admin
+    )
+    assert response.status_code == 200
+    assert client.get("/me", headers=bearer).status_code == 401
+
+    client.delete(f"/users/{user['id']}", headers=admin)
@@ -0,0 +1,32 @@
+import time
+
+from lingominer.cache import LRUCache, TTLCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(ttl=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_pop_where():
+    cache = TTLCache(ttl=60)
+    cache.set("a", {"user": "x"})
+    cache.set("b", {"user": "y"})
+    cache.pop_where(lambda value: value["user"] == "x")
+    assert cache.get("a") is None
+    assert cache.get("b") == {"user": "y"}
@@ -1,6 +1,15 @@
+import asyncio
+import csv
+import json
+import time
+
 import pytest
 from fastapi.testclient import TestClient
 
+from lingominer.api.cards.schema import CardCreate
+from lingominer.api.cards.service import build_regeneration_flow, changed_fields
+from lingominer.flow.algo import FieldDefinition, Task
+from lingominer.models.card import Card
 from lingominer.models.template import TemplateLang
 
 
@@ -205,3 +214,445 @@ def test_card_crud(client: TestClient, example_template):
     # # Verify deletion
     # response = client.get(f"/cards/{card['id']}")
     # assert response.status_code == 404
+
+
+def test_card_stream(client: TestClient, example_template):
+    test_text = "Many of Saturn's satellites have large craters For example, Mimas has a crater that covers about one-third the diameter of the satellite."
+    card_data = {
+        "paragraph": test_text,
+        "pos_start": 39,
+        "pos_end": 46,
+        "template_id": example_template["id"],
+    }
+
+    events = []
+    with client.stream("POST", "/cards/stream", json=card_data) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        event = None
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                event = line.removeprefix("event: ")
+            elif line.startswith("data: "):
+                events.append((event, json.loads(line.removeprefix("data: "))))
+
+    names = [e for e, _ in events]
+    assert "error" not in names
+    assert "delta" in names
+    assert names[-1] == "card"
+    fields = {data["name"]: data for e, data in events if e == "field"}
+    assert fields["word"]["value"] == "craters"
+
+    card = events[-1][1]
+    assert card["content"]["word"]["value"] == "craters"
+    response = client.get(f"/cards/{card['id']}")
+    assert response.status_code == 200
+
+
+def test_card_job(client: TestClient, example_template):
+    test_text = "Titan is one of the few satellites in the solar system known to have an atmosphere."
+    card_data = {
+        "paragraph": test_text,
+        "pos_start": 48,
+        "pos_end": 54,
+        "template_id": example_template["id"],
+    }
+
+    response = client.post("/cards?background=true", json=card_data)
+    assert response.status_code == 202, response.text
+    job = response.json()
+    assert job["kind"] == "create"
+    assert job["status"] in ("pending", "running")
+
+    for _ in range(120):
+        response = client.get(f"/cards/jobs/{job['id']}")
+        assert response.status_code == 200
+        job = response.json()
+        if job["status"] in ("succeeded", "failed"):
+            break
+        time.sleep(1)
+    assert job["status"] == "succeeded", job["error"]
+    assert job["progress"]["done"] == job["progress"]["total"]
+
+    response = client.get(f"/cards/{job['card_id']}")
+    assert response.status_code == 200
+    assert response.json()["content"]["word"]["value"] == "system"
+
+    response = client.get("/cards/jobs/cardjob_missing")
+    assert response.status_code == 404
+
+
+def test_card_batch(client: TestClient, example_template):
+    test_text = "Titan is one of the few satellites in the solar system known to have an atmosphere. Its atmosphere consists largely of nitrogen."
+    selections = ["satellites", "atmosphere", "nitrogen"]
+    items = []
+    for selection in selections:
+        pos_start = test_text.index(selection)
+        items.append(
+            {
+                "paragraph": test_text,
+                "pos_start": pos_start,
+                "pos_end": pos_start + len(selection),
+                "template_id": example_template["id"],
+            }
+        )
+
+    response = client.post("/cards/batch", json={"items": items})
+    assert response.status_code == 200, response.text
+    cards = response.json()
+    assert len(cards) == len(selections)
+    for card, selection in zip(cards, selections):
+        assert card["content"]["word"]["value"] == selection
+    # the summary only depends on the paragraph, so it is generated once
+    summaries = {card["content"]["summary"]["value"] for card in cards}
+    assert len(summaries) == 1
+
+    for card in cards:
+        response = client.get(f"/cards/{card['id']}")
+        assert response.status_code == 200
+
+    response = client.post("/cards/batch", json={"items": []})
+    assert response.status_code == 422
+
+
+def test_card_regenerate(client: TestClient, example_template):
+    test_text = "Its atmosphere consists largely of nitrogen."
+    card_data = {
+        "paragraph": test_text,
+        "pos_start": 35,
+        "pos_end": 43,
+        "template_id": example_template["id"],
+    }
+    response = client.post("/cards", json=card_data)
+    assert response.status_code == 200, response.text
+    card = response.json()
+    assert "source" in card["content"]["summary"]
+
+    # nothing changed, nothing is regenerated
+    response = client.post(f"/cards/{card['id']}/regenerate")
+    assert response.status_code == 200
+    assert response.json()["content"] == card["content"]
+
+    # change one generation, only its fields are regenerated
+    template = client.get(f"/templates/{example_template['id']}").json()
+    summarize = next(g for g in template["generations"] if g["name"] == "summarize")
+    response = client.patch(
+        f"/templates/{example_template['id']}/generations/{summarize['id']}",
+        json={"prompt": "Summarize the text in a few words. The text is: '{{paragraph}}'", "inputs": []},
+    )
+    assert response.status_code == 200
+
+    response = client.post(f"/cards/{card['id']}/regenerate")
+    assert response.status_code == 200
+    content = response.json()["content"]
+    assert (
+        content["summary"]["source"]["fingerprint"]
+        != card["content"]["summary"]["source"]["fingerprint"]
+    )
+    for name in ("word", "sentence", "lemma", "simple_sentence_audio"):
+        assert content[name] == card["content"][name]
+
+    response = client.post(f"/cards/regenerate?template_id={example_template['id']}")
+    assert response.status_code == 202
+    assert response.json()["kind"] == "regenerate"
+
+
+def test_card_regenerate_empty_input():
+    note = FieldDefinition(name="note", type="text", description="optional note")
+    summary = FieldDefinition(name="summary", type="text", description="summary")
+    extract = Task(
+        name="extract", action="completion", inputs=[], outputs=[note], prompt="{{paragraph}}"
+    )
+    summarize = Task(
+        name="summarize",
+        action="completion",
+        inputs=["note"],
+        outputs=[summary],
+        prompt="{{note}}",
+    )
+    # the note is up to date but empty, only the summary is regenerated
+    card = Card(
+        user_id="test",
+        paragraph="Its atmosphere consists largely of nitrogen.",
+        pos_start=35,
+        pos_end=43,
+        url=None,
+        template_id="template_test",
+        content={
+            "note": {
+                "type": "text",
+                "value": None,
+                "source": {"generation_id": None, "fingerprint": extract.fingerprint()},
+            },
+        },
+    )
+    flow = build_regeneration_flow([extract, summarize], card)
+    assert [task.name for task in flow.tasks] == ["summarize"]
+
+    async def fake_completion(context, task, inputs):
+        return {"summary": {"type": "text", "value": f"note: {inputs['note']['value']}"}}
+
+    flow.add_action("completion", fake_completion)
+    content = asyncio.run(flow.run(timeout=5)).dump()
+    assert content["summary"]["value"] == "note: None"
+
+
+def test_card_search(client: TestClient, example_template):
+    test_text = "Many of Saturn's satellites have large craters For example, Mimas has a crater that covers about one-third the diameter of the satellite."
+    card_data = {
+        "paragraph": test_text,
+        "pos_start": 39,
+        "pos_end": 46,
+        "template_id": example_template["id"],
+    }
+    response = client.post("/cards", json=card_data)
+    assert response.status_code == 200, response.text
+    card = response.json()
+
+    # embeddings are written in the background
+    for _ in range(30):
+        response = client.get("/cards/search", params={"q": "craters", "limit": 50})
+        assert response.status_code == 200
+        results = response.json()
+        if card["id"] in [r["id"] for r in results]:
+            break
+        time.sleep(1)
+    assert card["id"] in [r["id"] for r in results]
+    distances = [r["distance"] for r in results]
+    assert distances == sorted(distances)
+    assert "embedding" not in results[0]
+
+    response = client.get(
+        "/cards/search",
+        params={"q": "craters", "template_id": example_template["id"], "ef_search": 100},
+    )
+    assert response.status_code == 200
+    assert all(r["template_id"] == example_template["id"] for r in response.json())
+
+    response = client.get("/cards/search", params={"q": ""})
+    assert response.status_code == 422
+
+
+def test_card_duplicate(client: TestClient, example_template):
+    test_text = "Its atmosphere consists largely of nitrogen."
+    card_data = {
+        "paragraph": test_text,
+        "pos_start": 35,
+        "pos_end": 43,
+        "template_id": example_template["id"],
+    }
+    response = client.post("/cards", json=card_data)
+    assert response.status_code == 200, response.text
+    card = response.json()
+
+    # same selection, returned as is
+    response = client.post("/cards?duplicate=return", json=card_data)
+    assert response.status_code == 200
+    assert response.json()["id"] == card["id"]
+
+    # same selection in the same paragraph, a new card with the same fields
+    response = client.post("/cards?duplicate=reuse", json=card_data)
+    assert response.status_code == 200
+    reused = response.json()
+    assert reused["id"] != card["id"]
+    assert reused["content"] == card["content"]
+
+    # in another paragraph, the fields reading the paragraph are regenerated
+    other_text = "The air of Titan is mostly NITROGEN."
+    other_data = {
+        **card_data,
+        "paragraph": other_text,
+        "pos_start": 27,
+        "pos_end": 35,
+    }
+    response = client.post("/cards?duplicate=reuse", json=other_data)
+    assert response.status_code == 200
+    reused = response.json()
+    assert reused["id"] != card["id"]
+    assert reused["paragraph"] == other_text
+    assert "Titan" in reused["content"]["sentence"]["value"]
+    assert reused["content"]["summary"] != card["content"]["summary"]
+
+
+def test_card_reuse_changed_fields():
+    extract = Task(
+        name="extract",
+        action="completion",
+        inputs=[],
+        outputs=[FieldDefinition(name="word", type="text", description="word")],
+        prompt="{{decorated_paragraph}}",
+    )
+    lemma = Task(
+        name="lemma",
+        action="completion",
+        inputs=["word"],
+        outputs=[FieldDefinition(name="lemma", type="text", description="lemma")],
+        prompt="{{word}}",
+    )
+    fixed = Task(
+        name="fixed",
+        action="completion",
+        inputs=[],
+        outputs=[FieldDefinition(name="fixed", type="text", description="fixed")],
+        prompt="Say hello.",
+    )
+    tasks = [extract, lemma, fixed]
+    content = {
+        output.name: {
+            "type": "text",
+            "value": output.name,
+            "source": {"generation_id": None, "fingerprint": task.fingerprint()},
+        }
+        for task in tasks
+        for output in task.outputs
+    }
+    text = "Its atmosphere consists largely of nitrogen."
+    card = Card(
+        user_id="test",
+        paragraph=text,
+        pos_start=35,
+        pos_end=43,
+        url=None,
+        template_id="template_test",
+        content=content,
+    )
+    same = CardCreate(paragraph=text, pos_start=35, pos_end=43)
+    assert changed_fields(card, same) == set()
+    assert build_regeneration_flow(tasks, same, content) is None
+
+    other = CardCreate(
+        paragraph="The air of Titan is mostly NITROGEN.", pos_start=27, pos_end=35
+    )
+    changed = changed_fields(card, other)
+    assert changed == {"paragraph", "decorated_paragraph"}
+    flow = build_regeneration_flow(tasks, other, content, changed)
+    # the word reads the paragraph and the lemma reads the word
+    assert [task.name for task in flow.tasks] == ["extract", "lemma"]
+
+
+def test_card_list_pagination(client: TestClient, example_template):
+    response = client.get("/cards", params={"limit": 2})
+    assert response.status_code == 200
+    first_page = response.json()
+    assert len(first_page) == 2
+    assert "embedding" not in first_page[0]
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get("/cards", params={"limit": 2, "cursor": cursor})
+    assert response.status_code == 200
+    second_page = response.json()
+    assert {c["id"] for c in first_page}.isdisjoint(c["id"] for c in second_page)
+    assert first_page[-1]["created_at"] >= second_page[0]["created_at"]
+
+    response = client.get(
+        "/cards",
+        params={
+            "template_id": example_template["id"],
+            "status": "new",
+            "fields": "template_id,content.word",
+        },
+    )
+    assert response.status_code == 200
+    cards = response.json()
+    assert len(cards) >= 1
+    assert set(cards[0]) == {"id", "template_id", "content"}
+    assert set(cards[0]["content"]) == {"word"}
+
+    response = client.get("/cards", params={"fields": "embedding"})
+    assert response.status_code == 422
+    response = client.get("/cards", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 422
+
+
+def test_card_export(client: TestClient, example_template):
+    with client.stream("GET", "/cards/export") as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        cards = [json.loads(line) for line in response.iter_lines() if line]
+    assert len(cards) >= 1
+    assert "embedding" not in cards[0]
+    assert "content" in cards[0]
+
+    with client.stream(
+        "GET",
+        "/cards/export",
+        params={"format": "csv", "template_id": example_template["id"]},
+    ) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        rows = list(csv.DictReader(response.iter_lines()))
+    assert len(rows) >= 1
+    assert rows[0]["template_id"] == example_template["id"]
+    assert "word" in rows[0]
+    assert "simple_sentence_audio" in rows[0]
+
+
+def test_card_import(client: TestClient, example_template):
+    lines = [
+        {
+            "paragraph": "Titan has a thick atmosphere.",
+            "pos_start": 18,
+            "pos_end": 28,
+            "content": {"word": "atmosphere", "lemma": {"value": "atmosphere"}},
+        },
+        {
+            "paragraph": "Mimas has a large crater.",
+            "pos_start": 18,
+            "pos_end": 24,
+            "url": "https://example.com/",
+            "content": {"word": "crater"},
+        },
+    ]
+    body = "\n".join(json.dumps(line) for line in lines)
+    response = client.post(
+        f"/cards/import?template_id={example_template['id']}",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["imported"] == 2
+    assert result["missing_fields"] == 2
+    assert [job["kind"] for job in result["jobs"]] == ["embed"]
+
+    response = client.get(
+        "/cards",
+        params={"template_id": example_template["id"], "limit": 2, "fields": "content"},
+    )
+    words = {c["content"]["word"]["value"] for c in response.json()}
+    assert words == {"atmosphere", "crater"}
+
+    # a single invalid line rejects the whole import
+    bad_body = body + "\n" + json.dumps({**lines[0], "content": {"unknown": "x"}})
+    response = client.post(
+        f"/cards/import?template_id={example_template['id']}",
+        content=bad_body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["line"] == 3
+
+    # invalid UTF-8 is reported as a line error too
+    response = client.post(
+        f"/cards/import?template_id={example_template['id']}",
+        content=body.encode() + b'\n{"paragraph": "\xff"}',
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["line"] == 3
+
+    # missing fields are generated for the cards of this import only
+    response = client.post(
+        f"/cards/import?template_id={example_template['id']}&generate_missing=true",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200, response.text
+    [_, regenerate_job] = response.json()["jobs"]
+    for _ in range(60):
+        job = client.get(f"/cards/jobs/{regenerate_job['id']}").json()
+        if job["status"] in ("succeeded", "failed"):
+            break
+        time.sleep(1)
+    assert job["status"] == "succeeded", job
+    assert job["progress"]["total"] == 2
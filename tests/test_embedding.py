@@ -0,0 +1,57 @@
+import asyncio
+import contextlib
+
+from lingominer.api.cards import embeddings
+from lingominer.config import config
+from lingominer.models.card import Card
+from lingominer.services.embedding import local_embedding
+
+
+def similarity(a: list[float], b: list[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+def test_local_embedding():
+    crater = local_embedding("craters\nMimas has a crater", 1024)
+    assert len(crater) == 1024
+    assert abs(similarity(crater, crater) - 1) < 1e-6
+    # deterministic across calls
+    assert crater == local_embedding("craters\nMimas has a crater", 1024)
+
+    close = local_embedding("crater\nMimas has large craters", 1024)
+    far = local_embedding("nitrogen\nIts atmosphere consists largely of nitrogen", 1024)
+    assert similarity(crater, close) > similarity(crater, far)
+
+
+def test_local_embedding_empty():
+    assert local_embedding("", 8) == [0.0] * 8
+
+
+def test_embedding_batcher_per_loop(monkeypatch):
+    embedded = []
+
+    async def fake_embed_cards(db_session, batch):
+        embedded.extend(card_id for card_id, _ in batch)
+
+    monkeypatch.setattr(embeddings, "embed_cards", fake_embed_cards)
+    monkeypatch.setattr(embeddings, "new_session", contextlib.nullcontext)
+    monkeypatch.setattr(config, "embedding_flush_interval", 0.01)
+
+    async def serve(card_id: str):
+        embeddings.start_batcher()
+        card = Card(
+            id=card_id, paragraph="Mimas has a crater", pos_start=12, pos_end=18
+        )
+        embeddings.submit_embeddings([card])
+        await asyncio.sleep(0.1)
+        await embeddings.stop_batcher()
+
+    # like the app restarted under a new event loop
+    asyncio.run(serve("card_first"))
+    asyncio.run(serve("card_second"))
+    assert embedded == ["card_first", "card_second"]
+
+    # without a running batcher the cards are left to the backfill
+    card = Card(id="card_later", paragraph="x", pos_start=0, pos_end=1)
+    embeddings.submit_embeddings([card])
+    assert embedded == ["card_first", "card_second"]
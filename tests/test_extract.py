@@ -0,0 +1,27 @@
+from lingominer.services.extract import extract_text
+
+
+def test_extract_text():
+    html = """
+    <html>
+      <head><title> Saturn &amp; its moons </title><style>p { color: red }</style></head>
+      <body>
+        <nav><a href="/">Home</a></nav>
+        <article>
+          <h1>Saturn</h1>
+          <p>In addition to its rings, Saturn has
+             25 satellites.</p>
+          <p>Several smaller<br>satellites exist.</p>
+          <script>track()</script>
+        </article>
+        <footer>Copyright</footer>
+      </body>
+    </html>
+    """
+    assert extract_text(html) == (
+        "Title: Saturn & its moons\n\n"
+        "# Saturn\n\n"
+        "In addition to its rings, Saturn has 25 satellites.\n\n"
+        "Several smaller\n\n"
+        "satellites exist."
+    )
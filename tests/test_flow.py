@@ -0,0 +1,98 @@
+import asyncio
+import json
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from lingominer.flow import algo
+from lingominer.flow.algo import CompletionPacker, Context, FieldDefinition, Task
+
+task = Task(
+    name="explain",
+    action="completion",
+    inputs=[],
+    outputs=[FieldDefinition(name="answer", type="text", description="answer")],
+    prompt="Explain {{paragraph}}",
+)
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """
+    Stubbed `openai_client`. Each item is answered with its instruction,
+    `reply` can rewrite packed answers. `calls` holds the item count of
+    each packed request, 1 for single completions.
+    """
+    llm = SimpleNamespace(calls=[], reply=lambda answers: json.dumps(answers))
+
+    async def create(messages, **kwargs):
+        prompt = messages[0]["content"]
+        items = re.findall(r"## Item `(item_\d+)`\n(.*)", prompt)
+        if items:
+            llm.calls.append(len(items))
+            content = llm.reply({id: {"answer": text} for id, text in items})
+        else:
+            llm.calls.append(1)
+            [text] = re.findall(r"# Instruction\n(.*)", prompt)
+            content = json.dumps({"answer": text})
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+    monkeypatch.setattr(algo, "openai_client", SimpleNamespace(chat=chat))
+    return llm
+
+
+def run(packer: CompletionPacker, paragraphs: list[str]) -> list[str]:
+    async def complete(paragraph: str):
+        context = Context({"paragraph": paragraph})
+        result = await packer.completion(context, task, {})
+        return result["answer"]["value"]
+
+    async def main():
+        return await asyncio.gather(*(complete(p) for p in paragraphs))
+
+    return asyncio.run(main())
+
+
+paragraphs = [f"paragraph number {i} of the packing test." for i in range(3)]
+answers = [f"Explain {p}" for p in paragraphs]
+
+
+def test_packer_packs_within_window(fake_llm):
+    packer = CompletionPacker(window=0.05, max_items=8, token_budget=6000)
+    assert run(packer, paragraphs) == answers
+    assert fake_llm.calls == [3]
+
+
+def test_packer_flushes_on_max_items(fake_llm):
+    packer = CompletionPacker(window=0.05, max_items=2, token_budget=6000)
+    assert run(packer, paragraphs) == answers
+    # a pack of one item is sent as a single completion
+    assert fake_llm.calls == [2, 1]
+
+
+def test_packer_flushes_on_token_budget(fake_llm):
+    # each instruction is about 13 tokens, two of them fit
+    packer = CompletionPacker(window=0.05, max_items=8, token_budget=30)
+    assert run(packer, paragraphs) == answers
+    assert fake_llm.calls == [2, 1]
+
+
+def test_packer_falls_back_on_missing_item(fake_llm):
+    def drop_first(answers: dict) -> str:
+        answers.pop(min(answers))
+        return json.dumps(answers)
+
+    fake_llm.reply = drop_first
+    packer = CompletionPacker(window=0.05, max_items=8, token_budget=6000)
+    assert run(packer, paragraphs) == answers
+    assert fake_llm.calls == [3, 1]
+
+
+def test_packer_falls_back_on_unparsable_result(fake_llm):
+    fake_llm.reply = lambda answers: json.dumps(answers)[:20]
+    packer = CompletionPacker(window=0.05, max_items=8, token_budget=6000)
+    assert run(packer, paragraphs) == answers
+    assert fake_llm.calls == [3, 1, 1, 1]
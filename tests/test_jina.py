@@ -0,0 +1,89 @@
+import asyncio
+
+import httpx
+import pytest
+
+from lingominer.config import config
+from lingominer.exception import ScrapeError
+from lingominer.services import jina
+
+PUBLIC_URL = "http://93.184.215.14/article"
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "http://127.0.0.1/",
+        "http://10.0.0.1:8080/admin",
+        "http://169.254.169.254/latest/meta-data/",
+        "http://[::1]/",
+        "http://[::ffff:127.0.0.1]/",
+        "http://localhost/",
+        "file:///etc/passwd",
+    ],
+)
+def test_check_public_rejects(url: str):
+    with pytest.raises(ScrapeError):
+        asyncio.run(jina.check_public(httpx.URL(url)))
+
+
+def test_check_public_accepts():
+    asyncio.run(jina.check_public(httpx.URL(PUBLIC_URL)))
+
+
+@pytest.fixture
+def local_scrape(monkeypatch):
+    """Run the local backend against `handler` instead of the network."""
+    monkeypatch.setattr(config, "scrape_backend", "local")
+
+    def use(handler):
+        monkeypatch.setattr(
+            jina, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+
+    return use
+
+
+def test_fetch_rejects_private_redirect(local_scrape):
+    requested = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested.append(str(request.url))
+        return httpx.Response(302, headers={"Location": "http://127.0.0.1/admin"})
+
+    local_scrape(handler)
+    with pytest.raises(ScrapeError):
+        asyncio.run(jina.scrape_page(PUBLIC_URL))
+    assert requested == [PUBLIC_URL]
+
+
+def test_fetch_limits(local_scrape, monkeypatch):
+    monkeypatch.setattr(config, "scrape_max_bytes", 100)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/loop":
+            return httpx.Response(302, headers={"Location": "/loop"})
+        return httpx.Response(200, text="<p>" + "x" * 200 + "</p>")
+
+    local_scrape(handler)
+    with pytest.raises(ScrapeError):
+        asyncio.run(jina.scrape_page(PUBLIC_URL))
+    with pytest.raises(ScrapeError):
+        asyncio.run(jina.scrape_page("http://93.184.215.14/loop"))
+
+    monkeypatch.setattr(config, "scrape_max_bytes", 1000)
+    page = asyncio.run(jina.scrape_page(PUBLIC_URL))
+    assert "x" * 200 in page.text
+
+
+def test_fetch_errors(local_scrape):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/down":
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(404, text="not found")
+
+    local_scrape(handler)
+    with pytest.raises(ScrapeError):
+        asyncio.run(jina.scrape_page(PUBLIC_URL))
+    with pytest.raises(ScrapeError):
+        asyncio.run(jina.scrape_page("http://93.184.215.14/down"))
@@ -0,0 +1,36 @@
+from lingominer.config import config
+from lingominer.models.template import TemplateLang
+from lingominer.services.langdetect import detect
+
+
+def test_detect_english():
+    lang, confidence = detect(
+        "In addition to its rings, Saturn has 25 satellites that measure at "
+        "least 6 miles (10 kilometers) in diameter, and several smaller satellites."
+    )
+    assert lang == TemplateLang.en
+    assert confidence > 0.3
+
+
+def test_detect_german():
+    lang, confidence = detect(
+        "Der Saturn hat neben seinen Ringen 25 Monde, die mindestens zehn "
+        "Kilometer groß sind, und mehrere kleinere Monde."
+    )
+    assert lang == TemplateLang.de
+    assert confidence > 0.3
+
+
+def test_detect_japanese():
+    lang, confidence = detect("土星には環のほかに25個の衛星があります。")
+    assert lang == TemplateLang.jp
+    assert confidence > 0.3
+
+
+def test_detect_unsure():
+    assert detect("1234") == (None, 0.0)
+    _, confidence = detect("Kindergarten")
+    assert confidence < config.lang_detect_min_confidence
+    # kanji without kana could be Chinese
+    _, confidence = detect("東京")
+    assert confidence < config.lang_detect_min_confidence
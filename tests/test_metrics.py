@@ -0,0 +1,34 @@
+from lingominer.config import config
+from lingominer.metrics import Gauge, Histogram
+
+
+def test_histogram_render():
+    histogram = Histogram("wait_seconds", "Time spent waiting.", [0.1, 1])
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(value)
+    assert histogram.render() == [
+        "# HELP wait_seconds Time spent waiting.",
+        "# TYPE wait_seconds histogram",
+        'wait_seconds_bucket{le="0.1"} 1',
+        'wait_seconds_bucket{le="1.0"} 3',
+        'wait_seconds_bucket{le="+Inf"} 4',
+        "wait_seconds_sum 4.05",
+        "wait_seconds_count 4",
+    ]
+
+
+def test_gauge_render():
+    in_use = [3]
+    gauge = Gauge("in_use", "Connections in use.", lambda: in_use[0])
+    assert gauge.render()[-1] == "in_use 3"
+    in_use[0] = 1
+    assert gauge.render()[-1] == "in_use 1"
+
+
+def test_metrics_endpoint(client):
+    response = client.get(
+        "/metrics", headers={"Authorization": f"Bearer {config.auth_key}"}
+    )
+    assert response.status_code == 200
+    assert "lingominer_db_pool_in_use" in response.text
+    assert "lingominer_db_pool_held_seconds_count" in response.text
@@ -1,5 +1,14 @@
+import asyncio
+import time
+
+import httpx
+import pytest
 from fastapi.testclient import TestClient
 
+from lingominer.config import config
+from lingominer.exception import MochiError
+from lingominer.services import mochi
+
 
 monk_template = {
     "id": "monk_template",
@@ -86,3 +95,45 @@ def test_delete_mochi_mapping(client: TestClient):
     # Test deletion
     response = client.delete(f"/mochi/{mochi_deck_id}")
     assert response.status_code == 200
+
+
+def test_mochi_retries_rate_limited(fake_mochi_client, monkeypatch):
+    monkeypatch.setattr(config, "mochi_retry_backoff", 0.01)
+    fake_mochi_client.failures.extend([(429, {"Retry-After": "0"}), (503, {})])
+    decks = asyncio.run(mochi.get_decks("retry_key"))
+    assert decks["docs"][0]["id"] == "deck_1"
+    assert fake_mochi_client.calls == ["GET /decks"] * 3
+
+
+def test_mochi_create_card_not_retried(fake_mochi_client):
+    fake_mochi_client.failures.append((503, {}))
+    with pytest.raises(MochiError) as e:
+        asyncio.run(mochi.create_card("create_key", {"deck-id": "deck_1"}))
+    assert e.value.status_code == 503
+    assert fake_mochi_client.calls == ["POST /cards/"]
+    assert fake_mochi_client.cards == []
+
+
+def test_mochi_token_bucket():
+    bucket = mochi.TokenBucket(rate=20, capacity=2)
+
+    async def acquire(times: int):
+        for _ in range(times):
+            await bucket.acquire()
+
+    start = time.monotonic()
+    asyncio.run(acquire(2))
+    assert time.monotonic() - start < 0.05
+    # the burst is spent, two more tokens take 1/20s each
+    asyncio.run(acquire(2))
+    assert time.monotonic() - start >= 0.09
+
+
+def test_mochi_retry_after():
+    def response(value: str) -> httpx.Response:
+        return httpx.Response(429, headers={"Retry-After": value})
+
+    assert mochi.retry_after(response("2")) == 2.0
+    assert mochi.retry_after(httpx.Response(429)) is None
+    assert mochi.retry_after(response("Wed, 21 Oct 2015 07:28:00 GMT")) == 0.0
+    assert mochi.retry_after(response("100000")) == config.mochi_retry_max_wait
@@ -1,5 +1,18 @@
+import asyncio
+import json
+import time
+import uuid
+from types import SimpleNamespace
+
+import httpx
+import openai
 from fastapi.testclient import TestClient
 
+from lingominer.api.passages.service import normalize_url, split_chunks, visible_text
+from lingominer.api.passages import notes
+from lingominer.api.passages.notes import pack, render_packed_note_prompt
+from lingominer.models.passage import paragraph_offsets
+
 example_url = "https://example.com/"
 
 
@@ -58,3 +71,225 @@ def test_passage_crud(client: TestClient):
     # verify the passage is deleted
     response = client.get(f"/passages/{passage_id}")
     assert response.status_code == 404
+
+
+def test_normalize_url():
+    assert (
+        normalize_url("HTTPS://Example.com:443/news/?b=2&utm_source=x&a=1#top")
+        == "https://example.com/news?a=1&b=2"
+    )
+    assert normalize_url("http://example.com") == "http://example.com/"
+    assert normalize_url("http://example.com:8080/a/") == "http://example.com:8080/a"
+
+
+def test_passage_cache(client: TestClient):
+    # the second ingestion of the same page is served from the cache
+    response = client.post(f"/passages?url={example_url}")
+    assert response.status_code == 200
+    first = response.json()
+
+    start = time.perf_counter()
+    response = client.post(f"/passages?url={example_url}?utm_source=test")
+    assert response.status_code == 200
+    second = response.json()
+    assert time.perf_counter() - start < 1
+    assert second["id"] != first["id"]
+    assert second["content"] == first["content"]
+    assert second["title"] == first["title"]
+
+    for passage in (first, second):
+        client.delete(f"/passages/{passage['id']}")
+
+
+def test_split_chunks():
+    paragraphs = [f"paragraph {i} " + "word " * 20 for i in range(10)]
+    chunks = split_chunks("\n\n".join(paragraphs), 300)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 300 for chunk in chunks)
+    # paragraphs are kept whole and in order
+    assert "\n\n".join(chunks) == "\n\n".join(p.strip() for p in paragraphs)
+
+    assert split_chunks("x" * 250, 100) == ["x" * 100, "x" * 100, "x" * 50]
+
+
+def test_visible_text():
+    # the first chunk is shown as it comes, minus trailing whitespace
+    assert visible_text("# Saturn\n\nIn add", 0, final=False) == "# Saturn\n\nIn add"
+    assert visible_text("In addition ", 0, final=False) == "In addition"
+    # a title of a later chunk is held back, then dropped
+    assert visible_text("# Sat", 1, final=False) == ""
+    assert visible_text("# Saturn\n\nMore", 1, final=False) == "More"
+    assert visible_text("## Moons", 1, final=False) == "## Moons"
+    assert visible_text("Moons ", 1, final=True) == "Moons"
+
+
+def read_events(response) -> list[tuple[str, dict]]:
+    events = []
+    event = None
+    for line in response.iter_lines():
+        if line.startswith("event: "):
+            event = line.removeprefix("event: ")
+        elif line.startswith("data: "):
+            events.append((event, json.loads(line.removeprefix("data: "))))
+    return events
+
+
+def test_passage_stream(client: TestClient):
+    with client.stream("POST", f"/passages/stream?url={example_url}") as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = read_events(response)
+
+    names = [e for e, _ in events]
+    assert "error" not in names
+    assert names.count("title") == 1
+    assert "delta" in names
+    assert names[-1] == "passage"
+    passage = events[-1][1]
+    assert passage["url"] == example_url
+    assert dict(events)["title"]["title"] == passage["title"]
+    streamed = "".join(data["delta"] for e, data in events if e == "delta")
+    assert streamed == passage["content"]
+
+    response = client.get(f"/passages/{passage['id']}")
+    assert response.status_code == 200
+    client.delete(f"/passages/{passage['id']}")
+
+
+def test_paragraph_offsets():
+    content = "# Title\n\nFirst paragraph\nsecond line.\n\n\n  Second.  \n\nThird"
+    offsets = paragraph_offsets(content)
+    assert [content[start:end] for start, end in offsets] == [
+        "# Title",
+        "First paragraph\nsecond line.",
+        "Second.",
+        "Third",
+    ]
+
+
+def test_passage_paragraphs(client: TestClient):
+    response = client.post(f"/passages?url={example_url}")
+    assert response.status_code == 200
+    passage = response.json()
+    offsets = passage["paragraph_offsets"]
+    assert len(offsets) >= 2
+
+    note_data = {
+        "selected_text": "test",
+        "context": "This is a test context",
+        "paragraph_index": 1,
+        "start_index": 0,
+        "end_index": 4,
+    }
+    response = client.post(f"/passages/{passage['id']}/notes", json=note_data)
+    assert response.status_code == 200
+    note = response.json()
+
+    response = client.get(f"/passages/{passage['id']}/paragraphs?start=1&end=2")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == len(offsets)
+    [paragraph] = data["paragraphs"]
+    start, end = offsets[1]
+    assert paragraph["index"] == 1
+    assert paragraph["text"] == passage["content"][start:end]
+    assert [n["id"] for n in paragraph["notes"]] == [note["id"]]
+
+    response = client.get(f"/passages/{passage['id']}/paragraphs?start=10000")
+    assert response.status_code == 200
+    assert response.json()["paragraphs"] == []
+
+    response = client.get("/passages/passage_missing/paragraphs")
+    assert response.status_code == 404
+
+    client.delete(f"/passages/{passage['id']}")
+
+
+def test_pack_notes():
+    context = "Saturn has 25 satellites. " * 20
+    items = [(f"word {i}", context) for i in range(6)] + [("other", "Short.")]
+    # the shared context is counted once per group
+    assert pack(items, 10_000) == [list(range(7))]
+    groups = pack(items, 140)
+    assert [i for group in groups for i in group] == list(range(7))
+    assert len(groups) > 1
+
+    prompt = render_packed_note_prompt(items, "English")
+    assert prompt.count(context) == 1
+    assert 'id="n6" text="c1"' in prompt
+
+
+def test_create_notes_batch(client: TestClient):
+    response = client.post(f"/passages?url={example_url}")
+    assert response.status_code == 200
+    passage_id = response.json()["id"]
+
+    context = "Saturn has 25 satellites that measure at least 6 miles in diameter."
+    items = [
+        {
+            "selected_text": text,
+            "context": context,
+            "paragraph_index": 1,
+            "start_index": context.index(text),
+            "end_index": context.index(text) + len(text),
+        }
+        for text in ("satellites", "diameter", "satellites")
+    ]
+    response = client.post(
+        f"/passages/{passage_id}/notes/batch", json={"items": items}
+    )
+    assert response.status_code == 200
+    created = response.json()
+    assert [n["selected_text"] for n in created] == [i["selected_text"] for i in items]
+    assert all(n["content"] for n in created)
+    # the same selection in the same context is explained once
+    assert created[0]["content"] == created[2]["content"]
+
+    # and cached for single notes too
+    response = client.post(f"/passages/{passage_id}/notes", json=items[1])
+    assert response.status_code == 200
+    assert response.json()["content"] == created[1]["content"]
+
+    client.delete(f"/passages/{passage_id}")
+
+    response = client.post(
+        f"/passages/{passage_id}/notes/batch", json={"items": items}
+    )
+    assert response.status_code == 404
+
+
+def test_packed_notes_malformed(monkeypatch):
+    async def create(messages, response_format=None, **kwargs):
+        # the packed answer is cut short, single notes are answered fine
+        content = '{"n0": "cut' if response_format else "an explanation"
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    fake_client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+    )
+    monkeypatch.setattr(notes, "openai_client", fake_client)
+    context = f"Context {uuid.uuid4().hex}."
+    items = [("Context", context), ("other", context)]
+    assert asyncio.run(notes.explain_packed(items, "English")) == [None, None]
+    explanations = asyncio.run(notes.explain_many(items, "English"))
+    assert explanations == ["an explanation", "an explanation"]
+
+
+def test_packed_notes_request_failed(monkeypatch):
+    async def create(messages, response_format=None, **kwargs):
+        if response_format:
+            request = httpx.Request("POST", "https://llm.test/chat/completions")
+            raise openai.APITimeoutError(request=request)
+        message = SimpleNamespace(content="an explanation")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    fake_client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+    )
+    monkeypatch.setattr(notes, "openai_client", fake_client)
+    context = f"Context {uuid.uuid4().hex}."
+    items = [("Context", context), ("other", context)]
+    assert asyncio.run(notes.explain_packed(items, "English")) == [None, None]
+    explanations = asyncio.run(notes.explain_many(items, "English"))
+    assert explanations == ["an explanation", "an explanation"]
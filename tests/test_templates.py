@@ -1,5 +1,6 @@
 from fastapi.testclient import TestClient
 
+from lingominer.api.templates.plan import _plans
 from lingominer.models.template import TemplateLang
 
 
@@ -227,3 +228,141 @@ def test_generation_validation(client: TestClient):
         f"/templates/{template['id']}/generations", json=invalid_generation_data
     )
     assert response.status_code == 422  # Validation error
+
+
+def test_delete_template_with_generations(client: TestClient):
+    response = client.post(
+        "/templates", json={"name": "Deleted Template", "lang": TemplateLang.en}
+    )
+    assert response.status_code == 200
+    template = response.json()
+    response = client.post(
+        f"/templates/{template['id']}/generations",
+        json={
+            "name": "Generation 1",
+            "method": "completion",
+            "prompt": "first",
+            "inputs": [],
+        },
+    )
+    assert response.status_code == 200, response.text
+    generation_1 = response.json()
+    response = client.post(
+        f"/templates/{template['id']}/fields",
+        json={"name": "output1", "type": "text", "generation_id": generation_1["id"]},
+    )
+    assert response.status_code == 200
+    # links output1 as an input of the second generation
+    response = client.post(
+        f"/templates/{template['id']}/generations",
+        json={
+            "name": "Generation 2",
+            "method": "completion",
+            "prompt": "{{output1}}",
+            "inputs": ["output1"],
+        },
+    )
+    assert response.status_code == 200, response.text
+    generation_2 = response.json()
+
+    response = client.delete(f"/templates/{template['id']}")
+    assert response.status_code == 200
+
+    response = client.get(f"/templates/{template['id']}")
+    assert response.status_code == 404
+    response = client.get(
+        f"/templates/{template['id']}/generations/{generation_2['id']}"
+    )
+    assert response.status_code == 404
+
+
+def test_template_plan_cache(client: TestClient):
+    response = client.post(
+        "/templates", json={"name": "Plan Template", "lang": TemplateLang.en}
+    )
+    assert response.status_code == 200
+    template = response.json()
+    template_url = f"/templates/{template['id']}"
+
+    def add_generation(name: str, prompt: str, output: str):
+        response = client.post(
+            f"{template_url}/generations",
+            json={
+                "name": name,
+                "method": "completion",
+                "prompt": prompt,
+                "inputs": [],
+            },
+        )
+        assert response.status_code == 200, response.text
+        generation = response.json()
+        response = client.post(
+            f"{template_url}/fields",
+            json={
+                "name": output,
+                "type": "text",
+                "description": f"The {output}",
+                "generation_id": generation["id"],
+            },
+        )
+        assert response.status_code == 200, response.text
+        return generation, response.json()
+
+    def create_card() -> dict:
+        text = "Its atmosphere consists largely of nitrogen."
+        response = client.post(
+            "/cards",
+            json={
+                "paragraph": text,
+                "pos_start": 35,
+                "pos_end": 43,
+                "template_id": template["id"],
+            },
+        )
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    extract, word = add_generation(
+        "extract", "Extract the word marked with @@: '{{decorated_paragraph}}'", "word"
+    )
+    first = create_card()
+    assert set(first["content"]) == {"word"}
+    assert template["id"] in _plans
+
+    # a generation added to the template is used by the next card
+    add_generation("summarize", "Summarize the text: '{{paragraph}}'", "summary")
+    second = create_card()
+    assert set(second["content"]) == {"word", "summary"}
+
+    # so is an edited prompt
+    response = client.patch(
+        f"{template_url}/generations/{extract['id']}",
+        json={
+            "prompt": "Give the word marked with @@: '{{decorated_paragraph}}'",
+            "inputs": [],
+        },
+    )
+    assert response.status_code == 200
+    third = create_card()
+    assert (
+        third["content"]["word"]["source"]["fingerprint"]
+        != second["content"]["word"]["source"]["fingerprint"]
+    )
+
+    # and an edited field
+    response = client.patch(
+        f"{template_url}/fields/{word['id']}", json={"description": "the word"}
+    )
+    assert response.status_code == 200
+    fourth = create_card()
+    assert (
+        fourth["content"]["word"]["source"]["fingerprint"]
+        != third["content"]["word"]["source"]["fingerprint"]
+    )
+
+    # deleting the template drops its plan
+    for card in (first, second, third, fourth):
+        assert client.delete(f"/cards/{card['id']}").status_code == 200
+    response = client.delete(template_url)
+    assert response.status_code == 200
+    assert template["id"] not in _plans